@@ -1,3 +1,4 @@
+import asyncio
 from copy import copy
 from typing import Union
 
@@ -19,7 +20,12 @@ from app_distribution_server.errors import (
 )
 from app_distribution_server.routers import api_router, app_files_router, health_router, html_router
 from app_distribution_server.routers.api_router import download_stats_router
-from app_distribution_server import database
+from app_distribution_server import database, readiness, retention, storage, upload_jobs
+from app_distribution_server.config import (
+    DEFER_STORAGE_TASKS,
+    STORAGE_CACHE_PREWARM,
+    STORAGE_SHARDED_MIGRATION,
+)
 
 app = FastAPI(
     title=APP_TITLE,
@@ -34,15 +40,28 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 def add_head_routes(router: APIRouter) -> APIRouter:
     """
     Creates HEAD routes for all the GET routes in the given router.
-    The route is handled by the same handler.
+    The route is handled by the same handler, unless the router already
+    declares a dedicated (lighter) HEAD route for that path.
+    Each HEAD route is placed right after its GET route to keep the matching order.
     Waiting on: https://github.com/fastapi/fastapi/issues/1773
     """
+    head_route_paths = {
+        route.path
+        for route in router.routes
+        if isinstance(route, APIRoute) and "HEAD" in route.methods
+    }
+
+    routes = []
     for route in router.routes:
-        if isinstance(route, APIRoute) and "GET" in route.methods:
+        routes.append(route)
+
+        if isinstance(route, APIRoute) and "GET" in route.methods and route.path not in head_route_paths:
             new_route = copy(route)
             new_route.methods = {"HEAD"}
             new_route.include_in_schema = False
-            router.routes.append(new_route)
+            routes.append(new_route)
+
+    router.routes[:] = routes
 
     return router
 
@@ -53,6 +72,38 @@ app.include_router(add_head_routes(app_files_router.router))
 app.include_router(health_router.router)
 app.include_router(download_stats_router)
 
+# Keeps references to long running tasks so they are not garbage collected
+background_tasks: set[asyncio.Task] = set()
+
+_storage_tasks_started = False
+
+
+def start_storage_tasks():
+    """Warm-up, pre-warm and migrations, they all read the storage in the background."""
+    global _storage_tasks_started
+    if _storage_tasks_started:
+        return
+    _storage_tasks_started = True
+
+    if STORAGE_CACHE_PREWARM:
+        # Runs in the background, the cache fills up while the app already serves requests
+        asyncio.get_running_loop().run_in_executor(None, storage.prewarm_latest_builds_cache)
+
+    if STORAGE_SHARDED_MIGRATION:
+        asyncio.get_running_loop().run_in_executor(None, storage.migrate_uploads_to_sharded_layout)
+
+    background_tasks.add(asyncio.create_task(readiness.warm_up()))
+    background_tasks.add(asyncio.create_task(storage.migrate_placeholder_uploads()))
+
+
+if DEFER_STORAGE_TASKS:
+    @app.middleware("http")
+    async def start_storage_tasks_middleware(request: Request, call_next):
+        # Cold starts answer their first request without waiting on the storage
+        start_storage_tasks()
+        return await call_next(request)
+
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize database on startup."""
@@ -63,6 +114,20 @@ async def startup_event():
         print(f"Warning: Database initialization failed: {e}")
         print("App will continue but may have issues with data persistence")
 
+    if not DEFER_STORAGE_TASKS:
+        start_storage_tasks()
+
+    background_tasks.add(asyncio.create_task(retention.run_retention_scheduler()))
+    background_tasks.add(asyncio.create_task(database.run_change_listener()))
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await upload_jobs.stop_upload_workers()
+
+    for task in background_tasks:
+        task.cancel()
+
 
 @app.exception_handler(UserError)
 async def exception_handler(
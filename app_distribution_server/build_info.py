@@ -1,22 +1,36 @@
+import hashlib
 import io
-import os
 import plistlib
 import re
-import shutil
-import tempfile
 import zipfile
 from datetime import datetime, timezone
 from enum import Enum
 from io import BytesIO
 from uuid import uuid4
-from typing import Optional
+from typing import BinaryIO, Iterable, Optional
 
-from androguard.core.bytecodes.apk import APK
-from pydantic import BaseModel, field_validator
+from pydantic import BaseModel, PrivateAttr, computed_field, field_validator
 
-from app_distribution_server.errors import InvalidFileTypeError
+from app_distribution_server import icons
+from app_distribution_server.errors import InvalidApkVariantError, InvalidFileTypeError
+from app_distribution_server.lazy import lazy_import
 from app_distribution_server.logger import logger
 
+# androguard takes longer to import than the rest of the app, only APK uploads need it
+androguard_apk = lazy_import("androguard.core.bytecodes.apk")
+
+APK_METADATA_FILE_NAMES = ("AndroidManifest.xml", "resources.arsc")
+
+# ABIs of native libraries in APKs (`lib/<abi>/`), and the ABIs each one runs on, preferred first
+ANDROID_ABIS = {
+    "arm64-v8a": ["arm64-v8a", "armeabi-v7a", "armeabi"],
+    "armeabi-v7a": ["armeabi-v7a", "armeabi"],
+    "armeabi": ["armeabi"],
+    "x86_64": ["x86_64", "x86"],
+    "x86": ["x86"],
+    "riscv64": ["riscv64"],
+}
+
 
 class Platform(str, Enum):
     ios = "ios"
@@ -60,6 +74,53 @@ class LegacyAppInfo(BaseModel):
         return v
 
 
+def get_sized_picture_url(picture_url: str, size: int) -> str:
+    """Pictures uploaded from the admin pages are stored with thumbnails, external URLs are kept as is."""
+    if picture_url.startswith("/app-pictures/"):
+        return f"{picture_url}?size={size}"
+    return picture_url
+
+
+class AppRecord(BaseModel):
+    """
+    Metadata shared by every build of a bundle, edited from the admin pages.
+    It is stored once per bundle and applied to the builds when they are loaded.
+    """
+
+    bundle_id: str
+    app_title: str
+    app_description: Optional[str] = None
+    app_picture_url: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+    @field_validator("bundle_id")
+    def validate_bundle_id(cls, v):
+        return LegacyAppInfo.validate_bundle_id(v)
+
+    def get_picture_url(self, size: int) -> Optional[str]:
+        return get_sized_picture_url(self.app_picture_url, size) if self.app_picture_url else None
+
+
+class ApkVariant(BaseModel):
+    """APK of an Android upload with the native libraries of some ABIs only."""
+
+    abis: list[str]
+    file_size: int
+    sha256: str
+    version_code: Optional[int] = None
+
+    @property
+    def name(self) -> str:
+        return "_".join(self.abis)
+
+    @computed_field
+    @property
+    def file_name(self) -> str:
+        # A replaced variant gets a new URL, cached copies of the previous one are never served for it
+        return f"{self.name}-{self.sha256[:16]}.apk"
+
+
 class BuildInfo(LegacyAppInfo):
     upload_id: str
     file_size: int
@@ -67,6 +128,19 @@ class BuildInfo(LegacyAppInfo):
     platform: Platform
     version_code: Optional[int] = None  # Android
     build_number: Optional[str] = None  # iOS
+    has_icon: bool = False
+    variants: list[ApkVariant] = []  # Android, smallest first
+
+    # Icon extracted from the app file, only set between parsing and storing an upload
+    _icon_content: Optional[bytes] = PrivateAttr(default=None)
+
+    def get_picture_url(self, size: int) -> Optional[str]:
+        """Picture set on the app, or the icon extracted from this build."""
+        if self.app_picture_url:
+            return get_sized_picture_url(self.app_picture_url, size)
+        if self.has_icon:
+            return f"/get/{self.upload_id}/icon?size={size}"
+        return None
 
     @property
     def human_file_size(self) -> str:
@@ -86,11 +160,27 @@ class BuildInfo(LegacyAppInfo):
         return f"{self.file_size / one_kb**3:.2f}GB"
 
 
+def get_file_size(file: BinaryIO) -> int:
+    size = file.seek(0, io.SEEK_END)
+    file.seek(0)
+    return size
+
+
 def get_build_info_from_ipa(
     upload_id: str,
-    ipa_file: BytesIO,
+    ipa_file: BinaryIO,
 ) -> BuildInfo:
-    with zipfile.ZipFile(ipa_file, "r") as ipa:
+    """
+    `ipa_file` can be any seekable file, only the entries holding the metadata are read
+    so stored builds are parsed with ranged reads (see `remote_zip`).
+    """
+    try:
+        ipa = zipfile.ZipFile(ipa_file, "r")
+    except zipfile.BadZipFile:
+        logger.error("Could not read the IPA")
+        raise InvalidFileTypeError()
+
+    with ipa:
         for file in ipa.namelist():
             if file.endswith(".app/Info.plist"):
                 plist_file_content = ipa.read(file)
@@ -105,7 +195,13 @@ def get_build_info_from_ipa(
                     logger.error("Failed to extract plist file information")
                     raise InvalidFileTypeError()
 
-                return BuildInfo(
+                try:
+                    icon_content = icons.extract_ipa_icon(ipa, file.removesuffix("Info.plist"), info)
+                except Exception as e:
+                    logger.warning(f"Failed to extract the app icon from {upload_id!r}: {e}")
+                    icon_content = None
+
+                build_info = BuildInfo(
                     upload_id=upload_id,
                     platform=Platform.ios,
                     app_title=app_title,
@@ -113,43 +209,135 @@ def get_build_info_from_ipa(
                     bundle_version=bundle_version,
                     build_number=build_number,
                     created_at=datetime.now(timezone.utc),
-                    file_size=ipa_file.getbuffer().nbytes,
+                    file_size=get_file_size(ipa_file),
+                    has_icon=icon_content is not None,
                 )
+                build_info._icon_content = icon_content
+                return build_info
 
     logger.error("Could not find plist file in bundle")
     raise InvalidFileTypeError()
 
 
+def get_apk_metadata_zip(apk_zip: zipfile.ZipFile) -> bytes:
+    """Zip of the only entries androguard needs to read the metadata of an APK."""
+    output = BytesIO()
+    with zipfile.ZipFile(output, "w", zipfile.ZIP_STORED) as metadata_zip:
+        for file_name in APK_METADATA_FILE_NAMES:
+            try:
+                metadata_zip.writestr(file_name, apk_zip.read(file_name))
+            except KeyError:
+                continue
+    return output.getvalue()
+
+
 def get_build_info_from_apk(
     upload_id: str,
-    apk_file: BytesIO,
+    apk_file: BinaryIO,
 ) -> BuildInfo:
-    tempdir = tempfile.mkdtemp()
-    file_name = "app.apk"
-    file_path = os.path.join(tempdir, file_name)
-
+    """
+    `apk_file` can be any seekable file. androguard only gets the manifest and the
+    resources table, the icon is read from the APK afterwards.
+    """
     try:
-        with open(file_path, "wb") as f:
-            f.write(apk_file.read())
+        apk_zip = zipfile.ZipFile(apk_file, "r")
+    except zipfile.BadZipFile:
+        logger.error("Could not read the APK")
+        raise InvalidFileTypeError()
+
+    with apk_zip:
+        try:
+            apk = androguard_apk.APK(get_apk_metadata_zip(apk_zip), raw=True)
+        except zipfile.BadZipFile:
+            logger.error("Could not read the APK metadata")
+            raise InvalidFileTypeError()
 
-        apk = APK(file_path)
         app_title = apk.get_app_name()
         bundle_id = apk.get_package()
         version_code = apk.get_androidversion_code()
         version_name = apk.get_androidversion_name()
 
-        return BuildInfo(
-            upload_id=upload_id,
-            platform=Platform.android,
-            app_title=app_title,
-            bundle_id=bundle_id,
-            bundle_version=version_name,
-            version_code=version_code,
-            created_at=datetime.now(timezone.utc),
-            file_size=apk_file.getbuffer().nbytes,
+        try:
+            icon_content = icons.extract_apk_icon(apk, apk_zip)
+        except Exception as e:
+            logger.warning(f"Failed to extract the app icon from {upload_id!r}: {e}")
+            icon_content = None
+
+    build_info = BuildInfo(
+        upload_id=upload_id,
+        platform=Platform.android,
+        app_title=app_title,
+        bundle_id=bundle_id,
+        bundle_version=version_name,
+        version_code=version_code,
+        created_at=datetime.now(timezone.utc),
+        file_size=get_file_size(apk_file),
+        has_icon=icon_content is not None,
+    )
+    build_info._icon_content = icon_content
+    return build_info
+
+
+def get_apk_abis(apk_zip: zipfile.ZipFile) -> list[str]:
+    """ABIs an APK has native libraries for, empty for an APK without any."""
+    abis = {
+        file_name.split("/")[1]
+        for file_name in apk_zip.namelist()
+        if file_name.startswith("lib/") and file_name.count("/") >= 2
+    }
+    return [abi for abi in ANDROID_ABIS if abi in abis]
+
+
+def get_apk_variant(build_info: BuildInfo, apk_file: BinaryIO) -> ApkVariant:
+    """Reads an ABI-specific APK, which must be the same package and version code as the upload."""
+    try:
+        with zipfile.ZipFile(apk_file, "r") as apk_zip:
+            apk = androguard_apk.APK(get_apk_metadata_zip(apk_zip), raw=True)
+            abis = get_apk_abis(apk_zip)
+    except zipfile.BadZipFile:
+        logger.error("Could not read the APK variant")
+        raise InvalidApkVariantError()
+
+    apk_file.seek(0)
+    variant = ApkVariant(
+        abis=abis,
+        file_size=get_file_size(apk_file),
+        sha256=hashlib.file_digest(apk_file, "sha256").hexdigest(),
+        version_code=apk.get_androidversion_code(),
+    )
+    if apk.get_package() != build_info.bundle_id or variant.version_code != build_info.version_code or not abis:
+        logger.error(
+            f"APK of {apk.get_package()!r} ({variant.version_code}) for ABIs {abis} is not a variant"
+            f" of {build_info.bundle_id!r} ({build_info.version_code})"
         )
-    finally:
-        shutil.rmtree(tempdir)
+        raise InvalidApkVariantError()
+
+    return variant
+
+
+def read_apks_standalone_apks(apks_file: BinaryIO) -> list[bytes]:
+    """
+    Standalone APKs of a `bundletool build-apks` archive, one per ABI. Its config
+    splits are left out: a browser download installs a single APK.
+    """
+    try:
+        with zipfile.ZipFile(apks_file, "r") as apks_zip:
+            return [
+                apks_zip.read(file_name)
+                for file_name in apks_zip.namelist()
+                if file_name.startswith("standalones/") and file_name.endswith(".apk")
+            ]
+    except zipfile.BadZipFile:
+        raise InvalidApkVariantError()
+
+
+def select_apk_variant(variants: list[ApkVariant], device_abis: Iterable[str]) -> Optional[ApkVariant]:
+    """Smallest variant for the most preferred ABI of the device that any variant has."""
+    for abi in device_abis:
+        matching_variants = [variant for variant in variants if abi in variant.abis]
+        if matching_variants:
+            return min(matching_variants, key=lambda variant: variant.file_size)
+    return None
 
 
 def get_build_info(
@@ -0,0 +1,113 @@
+"""
+CDN offload mode: cache headers and purge hooks.
+
+With `CDN_MODE` enabled, binaries are marked immutable (an upload id never changes
+content), while pages and plists get a short TTL. Both carry surrogate keys so they
+can be purged per upload and per bundle. Purge hooks fire whenever uploads are added or
+removed and when app metadata is edited.
+"""
+import asyncio
+import inspect
+import json
+import urllib.request
+from typing import Awaitable, Callable, Union
+
+from app_distribution_server.config import (
+    CDN_IMMUTABLE_MAX_AGE,
+    CDN_MODE,
+    CDN_PAGE_MAX_AGE,
+    CDN_PURGE_WEBHOOK_URL,
+)
+from app_distribution_server.logger import logger
+
+PurgeHook = Callable[[list[str]], Union[None, Awaitable[None]]]
+
+APPS_SURROGATE_KEY = "apps"
+
+_purge_hooks: list[PurgeHook] = []
+
+
+def get_bundle_surrogate_key(bundle_id: str) -> str:
+    return f"bundle-{bundle_id}"
+
+
+def get_upload_surrogate_key(upload_id: str) -> str:
+    return f"upload-{upload_id}"
+
+
+def surrogate_key_headers(*surrogate_keys: str) -> dict[str, str]:
+    return {
+        # Fastly style and Cloudflare style tags
+        "Surrogate-Key": " ".join(surrogate_keys),
+        "Cache-Tag": ",".join(surrogate_keys),
+    }
+
+
+def immutable_cache_headers(*surrogate_keys: str) -> dict[str, str]:
+    if not CDN_MODE:
+        return {}
+
+    return {
+        "Cache-Control": f"public, max-age={CDN_IMMUTABLE_MAX_AGE}, immutable",
+        # Purged when the upload is deleted, they would be served for a year otherwise
+        **surrogate_key_headers(*surrogate_keys),
+    }
+
+
+def page_cache_headers(*surrogate_keys: str) -> dict[str, str]:
+    if not CDN_MODE:
+        return {}
+
+    return {
+        "Cache-Control": f"public, max-age={CDN_PAGE_MAX_AGE}",
+        **surrogate_key_headers(*surrogate_keys),
+        # Pages are rendered in the language picked from these
+        "Vary": "Cookie, Accept-Language",
+    }
+
+
+def no_store_headers() -> dict[str, str]:
+    if not CDN_MODE:
+        return {}
+
+    return {"Cache-Control": "no-store"}
+
+
+def register_purge_hook(hook: PurgeHook):
+    """Registers a callable (sync or async) receiving the surrogate keys to purge."""
+    _purge_hooks.append(hook)
+
+
+async def purge(*surrogate_keys: str):
+    if not CDN_MODE or not _purge_hooks:
+        return
+
+    keys = list(dict.fromkeys(surrogate_keys))
+    logger.info(f"Purging CDN surrogate keys {keys!r}")
+
+    for hook in _purge_hooks:
+        try:
+            result = hook(keys)
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            logger.warning(f"CDN purge hook {hook!r} failed: {e}")
+
+
+def _post_purge_webhook(surrogate_keys: list[str]):
+    request = urllib.request.Request(
+        CDN_PURGE_WEBHOOK_URL,
+        data=json.dumps({"surrogate_keys": surrogate_keys}).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    with urllib.request.urlopen(request, timeout=10):
+        pass
+
+
+async def webhook_purge_hook(surrogate_keys: list[str]):
+    await asyncio.to_thread(_post_purge_webhook, surrogate_keys)
+
+
+if CDN_PURGE_WEBHOOK_URL:
+    register_purge_hook(webhook_purge_hook)
@@ -0,0 +1,155 @@
+"""
+Cross-process cache invalidation over PostgreSQL LISTEN/NOTIFY.
+
+Database writes publish a change event (kind + key) on a NOTIFY channel. Every
+process keeps a listener connection and drops only the affected cache entries.
+Caches are bypassed while the listener is disconnected and fully flushed when it
+reconnects, since events may have been missed in between.
+"""
+import asyncio
+import copy
+import json
+import os
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+from app_distribution_server.logger import logger
+
+CHANNEL = "appsyra_changes"
+LIST_KEY = "*"
+
+DATABASE_CACHE_TTL_SECONDS = float(os.getenv("DATABASE_CACHE_TTL_SECONDS", "300"))
+DATABASE_LISTENER_KEEPALIVE_SECONDS = float(os.getenv("DATABASE_LISTENER_KEEPALIVE_SECONDS", "30"))
+
+_is_listening = False
+
+
+class InvalidationCache:
+    """
+    In-process cache of database reads, invalidated by change events.
+    Values are copied on the way in and out so callers can mutate them freely.
+    `LIST_KEY` holds listings, it is dropped together with any single key.
+    Loads take the `generation` before reading, their value is not cached when an
+    invalidation happened meanwhile since it may be the value that was replaced.
+    """
+
+    _missing = object()
+
+    def __init__(self, ttl_seconds: float = DATABASE_CACHE_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._entries: dict[str, tuple[float, Any]] = {}
+        self._generation = 0
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, key: str) -> Any:
+        if not _is_listening:
+            return self._missing
+
+        entry = self._entries.get(key)
+        if entry is None:
+            return self._missing
+
+        stored_at, value = entry
+        if time.monotonic() - stored_at > self.ttl_seconds:
+            self._entries.pop(key, None)
+            return self._missing
+
+        return copy.deepcopy(value)
+
+    def is_miss(self, value: Any) -> bool:
+        return value is self._missing
+
+    def set(self, key: str, value: Any, generation: int):
+        if _is_listening and generation == self._generation:
+            self._entries[key] = (time.monotonic(), copy.deepcopy(value))
+
+    def invalidate(self, key: Optional[str] = None):
+        self._generation += 1
+        if key is None:
+            self._entries.clear()
+            return
+
+        self._entries.pop(key, None)
+        self._entries.pop(LIST_KEY, None)
+
+
+caches: dict[str, InvalidationCache] = {
+    "app_records": InvalidationCache(),
+    "apps": InvalidationCache(),
+    "settings": InvalidationCache(),
+    "users": InvalidationCache(),
+}
+
+
+def handle_change(kind: str, key: Optional[str] = None):
+    cache = caches.get(kind)
+    if cache is not None:
+        cache.invalidate(key)
+
+
+def flush_all_caches():
+    for cache in caches.values():
+        cache.invalidate()
+
+
+async def publish_change(connection, kind: str, key: Optional[str] = None):
+    """Invalidates locally right away, then notifies the other processes."""
+    handle_change(kind, key)
+
+    try:
+        await connection.execute(
+            "SELECT pg_notify($1, $2)",
+            CHANNEL,
+            json.dumps({"kind": kind, "key": key}),
+        )
+    except Exception as e:
+        logger.warning(f"Failed to publish {kind!r} change notification: {e}")
+
+
+def _on_notification(connection, pid, channel, payload):
+    try:
+        event = json.loads(payload)
+        handle_change(event["kind"], event.get("key"))
+    except (ValueError, KeyError) as e:
+        logger.warning(f"Ignoring malformed change notification {payload!r}: {e}")
+        flush_all_caches()
+
+
+async def run_change_listener(connect: Callable[[], Awaitable[Any]]):
+    """Keeps a LISTEN connection open for the lifetime of the process."""
+    global _is_listening
+
+    retry_delay = 1.0
+    while True:
+        connection = None
+        try:
+            connection = await connect()
+            await connection.add_listener(CHANNEL, _on_notification)
+
+            # Events published while disconnected are lost
+            flush_all_caches()
+            _is_listening = True
+            retry_delay = 1.0
+            logger.info(f"Listening for database change notifications on {CHANNEL!r}")
+
+            while not connection.is_closed():
+                await asyncio.sleep(DATABASE_LISTENER_KEEPALIVE_SECONDS)
+                await connection.execute("SELECT 1")
+
+        except asyncio.CancelledError:
+            raise
+
+        except Exception as e:
+            logger.warning(f"Database change listener disconnected: {e}")
+
+        finally:
+            _is_listening = False
+            flush_all_caches()
+            if connection is not None and not connection.is_closed():
+                await connection.close()
+
+        await asyncio.sleep(retry_delay)
+        retry_delay = min(retry_delay * 2, 60)
@@ -15,6 +15,20 @@ AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
 AWS_ENDPOINT_URL = os.getenv("AWS_ENDPOINT_URL")
 AWS_DEFAULT_REGION = os.getenv("AWS_DEFAULT_REGION", "auto")
 
+# Tiered storage: keep a bounded local disk copy of files read from a remote STORAGE_URL
+# Enabled by setting STORAGE_CACHE_DIRECTORY (e.g. "./storage-cache")
+STORAGE_CACHE_DIRECTORY = os.getenv("STORAGE_CACHE_DIRECTORY") or None
+STORAGE_CACHE_MAX_BYTES = int(os.getenv("STORAGE_CACHE_MAX_BYTES", str(2 * 1024**3)))
+STORAGE_CACHE_METADATA_TTL_SECONDS = float(os.getenv("STORAGE_CACHE_METADATA_TTL_SECONDS", "30"))
+STORAGE_CACHE_PREWARM = os.getenv("STORAGE_CACHE_PREWARM", "true").lower() in ["1", "true", "yes"]
+
+# Layout of new uploads: "sharded" (`ab/cd/<upload_id>/`) or "flat" (`<upload_id>/` at the root)
+STORAGE_LAYOUT = os.getenv("STORAGE_LAYOUT", "sharded")
+# Move existing flat layout uploads into the sharded layout in the background on startup
+STORAGE_SHARDED_MIGRATION = os.getenv("STORAGE_SHARDED_MIGRATION", "false").lower() in ["1", "true", "yes"]
+# Start the storage warm-up, pre-warm and migrations on the first request instead of on startup
+DEFER_STORAGE_TASKS = os.getenv("DEFER_STORAGE_TASKS", "false").lower() in ["1", "true", "yes"]
+
 # Database URL (provided by Render automatically)
 DATABASE_URL = os.getenv("DATABASE_URL")
 
@@ -40,6 +54,65 @@ LOGO_URL: Optional[str] = None if _raw_logo_url.lower() in ["", "0", "false"] el
 
 COMPANY_NAME = "Appsyra"
 
+# CDN offload mode: immutable caching of binaries/QR codes, short TTLs and surrogate keys on pages.
+# Downloads served by the CDN are counted through the download beacon or edge log ingestion.
+CDN_MODE = os.getenv("CDN_MODE", "false").lower() in ["1", "true", "yes"]
+CDN_IMMUTABLE_MAX_AGE = int(os.getenv("CDN_IMMUTABLE_MAX_AGE", str(365 * 24 * 60 * 60)))
+CDN_PAGE_MAX_AGE = int(os.getenv("CDN_PAGE_MAX_AGE", "60"))
+# Receives a POST with {"surrogate_keys": [...]} whenever cached content must be purged
+CDN_PURGE_WEBHOOK_URL = os.getenv("CDN_PURGE_WEBHOOK_URL") or None
+
+# Background upload processing (opt-in per request with `POST /api/upload?async=true`)
+UPLOAD_JOBS_CONCURRENCY = int(os.getenv("UPLOAD_JOBS_CONCURRENCY", "2"))
+UPLOAD_JOBS_SPOOL_DIRECTORY = os.getenv("UPLOAD_JOBS_SPOOL_DIRECTORY") or None
+UPLOAD_JOBS_RETENTION_SECONDS = int(os.getenv("UPLOAD_JOBS_RETENTION_SECONDS", "3600"))
+
+# Maximum number of builds parsed and stored at the same time by `POST /api/upload/batch`
+UPLOAD_BATCH_CONCURRENCY = int(os.getenv("UPLOAD_BATCH_CONCURRENCY", "4"))
+
+# App icons extracted from uploaded builds, resized into these sizes (pixels) by a worker pool
+ICON_SIZES = sorted({int(size) for size in os.getenv("ICON_SIZES", "64,128,256").split(",") if size.strip()})
+ICON_WORKERS = int(os.getenv("ICON_WORKERS", "2"))
+
+# Android uploads get binary deltas against this many previous builds of the bundle (0 disables them),
+# built by a worker pool and only kept when smaller than DELTA_MAX_RATIO of the full APK
+DELTA_BASE_BUILDS = int(os.getenv("DELTA_BASE_BUILDS", "1"))
+DELTA_WORKERS = int(os.getenv("DELTA_WORKERS", "1"))
+DELTA_MAX_RATIO = float(os.getenv("DELTA_MAX_RATIO", "0.8"))
+
+# Upload existence and platform lookups are cached per process, including ids known not to exist
+UPLOAD_LOOKUP_CACHE_TTL_SECONDS = float(os.getenv("UPLOAD_LOOKUP_CACHE_TTL_SECONDS", "60"))
+UPLOAD_LOOKUP_NEGATIVE_TTL_SECONDS = float(os.getenv("UPLOAD_LOOKUP_NEGATIVE_TTL_SECONDS", "30"))
+UPLOAD_LOOKUP_CACHE_SIZE = int(os.getenv("UPLOAD_LOOKUP_CACHE_SIZE", "10000"))
+# App records read from storage (deployments without a database) are reused per process, missing ones too
+APP_RECORD_CACHE_TTL_SECONDS = float(os.getenv("APP_RECORD_CACHE_TTL_SECONDS", "30"))
+
+# Install artifacts (plists, QR codes) kept in memory per process
+INSTALL_ARTIFACTS_CACHE_SIZE = int(os.getenv("INSTALL_ARTIFACTS_CACHE_SIZE", "1024"))
+
+# /readyz runs its dependency checks at most once per interval, each within the timeout
+READINESS_CHECK_INTERVAL_SECONDS = float(os.getenv("READINESS_CHECK_INTERVAL_SECONDS", "5"))
+READINESS_CHECK_TIMEOUT_SECONDS = float(os.getenv("READINESS_CHECK_TIMEOUT_SECONDS", "2"))
+
+# Metadata of stored builds is read with ranged requests of this many bytes instead of full downloads
+REMOTE_ZIP_BLOCK_SIZE = int(os.getenv("REMOTE_ZIP_BLOCK_SIZE", str(64 * 1024)))
+
+ADMIN_DASHBOARD_CACHE_TTL_SECONDS = float(os.getenv("ADMIN_DASHBOARD_CACHE_TTL_SECONDS", "5"))
+
+# Live events streamed to the admin dashboard
+EVENTS_CLIENT_BUFFER_SIZE = int(os.getenv("EVENTS_CLIENT_BUFFER_SIZE", "100"))
+EVENTS_KEEPALIVE_SECONDS = float(os.getenv("EVENTS_KEEPALIVE_SECONDS", "15"))
+
+# Retention policies, a build is kept if any policy keeps it (unset policies keep nothing).
+# Pinned builds and the latest build of each bundle are never deleted.
+RETENTION_KEEP_LAST_BUILDS = int(os.getenv("RETENTION_KEEP_LAST_BUILDS", "0")) or None
+RETENTION_KEEP_DAYS = int(os.getenv("RETENTION_KEEP_DAYS", "0")) or None
+RETENTION_INTERVAL_SECONDS = int(os.getenv("RETENTION_INTERVAL_SECONDS", "0"))
+RETENTION_DRY_RUN = os.getenv("RETENTION_DRY_RUN", "false").lower() in ["1", "true", "yes"]
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "20"))
+RETENTION_BATCH_PAUSE_SECONDS = float(os.getenv("RETENTION_BATCH_PAUSE_SECONDS", "5"))
+RETENTION_DELETE_INTERVAL_SECONDS = float(os.getenv("RETENTION_DELETE_INTERVAL_SECONDS", "0.2"))
+
 
 def get_absolute_url(path: str) -> str:
     if not path.startswith("/"):
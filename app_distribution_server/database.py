@@ -1,21 +1,285 @@
 """
 Database layer using PostgreSQL for persistent storage.
 """
+import asyncio
 import os
 import json
-import asyncpg
+import time
+from datetime import datetime, timezone
 from typing import List, Dict, Any, Optional
 
+from app_distribution_server import change_notifications
+from app_distribution_server.change_notifications import LIST_KEY, caches, publish_change
+from app_distribution_server.lazy import lazy_import
+from app_distribution_server.logger import logger
+
+# Only imported when PostgreSQL is used
+asyncpg = lazy_import("asyncpg")
+
 DATABASE_URL = os.getenv("DATABASE_URL")
+DATABASE_CONNECT_TIMEOUT = float(os.getenv("DATABASE_CONNECT_TIMEOUT", "5"))
+DATABASE_CIRCUIT_BREAKER_THRESHOLD = int(os.getenv("DATABASE_CIRCUIT_BREAKER_THRESHOLD", "3"))
+DATABASE_CIRCUIT_BREAKER_PROBE_INTERVAL = float(os.getenv("DATABASE_CIRCUIT_BREAKER_PROBE_INTERVAL", "10"))
+
+
+class DatabaseUnavailableError(Exception):
+    """Raised without trying to connect while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Stops connection attempts after consecutive failures so callers fall back
+    to the filesystem right away instead of waiting for a connect timeout.
+    While open, a background probe reconnects periodically and closes it on success.
+    """
+
+    def __init__(self, failure_threshold: int, probe_interval: float):
+        self.failure_threshold = failure_threshold
+        self.probe_interval = probe_interval
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self._probe_task: Optional[asyncio.Task] = None
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    @property
+    def state(self) -> str:
+        return "open" if self.is_open else "closed"
+
+    def record_success(self):
+        if self.is_open:
+            logger.info("Database is reachable again, closing the circuit breaker")
+
+        self.consecutive_failures = 0
+        self.opened_at = None
+
+    def record_failure(self, error: Exception):
+        self.consecutive_failures += 1
+        self.last_error = f"{type(error).__name__}: {error}"
+
+        if self.is_open or self.consecutive_failures < self.failure_threshold:
+            return
+
+        logger.warning(
+            f"Database unreachable after {self.consecutive_failures} attempts, opening the"
+            f" circuit breaker ({self.last_error})"
+        )
+        self.opened_at = time.time()
+
+        if self._probe_task is None or self._probe_task.done():
+            self._probe_task = asyncio.create_task(self._probe())
+
+    async def _probe(self):
+        while self.is_open:
+            await asyncio.sleep(self.probe_interval)
+            try:
+                conn = await asyncpg.connect(DATABASE_URL, timeout=DATABASE_CONNECT_TIMEOUT)
+                await conn.close()
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                logger.debug(f"Database recovery probe failed: {self.last_error}")
+                continue
+
+            self.record_success()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "configured": bool(DATABASE_URL),
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "open_for_seconds": round(time.time() - self.opened_at, 1) if self.is_open else None,
+            "last_error": self.last_error,
+        }
+
+
+circuit_breaker = CircuitBreaker(
+    failure_threshold=DATABASE_CIRCUIT_BREAKER_THRESHOLD,
+    probe_interval=DATABASE_CIRCUIT_BREAKER_PROBE_INTERVAL,
+)
+
 
 async def get_db_connection():
     """Get database connection."""
     if not DATABASE_URL:
         raise ValueError("DATABASE_URL environment variable not set")
-    return await asyncpg.connect(DATABASE_URL)
+
+    if circuit_breaker.is_open:
+        raise DatabaseUnavailableError("Database circuit breaker is open")
+
+    try:
+        conn = await asyncpg.connect(DATABASE_URL, timeout=DATABASE_CONNECT_TIMEOUT)
+    except Exception as e:
+        circuit_breaker.record_failure(e)
+        raise
+
+    circuit_breaker.record_success()
+    return conn
+
+# Ordered schema changes, each applied once in its own transaction. Never edit a
+# released migration, append a new one instead. The first ones are idempotent so
+# databases created before versioning are adopted without errors.
+MIGRATIONS = [
+    (1, "Initial tables", [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            id SERIAL PRIMARY KEY,
+            username VARCHAR(50) UNIQUE NOT NULL,
+            password VARCHAR(255) NOT NULL,
+            role VARCHAR(20) NOT NULL,
+            created_at TIMESTAMP DEFAULT NOW()
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS reviews (
+            id SERIAL PRIMARY KEY,
+            app_name VARCHAR(255),
+            reviewer_name VARCHAR(255),
+            rating INTEGER,
+            comment TEXT,
+            created_at TIMESTAMP DEFAULT NOW()
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS apps (
+            id SERIAL PRIMARY KEY,
+            upload_id VARCHAR(255) UNIQUE NOT NULL,
+            app_title VARCHAR(255),
+            bundle_id VARCHAR(255),
+            bundle_version VARCHAR(255),
+            version_code INTEGER,
+            build_number VARCHAR(255),
+            platform VARCHAR(20),
+            file_size BIGINT,
+            file_url VARCHAR(500),
+            created_at TIMESTAMP DEFAULT NOW()
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS settings (
+            key VARCHAR(255) PRIMARY KEY,
+            value JSONB,
+            updated_at TIMESTAMP DEFAULT NOW()
+        )
+        ''',
+        # Default owner user, only when no users exist
+        '''
+        INSERT INTO users (username, password, role)
+        SELECT 'owner', 'owner123', 'owner' WHERE NOT EXISTS (SELECT 1 FROM users)
+        ''',
+    ]),
+    (2, "Reviews keyed by bundle and user", [
+        # app_name/reviewer_name are kept for older rows
+        '''
+        ALTER TABLE reviews
+            ADD COLUMN IF NOT EXISTS bundle_id VARCHAR(255),
+            ADD COLUMN IF NOT EXISTS upload_id VARCHAR(255),
+            ADD COLUMN IF NOT EXISTS username VARCHAR(50),
+            ADD COLUMN IF NOT EXISTS reply TEXT,
+            ADD COLUMN IF NOT EXISTS reply_at TIMESTAMP
+        ''',
+        '''
+        UPDATE reviews r SET bundle_id = r.app_name, username = r.reviewer_name
+        WHERE r.bundle_id IS NULL AND r.id = (
+            SELECT MAX(d.id) FROM reviews d
+            WHERE d.app_name = r.app_name AND d.reviewer_name = r.reviewer_name
+        )
+        ''',
+        "CREATE UNIQUE INDEX IF NOT EXISTS reviews_bundle_id_username_idx ON reviews (bundle_id, username)",
+        "CREATE INDEX IF NOT EXISTS reviews_bundle_id_created_at_idx ON reviews (bundle_id, created_at DESC, id DESC)",
+        '''
+        CREATE INDEX IF NOT EXISTS reviews_bundle_id_upload_id_created_at_idx
+            ON reviews (bundle_id, upload_id, created_at DESC, id DESC)
+        ''',
+        "CREATE INDEX IF NOT EXISTS reviews_created_at_idx ON reviews (created_at DESC, id DESC)",
+        # Review count and rating sum per bundle, updated together with each review
+        '''
+        CREATE TABLE IF NOT EXISTS review_summaries (
+            bundle_id VARCHAR(255) PRIMARY KEY,
+            reviews_count INTEGER NOT NULL DEFAULT 0,
+            rating_sum BIGINT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT NOW()
+        )
+        ''',
+        '''
+        INSERT INTO review_summaries (bundle_id, reviews_count, rating_sum)
+        SELECT bundle_id, COUNT(*), COALESCE(SUM(rating), 0)
+        FROM reviews WHERE bundle_id IS NOT NULL GROUP BY bundle_id
+        ON CONFLICT (bundle_id) DO NOTHING
+        ''',
+    ]),
+    (3, "App records", [
+        # Metadata shared by all builds of a bundle
+        '''
+        CREATE TABLE IF NOT EXISTS app_records (
+            bundle_id VARCHAR(255) PRIMARY KEY,
+            app_title VARCHAR(255) NOT NULL,
+            app_description TEXT,
+            app_picture_url VARCHAR(500),
+            created_at TIMESTAMP DEFAULT NOW(),
+            updated_at TIMESTAMP DEFAULT NOW()
+        )
+        ''',
+    ]),
+    (4, "App icons", [
+        "ALTER TABLE apps ADD COLUMN IF NOT EXISTS has_icon BOOLEAN NOT NULL DEFAULT FALSE",
+    ]),
+    (5, "App listing indexes", [
+        "CREATE INDEX IF NOT EXISTS apps_bundle_id_created_at_idx ON apps (bundle_id, created_at DESC)",
+        "CREATE INDEX IF NOT EXISTS apps_created_at_idx ON apps (created_at DESC)",
+    ]),
+    (6, "APK variants", [
+        # JSON list of `build_info.ApkVariant`
+        "ALTER TABLE apps ADD COLUMN IF NOT EXISTS variants TEXT",
+    ]),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+# Held while migrating, so processes booting together apply each migration once
+SCHEMA_MIGRATIONS_LOCK_ID = 7_203_114_001
+
+
+async def get_schema_version(conn) -> int:
+    try:
+        return await conn.fetchval("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+    except asyncpg.UndefinedTableError:
+        return 0
+
+
+async def migrate_database(conn):
+    """Applies the pending migrations under an advisory lock."""
+    await conn.execute("SELECT pg_advisory_lock($1)", SCHEMA_MIGRATIONS_LOCK_ID)
+    try:
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                description VARCHAR(255) NOT NULL,
+                applied_at TIMESTAMP DEFAULT NOW()
+            )
+        ''')
+
+        # Another process may have migrated while this one waited for the lock
+        schema_version = await get_schema_version(conn)
+        for version, description, statements in MIGRATIONS:
+            if version <= schema_version:
+                continue
+
+            logger.info(f"Applying database migration {version}: {description}")
+            async with conn.transaction():
+                for statement in statements:
+                    await conn.execute(statement)
+                await conn.execute(
+                    "INSERT INTO schema_migrations (version, description) VALUES ($1, $2)",
+                    version, description,
+                )
+    finally:
+        await conn.execute("SELECT pg_advisory_unlock($1)", SCHEMA_MIGRATIONS_LOCK_ID)
+
 
 async def init_database():
-    """Initialize database tables."""
+    """Initialize database tables, a single query when the schema is up to date."""
     try:
         conn = await get_db_connection()
     except ValueError as e:
@@ -24,77 +288,31 @@ async def init_database():
         return
     
     try:
-        # Create users table
-        await conn.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id SERIAL PRIMARY KEY,
-                username VARCHAR(50) UNIQUE NOT NULL,
-                password VARCHAR(255) NOT NULL,
-                role VARCHAR(20) NOT NULL,
-                created_at TIMESTAMP DEFAULT NOW()
-            )
-        ''')
-        
-        # Create reviews table
-        await conn.execute('''
-            CREATE TABLE IF NOT EXISTS reviews (
-                id SERIAL PRIMARY KEY,
-                app_name VARCHAR(255),
-                reviewer_name VARCHAR(255),
-                rating INTEGER,
-                comment TEXT,
-                created_at TIMESTAMP DEFAULT NOW()
-            )
-        ''')
-        
-        # Create apps table for app metadata
-        await conn.execute('''
-            CREATE TABLE IF NOT EXISTS apps (
-                id SERIAL PRIMARY KEY,
-                upload_id VARCHAR(255) UNIQUE NOT NULL,
-                app_title VARCHAR(255),
-                bundle_id VARCHAR(255),
-                bundle_version VARCHAR(255),
-                version_code INTEGER,
-                build_number VARCHAR(255),
-                platform VARCHAR(20),
-                file_size BIGINT,
-                file_url VARCHAR(500),
-                created_at TIMESTAMP DEFAULT NOW()
-            )
-        ''')
-        
-        # Create settings table
-        await conn.execute('''
-            CREATE TABLE IF NOT EXISTS settings (
-                key VARCHAR(255) PRIMARY KEY,
-                value JSONB,
-                updated_at TIMESTAMP DEFAULT NOW()
-            )
-        ''')
-        
-        # Create default owner user if no users exist
-        user_count = await conn.fetchval("SELECT COUNT(*) FROM users")
-        if user_count == 0:
-            await conn.execute(
-                "INSERT INTO users (username, password, role) VALUES ($1, $2, $3)",
-                "owner", "owner123", "owner"
-            )
-            
+        if await get_schema_version(conn) >= SCHEMA_VERSION:
+            return
+
+        await migrate_database(conn)
     finally:
         await conn.close()
 
 async def get_users() -> List[Dict[str, Any]]:
     """Get all users from database."""
+    users = caches["users"].get(LIST_KEY)
+    if not caches["users"].is_miss(users):
+        return users
+
+    generation = caches["users"].generation
     try:
         conn = await get_db_connection()
     except ValueError:
         # Database not available, return default user
         return [{"username": "owner", "password": "owner123", "role": "owner"}]
-    
+
     try:
         rows = await conn.fetch("SELECT username, password, role FROM users")
-        return [{"username": row["username"], "password": row["password"], "role": row["role"]} for row in rows]
+        users = [{"username": row["username"], "password": row["password"], "role": row["role"]} for row in rows]
+        caches["users"].set(LIST_KEY, users, generation)
+        return users
     finally:
         await conn.close()
 
@@ -106,6 +324,7 @@ async def save_user(username: str, password: str, role: str) -> bool:
             "INSERT INTO users (username, password, role) VALUES ($1, $2, $3)",
             username, password, role
         )
+        await publish_change(conn, "users", username)
         return True
     except asyncpg.UniqueViolationError:
         return False
@@ -117,10 +336,28 @@ async def delete_user(username: str) -> bool:
     conn = await get_db_connection()
     try:
         result = await conn.execute("DELETE FROM users WHERE username = $1", username)
+        await publish_change(conn, "users", username)
         return result.replace("DELETE ", "").strip() != "0"
     finally:
         await conn.close()
 
+REVIEW_COLUMNS = "id, bundle_id, upload_id, username, rating, comment, reply, reply_at, created_at"
+
+
+def _review_row_to_dict(row) -> Dict[str, Any]:
+    return {
+        "id": row["id"],
+        "bundle_id": row["bundle_id"],
+        "upload_id": row["upload_id"],
+        "username": row["username"],
+        "rating": row["rating"] or 0,
+        "comment": row["comment"],
+        "timestamp": int(row["created_at"].timestamp()),
+        "reply": row["reply"],
+        "reply_timestamp": int(row["reply_at"].timestamp()) if row["reply_at"] else None,
+        "created_at": row["created_at"],
+    }
+
 async def get_reviews() -> List[Dict[str, Any]]:
     """Get all reviews from database."""
     try:
@@ -128,46 +365,162 @@ async def get_reviews() -> List[Dict[str, Any]]:
     except ValueError:
         # Database not available, return empty list
         return []
-    
+
+    try:
+        rows = await conn.fetch(
+            f"SELECT {REVIEW_COLUMNS} FROM reviews WHERE bundle_id IS NOT NULL ORDER BY created_at DESC, id DESC"
+        )
+        return [_review_row_to_dict(row) for row in rows]
+    finally:
+        await conn.close()
+
+async def list_recent_reviews(limit: int = 20) -> List[Dict[str, Any]]:
+    """Get the most recent reviews across all bundles."""
+    try:
+        conn = await get_db_connection()
+    except ValueError:
+        return []
+
+    try:
+        rows = await conn.fetch(
+            f"SELECT {REVIEW_COLUMNS} FROM reviews WHERE bundle_id IS NOT NULL"
+            " ORDER BY created_at DESC, id DESC LIMIT $1",
+            limit
+        )
+        return [_review_row_to_dict(row) for row in rows]
+    finally:
+        await conn.close()
+
+async def list_reviews(bundle_id: str, upload_id: Optional[str] = None, limit: int = 20,
+                       before: Optional[tuple[datetime, int]] = None) -> List[Dict[str, Any]]:
+    """Get a page of reviews of a bundle, newest first. `before` is the (created_at, id) of the last review of the previous page."""
+    try:
+        conn = await get_db_connection()
+    except ValueError:
+        return []
+
+    conditions = ["bundle_id = $1"]
+    arguments: List[Any] = [bundle_id]
+    if upload_id is not None:
+        arguments.append(upload_id)
+        conditions.append(f"upload_id = ${len(arguments)}")
+    if before is not None:
+        arguments.extend(before)
+        conditions.append(f"(created_at, id) < (${len(arguments) - 1}::timestamp, ${len(arguments)}::integer)")
+    arguments.append(limit)
+
     try:
         rows = await conn.fetch(
-            "SELECT app_name, reviewer_name, rating, comment, created_at FROM reviews ORDER BY created_at DESC"
+            f"SELECT {REVIEW_COLUMNS} FROM reviews WHERE {' AND '.join(conditions)}"
+            f" ORDER BY created_at DESC, id DESC LIMIT ${len(arguments)}",
+            *arguments,
+        )
+        return [_review_row_to_dict(row) for row in rows]
+    finally:
+        await conn.close()
+
+async def get_user_review(bundle_id: str, username: str) -> Optional[Dict[str, Any]]:
+    """Get the review of a user for a bundle."""
+    try:
+        conn = await get_db_connection()
+    except ValueError:
+        return None
+
+    try:
+        row = await conn.fetchrow(
+            f"SELECT {REVIEW_COLUMNS} FROM reviews WHERE bundle_id = $1 AND username = $2",
+            bundle_id, username
         )
-        return [
-            {
-                "app_name": row["app_name"],
-                "reviewer_name": row["reviewer_name"], 
-                "rating": row["rating"],
-                "comment": row["comment"],
-                "created_at": row["created_at"].isoformat()
-            } 
-            for row in rows
-        ]
+        return _review_row_to_dict(row) if row else None
+    finally:
+        await conn.close()
+
+async def get_review_summary(bundle_id: str) -> Dict[str, Any]:
+    """Get the review count and average rating of a bundle."""
+    try:
+        conn = await get_db_connection()
+    except ValueError:
+        return {"reviews_count": 0, "avg_rating": 0}
+
+    try:
+        row = await conn.fetchrow(
+            "SELECT reviews_count, rating_sum FROM review_summaries WHERE bundle_id = $1", bundle_id
+        )
+        if not row or not row["reviews_count"]:
+            return {"reviews_count": 0, "avg_rating": 0}
+        return {
+            "reviews_count": row["reviews_count"],
+            "avg_rating": round(row["rating_sum"] / row["reviews_count"], 1),
+        }
+    finally:
+        await conn.close()
+
+# First key of the per bundle advisory locks taken by review writes
+REVIEWS_LOCK_CLASS_ID = 72_031_140
+
+async def upsert_review(bundle_id: str, username: str, rating: int, comment: str,
+                        upload_id: Optional[str] = None) -> None:
+    """Add or replace the review of a user for a bundle, updating the bundle summary."""
+    conn = await get_db_connection()
+    try:
+        async with conn.transaction():
+            # FOR UPDATE locks nothing before the first review exists, concurrent first
+            # reviews would both count as new ones in the summary
+            await conn.execute("SELECT pg_advisory_xact_lock($1, hashtext($2))", REVIEWS_LOCK_CLASS_ID, bundle_id)
+            previous = await conn.fetchrow(
+                "SELECT rating FROM reviews WHERE bundle_id = $1 AND username = $2",
+                bundle_id, username
+            )
+            # A new review replaces the previous one, including the reply to it
+            await conn.execute("""
+                INSERT INTO reviews (bundle_id, username, upload_id, rating, comment, app_name, reviewer_name)
+                VALUES ($1, $2, $3, $4, $5, $1, $2)
+                ON CONFLICT (bundle_id, username) DO UPDATE SET
+                    upload_id = EXCLUDED.upload_id,
+                    rating = EXCLUDED.rating,
+                    comment = EXCLUDED.comment,
+                    reply = NULL,
+                    reply_at = NULL,
+                    created_at = NOW()
+            """, bundle_id, username, upload_id, rating, comment)
+            await conn.execute("""
+                INSERT INTO review_summaries (bundle_id, reviews_count, rating_sum) VALUES ($1, $2, $3)
+                ON CONFLICT (bundle_id) DO UPDATE SET
+                    reviews_count = review_summaries.reviews_count + EXCLUDED.reviews_count,
+                    rating_sum = review_summaries.rating_sum + EXCLUDED.rating_sum,
+                    updated_at = NOW()
+            """, bundle_id, 0 if previous else 1, rating - ((previous and previous["rating"]) or 0))
     finally:
         await conn.close()
 
 async def save_review(app_name: str, reviewer_name: str, rating: int, comment: str) -> None:
     """Save a review to database."""
+    await upsert_review(app_name, reviewer_name, rating, comment)
+
+async def save_review_reply(bundle_id: str, username: str, reply: str) -> bool:
+    """Reply to the review of a user for a bundle."""
     conn = await get_db_connection()
     try:
-        await conn.execute(
-            "INSERT INTO reviews (app_name, reviewer_name, rating, comment) VALUES ($1, $2, $3, $4)",
-            app_name, reviewer_name, rating, comment
+        result = await conn.execute(
+            "UPDATE reviews SET reply = $3, reply_at = NOW() WHERE bundle_id = $1 AND username = $2",
+            bundle_id, username, reply
         )
+        return result.replace("UPDATE ", "").strip() != "0"
     finally:
         await conn.close()
 
 # App metadata functions
 async def save_app_metadata(upload_id: str, app_title: str, bundle_id: str, 
                            bundle_version: str, platform: str, file_size: int,
-                           file_url: str, version_code: int = None, build_number: str = None) -> None:
+                           file_url: str, version_code: int = None, build_number: str = None,
+                           has_icon: bool = False, variants: Optional[str] = None) -> None:
     """Save app metadata to database."""
     conn = await get_db_connection()
     try:
         await conn.execute("""
             INSERT INTO apps (upload_id, app_title, bundle_id, bundle_version, 
-                            version_code, build_number, platform, file_size, file_url)
-            VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
+                            version_code, build_number, platform, file_size, file_url, has_icon, variants)
+            VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11)
             ON CONFLICT (upload_id) DO UPDATE SET
                 app_title = EXCLUDED.app_title,
                 bundle_id = EXCLUDED.bundle_id,
@@ -176,38 +529,94 @@ async def save_app_metadata(upload_id: str, app_title: str, bundle_id: str,
                 build_number = EXCLUDED.build_number,
                 platform = EXCLUDED.platform,
                 file_size = EXCLUDED.file_size,
-                file_url = EXCLUDED.file_url
+                file_url = EXCLUDED.file_url,
+                has_icon = EXCLUDED.has_icon,
+                variants = EXCLUDED.variants
         """, upload_id, app_title, bundle_id, bundle_version, version_code, 
-             build_number, platform, file_size, file_url)
+             build_number, platform, file_size, file_url, has_icon, variants)
+        await publish_change(conn, "apps", upload_id)
+    finally:
+        await conn.close()
+
+async def save_app_metadata_batch(apps: List[Dict[str, Any]]) -> None:
+    """
+    Upserts many builds in one transaction, used by the re-indexer. Each dict has the
+    arguments of `save_app_metadata` and an optional `created_at` (kept when None).
+    """
+    if not apps:
+        return
+
+    conn = await get_db_connection()
+    try:
+        async with conn.transaction():
+            await conn.executemany("""
+                INSERT INTO apps (upload_id, app_title, bundle_id, bundle_version, version_code,
+                                  build_number, platform, file_size, file_url, has_icon, variants, created_at)
+                VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, COALESCE($12::timestamp, NOW()))
+                ON CONFLICT (upload_id) DO UPDATE SET
+                    app_title = EXCLUDED.app_title,
+                    bundle_id = EXCLUDED.bundle_id,
+                    bundle_version = EXCLUDED.bundle_version,
+                    version_code = EXCLUDED.version_code,
+                    build_number = EXCLUDED.build_number,
+                    platform = EXCLUDED.platform,
+                    file_size = EXCLUDED.file_size,
+                    file_url = EXCLUDED.file_url,
+                    has_icon = EXCLUDED.has_icon,
+                    variants = EXCLUDED.variants,
+                    created_at = COALESCE($12::timestamp, apps.created_at)
+            """, [
+                (
+                    app["upload_id"], app["app_title"], app["bundle_id"], app["bundle_version"],
+                    app.get("version_code"), app.get("build_number"), app["platform"],
+                    app["file_size"], app["file_url"], app.get("has_icon", False), app.get("variants"),
+                    # TIMESTAMP columns hold naive UTC
+                    app["created_at"].astimezone(timezone.utc).replace(tzinfo=None) if app.get("created_at") else None,
+                )
+                for app in apps
+            ])
+        await publish_change(conn, "apps")
     finally:
         await conn.close()
 
 async def get_app_metadata(upload_id: str) -> dict:
     """Get app metadata from database."""
+    app = caches["apps"].get(upload_id)
+    if not caches["apps"].is_miss(app):
+        return app
+
+    generation = caches["apps"].generation
     conn = await get_db_connection()
     try:
         row = await conn.fetchrow(
             "SELECT * FROM apps WHERE upload_id = $1", upload_id
         )
-        if row:
-            return dict(row)
-        return None
+        app = dict(row) if row else None
+        caches["apps"].set(upload_id, app, generation)
+        return app
     finally:
         await conn.close()
 
 async def list_all_apps() -> List[Dict[str, Any]]:
     """Get all apps from database."""
+    apps = caches["apps"].get(LIST_KEY)
+    if not caches["apps"].is_miss(apps):
+        return apps
+
+    generation = caches["apps"].generation
     try:
         conn = await get_db_connection()
     except ValueError:
         # Database not available, return empty list
         return []
-    
+
     try:
         rows = await conn.fetch(
             "SELECT * FROM apps ORDER BY created_at DESC"
         )
-        return [dict(row) for row in rows]
+        apps = [dict(row) for row in rows]
+        caches["apps"].set(LIST_KEY, apps, generation)
+        return apps
     finally:
         await conn.close()
 
@@ -216,27 +625,89 @@ async def delete_app_metadata(upload_id: str) -> bool:
     conn = await get_db_connection()
     try:
         result = await conn.execute("DELETE FROM apps WHERE upload_id = $1", upload_id)
+        await publish_change(conn, "apps", upload_id)
         return result.replace("DELETE ", "").strip() != "0"
     finally:
         await conn.close()
 
+# App records (metadata shared by all builds of a bundle)
+async def get_app_record(bundle_id: str) -> Optional[Dict[str, Any]]:
+    """Get the app record of a bundle from database."""
+    record = caches["app_records"].get(bundle_id)
+    if not caches["app_records"].is_miss(record):
+        return record
+
+    generation = caches["app_records"].generation
+    conn = await get_db_connection()
+    try:
+        row = await conn.fetchrow("SELECT * FROM app_records WHERE bundle_id = $1", bundle_id)
+        record = dict(row) if row else None
+        caches["app_records"].set(bundle_id, record, generation)
+        return record
+    finally:
+        await conn.close()
+
+async def list_app_records() -> List[Dict[str, Any]]:
+    """Get all app records from database."""
+    records = caches["app_records"].get(LIST_KEY)
+    if not caches["app_records"].is_miss(records):
+        return records
+
+    generation = caches["app_records"].generation
+    conn = await get_db_connection()
+    try:
+        rows = await conn.fetch("SELECT * FROM app_records ORDER BY bundle_id")
+        records = [dict(row) for row in rows]
+        caches["app_records"].set(LIST_KEY, records, generation)
+        return records
+    finally:
+        await conn.close()
+
+async def save_app_record(bundle_id: str, app_title: str, app_description: Optional[str],
+                          app_picture_url: Optional[str]) -> None:
+    """Save the app record of a bundle to database."""
+    conn = await get_db_connection()
+    try:
+        await conn.execute("""
+            INSERT INTO app_records (bundle_id, app_title, app_description, app_picture_url)
+            VALUES ($1, $2, $3, $4)
+            ON CONFLICT (bundle_id) DO UPDATE SET
+                app_title = EXCLUDED.app_title,
+                app_description = EXCLUDED.app_description,
+                app_picture_url = EXCLUDED.app_picture_url,
+                updated_at = NOW()
+        """, bundle_id, app_title, app_description, app_picture_url)
+        await publish_change(conn, "app_records", bundle_id)
+    finally:
+        await conn.close()
+
 # Settings functions
 async def get_setting(key: str, default_value=None):
     """Get setting from database."""
+    # Cached as (found, value) so missing settings are cached too
+    cached_setting = caches["settings"].get(key)
+    if not caches["settings"].is_miss(cached_setting):
+        found, value = cached_setting
+        return value if found else default_value
+
+    generation = caches["settings"].generation
     try:
         conn = await get_db_connection()
     except ValueError:
         # Database not available, return default
         return default_value
-    
+
     try:
         row = await conn.fetchrow("SELECT value FROM settings WHERE key = $1", key)
         if row:
             # Parse JSON string back to Python object
             try:
-                return json.loads(row["value"]) if isinstance(row["value"], str) else row["value"]
+                value = json.loads(row["value"]) if isinstance(row["value"], str) else row["value"]
             except (json.JSONDecodeError, TypeError):
-                return row["value"]
+                value = row["value"]
+            caches["settings"].set(key, (True, value), generation)
+            return value
+        caches["settings"].set(key, (False, None), generation)
         return default_value
     finally:
         await conn.close()
@@ -251,5 +722,52 @@ async def save_setting(key: str, value) -> None:
                 value = EXCLUDED.value,
                 updated_at = NOW()
         """, key, json.dumps(value))
+        await publish_change(conn, "settings", key)
     finally:
         await conn.close()
+
+
+async def ping() -> None:
+    """Round trip to the database, raises when it is unreachable."""
+    conn = await get_db_connection()
+    try:
+        await conn.fetchval("SELECT 1")
+    finally:
+        await conn.close()
+
+
+async def run_change_listener():
+    """Listens for changes made by other workers and invalidates the local caches."""
+    if not DATABASE_URL or not DATABASE_URL.startswith(("postgres://", "postgresql://")):
+        return
+
+    await change_notifications.run_change_listener(get_db_connection)
+
+
+# Single node deployments can use an embedded database instead: DATABASE_URL=sqlite:///data/appsyra.db
+if DATABASE_URL and DATABASE_URL.startswith("sqlite:"):
+    from app_distribution_server.sqlite_database import (  # noqa: E402, F811
+        delete_app_metadata,
+        delete_user,
+        get_app_metadata,
+        get_app_record,
+        get_review_summary,
+        get_reviews,
+        get_setting,
+        get_user_review,
+        get_users,
+        init_database,
+        list_all_apps,
+        list_app_records,
+        list_recent_reviews,
+        list_reviews,
+        ping,
+        save_app_metadata,
+        save_app_metadata_batch,
+        save_app_record,
+        save_review,
+        save_review_reply,
+        save_setting,
+        save_user,
+        upsert_review,
+    )
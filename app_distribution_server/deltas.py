@@ -0,0 +1,269 @@
+"""
+Binary deltas between consecutive Android builds of the same bundle.
+
+Consecutive builds of an app mostly share their APK entries (native libraries,
+resources, assets), only the changed ones differ. A delta copies every stored entry
+that is byte for byte the same in the previous build and carries the rest of the new
+APK (changed entries, local headers, signing block, central directory) as literal
+data, so a tester with the previous build installed downloads only what changed.
+
+Deltas are built after the upload by a small worker pool and stored next to the new
+build. Sideload tooling applies them on the device side, or with:
+
+    python -m app_distribution_server.deltas apply old.apk patch.apkdelta new.apk
+
+Format: a fixed header (magic, version, size and SHA-256 of the old and new APK)
+followed by a gzip stream of operations: `C` copies `length` bytes at `offset` of the
+old APK, `D` writes `length` literal bytes, `E` ends the stream.
+"""
+import argparse
+import gzip
+import hashlib
+import shutil
+import struct
+import zipfile
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import BinaryIO, Callable, Optional
+
+from pydantic import BaseModel
+
+from app_distribution_server.config import DELTA_WORKERS
+from app_distribution_server.logger import logger
+
+DELTA_FILE_EXTENSION = ".apkdelta"
+
+DELTA_MAGIC = b"APKDELTA"
+DELTA_VERSION = 1
+HEADER_FORMAT = "<8sBQ32sQ32s"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+COPY_OPERATION = b"C"
+DATA_OPERATION = b"D"
+END_OPERATION = b"E"
+
+# Entries smaller than this are cheaper to send than to describe
+MIN_COPY_LENGTH = 64
+CHUNK_SIZE = 1024 * 1024
+
+ZIP_LOCAL_HEADER_FORMAT = "<4s22xHH"
+ZIP_LOCAL_HEADER_SIZE = struct.calcsize(ZIP_LOCAL_HEADER_FORMAT)
+ZIP_LOCAL_HEADER_SIGNATURE = b"PK\x03\x04"
+
+_executor = ThreadPoolExecutor(max_workers=DELTA_WORKERS, thread_name_prefix="deltas")
+
+
+class DeltaMetrics(BaseModel):
+    deltas_built: int = 0
+    deltas_skipped: int = 0
+    build_failures: int = 0
+    stored_bytes: int = 0
+    delta_downloads: int = 0
+    full_download_fallbacks: int = 0
+    bytes_served: int = 0
+    bytes_saved: int = 0
+
+
+delta_metrics = DeltaMetrics()
+
+
+def hash_file(file: BinaryIO) -> tuple[int, bytes]:
+    """Size and SHA-256 digest of a file, read from the start."""
+    file.seek(0)
+    digest = hashlib.sha256()
+    size = 0
+    while chunk := file.read(CHUNK_SIZE):
+        digest.update(chunk)
+        size += len(chunk)
+    return size, digest.digest()
+
+
+def _get_entry_data_offset(file: BinaryIO, info: zipfile.ZipInfo) -> Optional[int]:
+    # The central directory does not give where the data starts, the local header does
+    file.seek(info.header_offset)
+    local_header = file.read(ZIP_LOCAL_HEADER_SIZE)
+    if len(local_header) != ZIP_LOCAL_HEADER_SIZE:
+        return None
+
+    signature, name_length, extra_length = struct.unpack(ZIP_LOCAL_HEADER_FORMAT, local_header)
+    if signature != ZIP_LOCAL_HEADER_SIGNATURE:
+        return None
+    return info.header_offset + ZIP_LOCAL_HEADER_SIZE + name_length + extra_length
+
+
+def _ranges_equal(old_file: BinaryIO, old_offset: int, new_file: BinaryIO, new_offset: int, length: int) -> bool:
+    position = 0
+    while position < length:
+        chunk_size = min(CHUNK_SIZE, length - position)
+        old_file.seek(old_offset + position)
+        new_file.seek(new_offset + position)
+        if old_file.read(chunk_size) != new_file.read(chunk_size):
+            return False
+        position += chunk_size
+    return True
+
+
+def find_copies(old_file: BinaryIO, new_file: BinaryIO) -> list[tuple[int, int, int]]:
+    """
+    `(new offset, old offset, length)` of the stored entry data that the new APK
+    shares with the old one, in new APK order with adjacent ranges merged.
+    """
+    old_entries = {info.filename: info for info in zipfile.ZipFile(old_file).infolist()}
+
+    copies: list[tuple[int, int, int]] = []
+    for info in sorted(zipfile.ZipFile(new_file).infolist(), key=lambda info: info.header_offset):
+        old_info = old_entries.get(info.filename)
+        if (
+            old_info is None
+            or info.compress_size < MIN_COPY_LENGTH
+            or (info.CRC, info.compress_type, info.compress_size, info.file_size)
+            != (old_info.CRC, old_info.compress_type, old_info.compress_size, old_info.file_size)
+        ):
+            continue
+
+        new_offset = _get_entry_data_offset(new_file, info)
+        old_offset = _get_entry_data_offset(old_file, old_info)
+        if new_offset is None or old_offset is None:
+            continue
+        # Same CRC but compressed with other settings is possible, only identical bytes are copied
+        if not _ranges_equal(old_file, old_offset, new_file, new_offset, info.compress_size):
+            continue
+
+        if copies and copies[-1][0] + copies[-1][2] == new_offset and copies[-1][1] + copies[-1][2] == old_offset:
+            previous_new_offset, previous_old_offset, previous_length = copies.pop()
+            copies.append((previous_new_offset, previous_old_offset, previous_length + info.compress_size))
+        else:
+            copies.append((new_offset, old_offset, info.compress_size))
+
+    return copies
+
+
+def _write_data(stream, new_file: BinaryIO, start: int, end: int):
+    new_file.seek(start)
+    while start < end:
+        chunk = new_file.read(min(CHUNK_SIZE, end - start))
+        if not chunk:
+            raise ValueError(f"Unexpected end of the new APK at offset {start}")
+        stream.write(DATA_OPERATION + struct.pack("<Q", len(chunk)) + chunk)
+        start += len(chunk)
+
+
+def create_delta(old_file: BinaryIO, new_file: BinaryIO, output: BinaryIO):
+    """Writes the delta turning `old_file` into `new_file` (both seekable APKs) to `output`."""
+    old_size, old_digest = hash_file(old_file)
+    new_size, new_digest = hash_file(new_file)
+    copies = find_copies(old_file, new_file)
+
+    output.write(struct.pack(HEADER_FORMAT, DELTA_MAGIC, DELTA_VERSION, old_size, old_digest, new_size, new_digest))
+    with gzip.GzipFile(fileobj=output, mode="wb", mtime=0) as stream:
+        position = 0
+        for new_offset, old_offset, length in copies:
+            _write_data(stream, new_file, position, new_offset)
+            stream.write(COPY_OPERATION + struct.pack("<QQ", old_offset, length))
+            position = new_offset + length
+        _write_data(stream, new_file, position, new_size)
+        stream.write(END_OPERATION)
+
+
+def _read_exactly(stream, length: int) -> bytes:
+    content = stream.read(length)
+    if len(content) != length:
+        raise ValueError("Truncated delta")
+    return content
+
+
+def apply_delta(old_file: BinaryIO, delta_file: BinaryIO, output: BinaryIO):
+    """Writes the new APK to `output`, checking both APKs against the digests of the delta."""
+    magic, version, old_size, old_digest, new_size, new_digest = struct.unpack(
+        HEADER_FORMAT,
+        _read_exactly(delta_file, HEADER_SIZE),
+    )
+    if magic != DELTA_MAGIC or version != DELTA_VERSION:
+        raise ValueError("Not an APK delta, or written by an unsupported version")
+    if hash_file(old_file) != (old_size, old_digest):
+        raise ValueError("The delta was not made from this APK")
+
+    digest = hashlib.sha256()
+    size = 0
+
+    def write(content: bytes):
+        nonlocal size
+        output.write(content)
+        digest.update(content)
+        size += len(content)
+
+    with gzip.GzipFile(fileobj=delta_file, mode="rb") as stream:
+        while (operation := _read_exactly(stream, 1)) != END_OPERATION:
+            if operation == COPY_OPERATION:
+                old_offset, length = struct.unpack("<QQ", _read_exactly(stream, 16))
+                old_file.seek(old_offset)
+                while length > 0:
+                    chunk = _read_exactly(old_file, min(CHUNK_SIZE, length))
+                    write(chunk)
+                    length -= len(chunk)
+            elif operation == DATA_OPERATION:
+                (length,) = struct.unpack("<Q", _read_exactly(stream, 8))
+                write(_read_exactly(stream, length))
+            else:
+                raise ValueError(f"Unknown delta operation {operation!r}")
+
+    if (size, digest.digest()) != (new_size, new_digest):
+        raise ValueError("The patched APK does not match the new build")
+
+
+def submit_delta(upload_id: str, from_upload_id: str, build_delta: Callable[[], Optional[int]]) -> Future:
+    """Runs `build_delta` (returning the stored size, or None when not worth storing) on the workers."""
+
+    def run():
+        try:
+            stored_size = build_delta()
+        except Exception as e:
+            delta_metrics.build_failures += 1
+            logger.warning(f"Failed to build the delta from {from_upload_id!r} to {upload_id!r}: {e}")
+            return None
+
+        if stored_size is None:
+            delta_metrics.deltas_skipped += 1
+        else:
+            delta_metrics.deltas_built += 1
+            delta_metrics.stored_bytes += stored_size
+        return stored_size
+
+    return _executor.submit(run)
+
+
+def record_delta_download(full_size: int, delta_size: int):
+    delta_metrics.delta_downloads += 1
+    delta_metrics.bytes_served += delta_size
+    delta_metrics.bytes_saved += max(full_size - delta_size, 0)
+
+
+def record_full_download_fallback():
+    delta_metrics.full_download_fallbacks += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    create_parser = subparsers.add_parser("create", help="Write the delta between two APKs")
+    apply_parser = subparsers.add_parser("apply", help="Rebuild the new APK from the old one and a delta")
+    for subparser in (create_parser, apply_parser):
+        subparser.add_argument("old_apk")
+    create_parser.add_argument("new_apk")
+    create_parser.add_argument("delta")
+    apply_parser.add_argument("delta")
+    apply_parser.add_argument("new_apk")
+    args = parser.parse_args()
+
+    with open(args.old_apk, "rb") as old_file:
+        if args.command == "create":
+            with open(args.new_apk, "rb") as new_file, open(args.delta, "wb") as output:
+                create_delta(old_file, new_file, output)
+        else:
+            temporary_path = f"{args.new_apk}.tmp"
+            with open(args.delta, "rb") as delta_file, open(temporary_path, "wb") as output:
+                apply_delta(old_file, delta_file, output)
+            shutil.move(temporary_path, args.new_apk)
+
+
+if __name__ == "__main__":
+    main()
@@ -17,6 +17,14 @@ class InvalidFileTypeError(UserError):
     STATUS_CODE = status.HTTP_400_BAD_REQUEST
 
 
+class InvalidApkVariantError(UserError):
+    ERROR_MESSAGE = (
+        "Invalid APK variant. Variants are ABI-specific .apk files of the same app as the upload,"
+        " or .apks archives with standalone APKs, with the same version code."
+    )
+    STATUS_CODE = status.HTTP_400_BAD_REQUEST
+
+
 class UnauthorizedError(UserError):
     ERROR_MESSAGE = "Invalid X-Auth-Token"
     STATUS_CODE = status.HTTP_403_FORBIDDEN
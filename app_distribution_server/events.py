@@ -0,0 +1,82 @@
+"""
+In-process publish/subscribe of live events (downloads, uploads, activity).
+
+Producers never block: every subscriber has a bounded buffer and, when a slow
+consumer lets it fill up, the oldest events are dropped and the subscriber is
+flagged so it can resynchronise from the regular endpoints.
+"""
+import asyncio
+import itertools
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from app_distribution_server.config import EVENTS_CLIENT_BUFFER_SIZE
+
+
+@dataclass
+class Event:
+    id: int
+    type: str
+    data: dict[str, Any]
+
+
+# Compared and hashed by identity, subscriptions are kept in a set
+@dataclass(eq=False)
+class Subscription:
+    loop: asyncio.AbstractEventLoop
+    queue: asyncio.Queue = field(default_factory=lambda: asyncio.Queue(EVENTS_CLIENT_BUFFER_SIZE))
+    dropped_events: int = 0
+
+    def _put(self, event: Event):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped_events += 1
+        self.queue.put_nowait(event)
+
+    async def get(self) -> Event:
+        return await self.queue.get()
+
+
+class EventBroker:
+    def __init__(self):
+        self._subscriptions: set[Subscription] = set()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscriptions)
+
+    def subscribe(self) -> Subscription:
+        subscription = Subscription(loop=asyncio.get_running_loop())
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def publish(self, event_type: str, data: dict[str, Any]):
+        """Can be called from the event loop or from worker threads."""
+        with self._lock:
+            if not self._subscriptions:
+                return
+            subscriptions = list(self._subscriptions)
+
+        event = Event(id=next(self._ids), type=event_type, data=data)
+
+        try:
+            running_loop: Optional[asyncio.AbstractEventLoop] = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+
+        for subscription in subscriptions:
+            if subscription.loop is running_loop:
+                subscription._put(event)
+            elif not subscription.loop.is_closed():
+                subscription.loop.call_soon_threadsafe(subscription._put, event)
+
+
+event_broker = EventBroker()
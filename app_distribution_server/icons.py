@@ -0,0 +1,264 @@
+"""
+App icons: extraction from uploaded builds and resized thumbnails.
+
+Icons are taken from the IPA bundle (where Xcode stores them as "CgBI" PNGs that
+only Apple tools read) or from the APK launcher resources, and stored next to the
+build. A small worker pool renders the standard sizes in PNG and WebP, pages then
+link the thumbnail closest to the size they display. Resizing needs Pillow, without
+it only the original icon is stored and served.
+"""
+import functools
+import posixpath
+import re
+import struct
+import zipfile
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from io import BytesIO
+from typing import Callable, Optional
+
+from app_distribution_server.config import ICON_SIZES, ICON_WORKERS
+from app_distribution_server.logger import logger
+
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+ORIGINAL_ICON_NAME = "original"
+
+MEDIA_TYPES = {
+    "png": "image/png",
+    "webp": "image/webp",
+    "jpeg": "image/jpeg",
+}
+
+ANDROID_DENSITIES = {
+    "ldpi": 120,
+    "mdpi": 160,
+    "tvdpi": 213,
+    "hdpi": 240,
+    "xhdpi": 320,
+    "xxhdpi": 480,
+    "xxxhdpi": 640,
+    "anydpi": 0,
+}
+
+_executor = ThreadPoolExecutor(max_workers=ICON_WORKERS, thread_name_prefix="icons")
+
+
+@functools.cache
+def get_pillow():
+    """Pillow's `Image` and `features` modules, imported on first use, or None without Pillow."""
+    try:
+        from PIL import Image, features
+    except ImportError:
+        return None
+    return Image, features
+
+
+def get_image_format(content: bytes) -> Optional[str]:
+    if content.startswith(PNG_SIGNATURE):
+        return "png"
+    if content[:4] == b"RIFF" and content[8:12] == b"WEBP":
+        return "webp"
+    if content.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    return None
+
+
+def _iter_png_chunks(content: bytes):
+    offset = len(PNG_SIGNATURE)
+    while offset + 8 <= len(content):
+        length, chunk_type = struct.unpack(">I4s", content[offset:offset + 8])
+        yield chunk_type, content[offset + 8:offset + 8 + length]
+        offset += length + 12
+        if chunk_type == b"IEND":
+            break
+
+
+def _png_chunk(chunk_type: bytes, chunk_data: bytes) -> bytes:
+    return (
+        struct.pack(">I", len(chunk_data))
+        + chunk_type
+        + chunk_data
+        + struct.pack(">I", zlib.crc32(chunk_type + chunk_data))
+    )
+
+
+def _png_width(content: bytes) -> int:
+    for chunk_type, chunk_data in _iter_png_chunks(content):
+        if chunk_type == b"IHDR":
+            return struct.unpack(">I", chunk_data[:4])[0]
+    return 0
+
+
+def normalize_cgbi_png(content: bytes) -> bytes:
+    """
+    Converts an Xcode optimised PNG into a standard one, other PNGs are returned as is.
+    Those start with a `CgBI` chunk, store pixels as premultiplied BGRA and compress
+    them as a raw deflate stream without the zlib header.
+    """
+    chunks = list(_iter_png_chunks(content))
+    if not chunks or chunks[0][0] != b"CgBI":
+        return content
+
+    header = next(chunk_data for chunk_type, chunk_data in chunks if chunk_type == b"IHDR")
+    width, height, bit_depth, color_type, _, _, interlace = struct.unpack(">IIBBBBB", header)
+    pixels = bytearray(zlib.decompress(b"".join(
+        chunk_data for chunk_type, chunk_data in chunks if chunk_type == b"IDAT"
+    ), -zlib.MAX_WBITS))
+
+    # Scanline filters only combine bytes of the same channel, so the channels can be
+    # swapped without decoding the filters first
+    if bit_depth == 8 and color_type == 6 and interlace == 0:
+        stride = width * 4
+        for row in range(height):
+            start = row * (stride + 1) + 1
+            line = pixels[start:start + stride]
+            line[0::4], line[2::4] = line[2::4], line[0::4]
+            pixels[start:start + stride] = line
+
+    normalized = bytearray(PNG_SIGNATURE)
+    pixels_written = False
+    for chunk_type, chunk_data in chunks:
+        if chunk_type == b"CgBI":
+            continue
+        if chunk_type == b"IDAT":
+            # All the pixels go in the first IDAT chunk
+            if pixels_written:
+                continue
+            chunk_data = zlib.compress(bytes(pixels))
+            pixels_written = True
+        normalized += _png_chunk(chunk_type, chunk_data)
+
+    pillow = get_pillow()
+    if pillow is not None and color_type == 6:
+        Image, _ = pillow
+        image = Image.open(BytesIO(bytes(normalized)))
+        image = Image.frombytes("RGBa", image.size, image.convert("RGBA").tobytes()).convert("RGBA")
+        output = BytesIO()
+        image.save(output, "PNG")
+        return output.getvalue()
+
+    return bytes(normalized)
+
+
+def _get_ipa_icon_names(info: dict) -> list[str]:
+    icon_names = []
+    for icons_key in ("CFBundleIcons", "CFBundleIcons~ipad"):
+        primary_icon = info.get(icons_key, {}).get("CFBundlePrimaryIcon", {})
+        if isinstance(primary_icon, dict):
+            icon_names += primary_icon.get("CFBundleIconFiles", [])
+    icon_names += info.get("CFBundleIconFiles", [])
+    if info.get("CFBundleIconFile"):
+        icon_names.append(info["CFBundleIconFile"])
+    return [posixpath.splitext(icon_name)[0] for icon_name in icon_names] or ["AppIcon", "Icon"]
+
+
+def extract_ipa_icon(ipa: zipfile.ZipFile, app_directory: str, info: dict) -> Optional[bytes]:
+    """Largest icon declared by the Info.plist of the app, as a standard PNG."""
+    icon_names = _get_ipa_icon_names(info)
+    candidates = [
+        file
+        for file in ipa.namelist()
+        if posixpath.dirname(file) == app_directory.rstrip("/")
+        and file.endswith(".png")
+        and posixpath.basename(file).startswith(tuple(icon_names))
+    ]
+
+    icon, icon_width = None, 0
+    for candidate in candidates:
+        content = ipa.read(candidate)
+        width = _png_width(content)
+        if width > icon_width:
+            icon, icon_width = content, width
+
+    if icon is None:
+        return None
+
+    return normalize_cgbi_png(icon)
+
+
+def _get_android_density(file_path: str) -> int:
+    qualifiers = posixpath.basename(posixpath.dirname(file_path)).split("-")
+    return max((ANDROID_DENSITIES.get(qualifier, 0) for qualifier in qualifiers), default=0)
+
+
+def extract_apk_icon(apk, apk_zip: zipfile.ZipFile) -> Optional[bytes]:
+    """
+    Launcher icon of an androguard APK, read from `apk_zip`. Adaptive icons are XML
+    drawables, the PNG or WebP bitmaps kept with the same name for older Android
+    versions are used instead.
+    """
+    icon_path = apk.get_app_icon()
+    if not icon_path:
+        return None
+
+    if not icon_path.endswith(".xml"):
+        return apk_zip.read(icon_path)
+
+    icon_name = posixpath.splitext(posixpath.basename(icon_path))[0]
+    pattern = re.compile(rf"^res/(mipmap|drawable)[^/]*/{re.escape(icon_name)}\.(png|webp)$")
+    bitmaps = [file for file in apk_zip.namelist() if pattern.match(file)]
+    if not bitmaps:
+        return None
+
+    return apk_zip.read(max(bitmaps, key=_get_android_density))
+
+
+def render_thumbnails(content: bytes) -> dict[str, bytes]:
+    """Standard sizes of an icon, as `<size>.png` and `<size>.webp` files."""
+    pillow = get_pillow()
+    if pillow is None:
+        return {}
+
+    Image, features = pillow
+
+    image = Image.open(BytesIO(content))
+    image.load()
+    image = image.convert("RGBA")
+
+    file_formats = ["png"]
+    if features.check("webp"):
+        file_formats.append("webp")
+
+    thumbnails = {}
+    for size in ICON_SIZES:
+        thumbnail = image.copy()
+        thumbnail.thumbnail((size, size), Image.Resampling.LANCZOS)
+        for file_format in file_formats:
+            output = BytesIO()
+            thumbnail.save(output, file_format.upper(), optimize=True)
+            thumbnails[f"{size}.{file_format}"] = output.getvalue()
+    return thumbnails
+
+
+def submit_thumbnails(content: bytes, write_file: Callable[[str, bytes], None]) -> Future:
+    """Renders the thumbnails of an icon in the worker pool, `write_file` stores each of them."""
+    def render_and_write():
+        try:
+            for file_name, thumbnail in render_thumbnails(content).items():
+                write_file(file_name, thumbnail)
+        except Exception as e:
+            logger.warning(f"Failed to render icon thumbnails: {e}")
+
+    return _executor.submit(render_and_write)
+
+
+def select_icon_file(file_names: list[str], size: int, accept_webp: bool) -> Optional[str]:
+    """
+    Smallest thumbnail covering `size` (or the largest one), in WebP when the client
+    accepts it. Falls back to the original while thumbnails are not rendered yet.
+    """
+    file_formats = ["webp", "png"] if accept_webp else ["png"]
+    thumbnails = {}
+    for file_name in file_names:
+        thumbnail_size, _, file_format = file_name.partition(".")
+        if thumbnail_size.isdigit() and file_format in file_formats:
+            thumbnails.setdefault(int(thumbnail_size), []).append(file_name)
+
+    if thumbnails:
+        sizes = sorted(thumbnails)
+        best_size = next((thumbnail_size for thumbnail_size in sizes if thumbnail_size >= size), sizes[-1])
+        return min(thumbnails[best_size], key=lambda file_name: file_formats.index(file_name.partition(".")[2]))
+
+    return next((file_name for file_name in file_names if file_name.startswith(f"{ORIGINAL_ICON_NAME}.")), None)
@@ -0,0 +1,164 @@
+"""
+Install artifacts of an upload: the iOS manifest plist, the install URL and its QR code.
+
+They only depend on the build and on `APP_BASE_URL`, so they are rendered once when
+the build is uploaded, stored next to it and served from memory with strong ETags.
+After changing `APP_BASE_URL`, regenerate them with:
+
+    python -m app_distribution_server.install_artifacts
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+from collections import OrderedDict
+from dataclasses import dataclass
+from threading import Lock
+from typing import Optional
+
+from app_distribution_server.build_info import BuildInfo, Platform
+from app_distribution_server.config import APP_BASE_URL, INSTALL_ARTIFACTS_CACHE_SIZE
+from app_distribution_server.lazy import LazyObject
+from app_distribution_server.logger import logger
+from app_distribution_server.qrcode import get_qr_code_svg
+
+INSTALL_ARTIFACTS_DIRECTORY_NAME = "install"
+PLIST_FILE_NAME = "app.plist"
+QR_CODE_FILE_NAME = "qrcode.svg"
+MANIFEST_FILE_NAME = "manifest.json"
+
+MEDIA_TYPES = {
+    PLIST_FILE_NAME: "application/xml",
+    QR_CODE_FILE_NAME: "image/svg+xml",
+    MANIFEST_FILE_NAME: "application/json",
+}
+
+
+def create_templates_environment():
+    from jinja2 import Environment, FileSystemLoader
+
+    return Environment(loader=FileSystemLoader("templates"), autoescape=True)
+
+
+_templates = LazyObject(create_templates_environment, "install artifact templates")
+
+
+@dataclass
+class InstallArtifact:
+    content: bytes
+    media_type: str
+    etag: str
+
+
+def get_etag(content: bytes) -> str:
+    return f'"{hashlib.sha256(content).hexdigest()[:32]}"'
+
+
+def get_install_url(build_info: BuildInfo, base_url: str = APP_BASE_URL) -> str:
+    if build_info.platform == Platform.ios:
+        return f"itms-services://?action=download-manifest&url={base_url}/get/{build_info.upload_id}/{PLIST_FILE_NAME}"
+
+    return f"{base_url}/get/{build_info.upload_id}/{Platform.android.app_file_name}"
+
+
+def compile_templates():
+    _templates.get_template("plist.xml")
+
+
+def render_plist(build_info: BuildInfo, base_url: str = APP_BASE_URL) -> bytes:
+    return _templates.get_template("plist.xml").render(
+        ipa_file_url=f"{base_url}/get/{build_info.upload_id}/{Platform.ios.app_file_name}",
+        app_title=build_info.app_title,
+        bundle_id=build_info.bundle_id,
+        bundle_version=build_info.bundle_version,
+    ).encode("utf-8")
+
+
+def render_install_artifacts(build_info: BuildInfo, base_url: str = APP_BASE_URL) -> dict[str, bytes]:
+    """Files of the `install/` directory of an upload, the manifest comes last."""
+    install_url = get_install_url(build_info, base_url)
+
+    artifacts = {}
+    if build_info.platform == Platform.ios:
+        artifacts[PLIST_FILE_NAME] = render_plist(build_info, base_url)
+    artifacts[QR_CODE_FILE_NAME] = get_qr_code_svg(install_url).encode("utf-8")
+    artifacts[MANIFEST_FILE_NAME] = json.dumps({
+        "base_url": base_url,
+        "install_url": install_url,
+    }, indent=2).encode("utf-8")
+
+    return artifacts
+
+
+class InstallArtifactsCache:
+    """Least recently used artifacts, uploads never change so entries only leave when evicted."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple[str, str], InstallArtifact] = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, upload_id: str, file_name: str) -> Optional[InstallArtifact]:
+        with self._lock:
+            artifact = self._entries.get((upload_id, file_name))
+            if artifact is not None:
+                self._entries.move_to_end((upload_id, file_name))
+            return artifact
+
+    def set(self, upload_id: str, file_name: str, artifact: InstallArtifact):
+        if self.max_entries <= 0:
+            return
+
+        with self._lock:
+            self._entries[(upload_id, file_name)] = artifact
+            self._entries.move_to_end((upload_id, file_name))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, upload_id: str):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == upload_id]:
+                del self._entries[key]
+
+
+cache = InstallArtifactsCache(INSTALL_ARTIFACTS_CACHE_SIZE)
+
+
+async def regenerate_install_artifacts(base_url: str, force: bool = False) -> int:
+    """Re-renders the artifacts of every upload that was rendered for another base URL."""
+    from app_distribution_server import cdn, storage
+
+    upload_ids = await asyncio.to_thread(lambda: list(storage.list_upload_ids()))
+    logger.info(f"Checking the install artifacts of {len(upload_ids)} uploads for {base_url!r}")
+
+    regenerated_count = 0
+    for index, upload_id in enumerate(upload_ids, start=1):
+        try:
+            if not force and await asyncio.to_thread(storage.get_install_artifacts_base_url, upload_id) == base_url:
+                continue
+
+            build_info = await storage.load_stored_build_info(upload_id)
+            await asyncio.to_thread(storage.save_install_artifacts, build_info, base_url)
+            await cdn.purge(cdn.get_upload_surrogate_key(upload_id))
+            regenerated_count += 1
+        except Exception as e:
+            logger.warning(f"Failed to regenerate the install artifacts of {upload_id!r}: {e}")
+
+        if index % 100 == 0:
+            logger.info(f"Install artifacts progress: {index}/{len(upload_ids)}")
+
+    logger.info(f"Regenerated the install artifacts of {regenerated_count} uploads")
+    return regenerated_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--base-url", default=APP_BASE_URL, help="Base URL of the server (default: APP_BASE_URL)")
+    parser.add_argument("--force", action="store_true", help="Regenerate artifacts already rendered for this base URL")
+    args = parser.parse_args()
+
+    asyncio.run(regenerate_install_artifacts(args.base_url.rstrip("/"), force=args.force))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Objects created on first use.
+
+Cold starts (the serverless entry point in `api/index.py` imports the whole app for
+every new instance) only pay for the dependencies and backends that a request
+actually uses: androguard is only imported to parse an APK, asyncpg to reach
+PostgreSQL, boto3 to open an S3 bucket, and so on.
+"""
+import importlib
+import threading
+import time
+from typing import Any, Callable
+
+from app_distribution_server.logger import logger
+
+# Seconds spent creating each lazy object, reported by the startup benchmark
+load_durations: dict[str, float] = {}
+
+
+class LazyObject:
+    """Proxy creating its target with `factory` on first attribute access, once per process."""
+
+    def __init__(self, factory: Callable[[], Any], name: str):
+        self._factory = factory
+        self._name = name
+        self._target = None
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        state = "loaded" if self.is_loaded else "not loaded"
+        return f"<lazy {self._name} ({state})>"
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._target is not None
+
+    def resolve(self) -> Any:
+        target = self._target
+        if target is not None:
+            return target
+
+        with self._lock:
+            if self._target is None:
+                started_at = time.perf_counter()
+                self._target = self._factory()
+                load_durations[self._name] = time.perf_counter() - started_at
+                logger.debug(f"Loaded {self._name} in {load_durations[self._name] * 1000:.1f}ms")
+            return self._target
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.resolve(), name)
+
+
+def lazy_import(module_name: str) -> LazyObject:
+    """Module imported on first attribute access, `module.attribute` works as usual."""
+    return LazyObject(lambda: importlib.import_module(module_name), module_name)
@@ -1,6 +1,8 @@
 import io
 
-import pyqrcode
+from app_distribution_server.lazy import lazy_import
+
+pyqrcode = lazy_import("pyqrcode")
 
 
 def get_qr_code_svg(qr_content):
@@ -0,0 +1,122 @@
+"""
+Readiness of the process, as opposed to liveness (`/healthz`).
+
+An instance is ready once its startup warm-up is done (templates compiled,
+translations loaded, app catalog and latest builds cached) and while the database
+and storage answer. Dependency checks are timed and reused for a short interval,
+so frequent load balancer probes do not add load on them.
+"""
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from app_distribution_server import database, storage
+from app_distribution_server.config import READINESS_CHECK_INTERVAL_SECONDS, READINESS_CHECK_TIMEOUT_SECONDS
+from app_distribution_server.logger import logger
+
+
+@dataclass
+class WarmUp:
+    status: str = "pending"
+    started_at: Optional[float] = None
+    duration_seconds: Optional[float] = None
+    step_durations: dict[str, float] = field(default_factory=dict)
+    errors: dict[str, str] = field(default_factory=dict)
+
+    @property
+    def is_done(self) -> bool:
+        return self.status == "done"
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "status": self.status,
+            "duration_ms": round(self.duration_seconds * 1000, 1) if self.duration_seconds is not None else None,
+            "steps_ms": {step: round(duration * 1000, 1) for step, duration in self.step_durations.items()},
+            "errors": self.errors,
+        }
+
+
+warm_up_state = WarmUp()
+
+_checks: Optional[dict[str, dict[str, Any]]] = None
+_checked_at = 0.0
+_checks_lock = asyncio.Lock()
+
+
+async def _warm_up_catalog():
+    # Apps with their latest builds, what the first page views load
+    await storage.list_apps()
+
+
+async def warm_up():
+    """Runs once at startup, a failed step is logged and does not block readiness."""
+    from app_distribution_server import install_artifacts
+    from app_distribution_server.routers import html_router
+
+    steps = [
+        ("translations", lambda: asyncio.to_thread(html_router.load_all_translations)),
+        ("templates", lambda: asyncio.to_thread(html_router.compile_templates)),
+        ("install_templates", lambda: asyncio.to_thread(install_artifacts.compile_templates)),
+        ("catalog", _warm_up_catalog),
+    ]
+
+    warm_up_state.status = "running"
+    warm_up_state.started_at = time.monotonic()
+    for step, run_step in steps:
+        step_started_at = time.monotonic()
+        try:
+            await run_step()
+        except Exception as e:
+            logger.warning(f"Warm-up step {step!r} failed: {e}")
+            warm_up_state.errors[step] = f"{type(e).__name__}: {e}"
+        warm_up_state.step_durations[step] = time.monotonic() - step_started_at
+
+    warm_up_state.duration_seconds = time.monotonic() - warm_up_state.started_at
+    warm_up_state.status = "done"
+    logger.info(f"Warm-up done in {warm_up_state.duration_seconds * 1000:.0f}ms")
+
+
+async def _run_check(check) -> dict[str, Any]:
+    started_at = time.monotonic()
+    try:
+        await asyncio.wait_for(check(), timeout=READINESS_CHECK_TIMEOUT_SECONDS)
+    except Exception as e:
+        return {
+            "status": "failed",
+            "latency_ms": round((time.monotonic() - started_at) * 1000, 1),
+            "error": f"{type(e).__name__}: {e}" if str(e) else type(e).__name__,
+        }
+    return {"status": "ok", "latency_ms": round((time.monotonic() - started_at) * 1000, 1)}
+
+
+async def _check_database() -> dict[str, Any]:
+    if not database.DATABASE_URL:
+        return {"status": "disabled"}
+    return await _run_check(database.ping)
+
+
+async def _check_storage() -> dict[str, Any]:
+    return await _run_check(lambda: asyncio.to_thread(storage.check_storage_round_trip))
+
+
+async def get_dependency_checks() -> dict[str, dict[str, Any]]:
+    global _checks, _checked_at
+
+    async with _checks_lock:
+        if _checks is None or time.monotonic() - _checked_at >= READINESS_CHECK_INTERVAL_SECONDS:
+            database_check, storage_check = await asyncio.gather(_check_database(), _check_storage())
+            _checks = {"database": database_check, "storage": storage_check}
+            _checked_at = time.monotonic()
+        return _checks
+
+
+async def get_readiness() -> tuple[bool, dict[str, Any]]:
+    """Whether the instance should receive traffic, with the details of each check."""
+    checks = await get_dependency_checks()
+    is_ready = warm_up_state.is_done and all(check["status"] != "failed" for check in checks.values())
+    return is_ready, {
+        "status": "ready" if is_ready else "not ready",
+        "warm_up": warm_up_state.as_dict(),
+        "checks": checks,
+    }
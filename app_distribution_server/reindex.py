@@ -0,0 +1,141 @@
+"""
+Rebuilds the database metadata of every upload from storage.
+
+Use it when the `apps` table is lost or out of sync with storage. Uploads are read by
+a bounded pool of workers, migrating v1 `app_info.json` files and rebuilding missing
+`build_info.json` files on the way, and upserted in batches. Progress is saved in a
+checkpoint file after each batch, so an interrupted run resumes where it stopped:
+
+    python -m app_distribution_server.reindex
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from typing import Optional
+
+from app_distribution_server import database, storage
+from app_distribution_server.build_info import BuildInfo
+from app_distribution_server.logger import logger
+
+DEFAULT_CHECKPOINT_PATH = "reindex-checkpoint.json"
+
+
+def load_checkpoint(checkpoint_path: str) -> Optional[dict]:
+    try:
+        with open(checkpoint_path) as checkpoint_file:
+            return json.load(checkpoint_file)
+    except FileNotFoundError:
+        return None
+
+
+def save_checkpoint(checkpoint_path: str, checkpoint: dict):
+    # Replaced at once, an interrupted write never loses the previous checkpoint
+    temporary_path = f"{checkpoint_path}.tmp"
+    with open(temporary_path, "w") as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file, indent=2)
+    os.replace(temporary_path, checkpoint_path)
+
+
+async def reindex(
+    concurrency: int = 8,
+    batch_size: int = 200,
+    checkpoint_path: str = DEFAULT_CHECKPOINT_PATH,
+    restart: bool = False,
+) -> dict:
+    """
+    Upserts the build info of every upload, in upload id order so a checkpoint is the
+    last id of the last stored batch. Returns the final counts.
+    """
+    if not database.DATABASE_URL:
+        raise ValueError("DATABASE_URL environment variable not set")
+
+    await database.init_database()
+
+    upload_ids = sorted(await asyncio.to_thread(lambda: list(storage.list_upload_ids())))
+    total_count = len(upload_ids)
+
+    checkpoint = None if restart else load_checkpoint(checkpoint_path)
+    if checkpoint:
+        upload_ids = [upload_id for upload_id in upload_ids if upload_id > checkpoint["last_upload_id"]]
+        logger.info(f"Resuming the re-index after {checkpoint['last_upload_id']!r}, {len(upload_ids)} uploads left")
+    else:
+        checkpoint = {"last_upload_id": "", "indexed_count": 0, "failed_upload_ids": []}
+        logger.info(f"Re-indexing {total_count} uploads")
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def read_build_info(upload_id: str) -> Optional[BuildInfo]:
+        async with semaphore:
+            try:
+                return await asyncio.to_thread(storage.read_build_info_from_storage, upload_id)
+            except Exception as e:
+                logger.warning(f"Failed to read the build info of {upload_id!r}: {e}")
+                return None
+
+    started_at = time.monotonic()
+    for batch_start in range(0, len(upload_ids), batch_size):
+        batch = upload_ids[batch_start:batch_start + batch_size]
+        build_infos = await asyncio.gather(*(read_build_info(upload_id) for upload_id in batch))
+
+        await database.save_app_metadata_batch([
+            {**storage.get_app_metadata_row(build_info), "created_at": build_info.created_at}
+            for build_info in build_infos
+            if build_info is not None
+        ])
+
+        checkpoint["last_upload_id"] = batch[-1]
+        checkpoint["indexed_count"] += sum(build_info is not None for build_info in build_infos)
+        checkpoint["failed_upload_ids"] += [
+            upload_id for upload_id, build_info in zip(batch, build_infos) if build_info is None
+        ]
+        save_checkpoint(checkpoint_path, checkpoint)
+
+        done_count = batch_start + len(batch)
+        elapsed_seconds = time.monotonic() - started_at
+        logger.info(
+            f"Re-index progress: {total_count - len(upload_ids) + done_count}/{total_count} uploads"
+            f" ({len(checkpoint['failed_upload_ids'])} failed, {done_count / elapsed_seconds:.1f} uploads/s)"
+        )
+
+    app_records = await asyncio.to_thread(storage.list_stored_app_records)
+    for app_record in app_records:
+        await database.save_app_record(
+            app_record.bundle_id,
+            app_record.app_title,
+            app_record.app_description,
+            app_record.app_picture_url,
+        )
+
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    logger.info(
+        f"Re-indexed {checkpoint['indexed_count']} uploads and {len(app_records)} app records"
+        f" ({len(checkpoint['failed_upload_ids'])} uploads failed: {checkpoint['failed_upload_ids']})"
+    )
+    return {
+        "indexed_count": checkpoint["indexed_count"],
+        "failed_upload_ids": checkpoint["failed_upload_ids"],
+        "app_records_count": len(app_records),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=8, help="Uploads read from storage at once (default: 8)")
+    parser.add_argument("--batch-size", type=int, default=200, help="Uploads upserted per transaction (default: 200)")
+    parser.add_argument(
+        "--checkpoint",
+        default=DEFAULT_CHECKPOINT_PATH,
+        help=f"Progress file of interrupted runs (default: {DEFAULT_CHECKPOINT_PATH})",
+    )
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and re-index every upload")
+    args = parser.parse_args()
+
+    asyncio.run(reindex(args.concurrency, args.batch_size, args.checkpoint, args.restart))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Seekable readers over stored files that only download the byte ranges being read.
+
+`zipfile` seeks to the end of central directory, reads the central directory and
+then only the entries that are opened, so the metadata of a stored IPA or APK (a few
+KB of Info.plist or AndroidManifest.xml) is read without downloading the whole build.
+On S3 every missing block is a `Range` GET, local filesystems are read directly.
+"""
+import io
+import sys
+from collections import OrderedDict
+from typing import BinaryIO, Callable, Optional
+
+from fs.base import FS
+
+from app_distribution_server.config import REMOTE_ZIP_BLOCK_SIZE
+from app_distribution_server.logger import logger
+from app_distribution_server.storage_cache import CachedFS
+
+# The end of central directory and the central directory of large builds fit in a few blocks
+MAX_CACHED_BLOCKS = 64
+
+
+class RangedReader(io.RawIOBase):
+    """
+    Read-only file over `read_range(start, end)`, which returns the bytes in `[start, end)`.
+    Reads are aligned on blocks, adjacent missing blocks are fetched with a single request.
+    """
+
+    def __init__(
+        self,
+        read_range: Callable[[int, int], bytes],
+        size: int,
+        block_size: int = REMOTE_ZIP_BLOCK_SIZE,
+        name: Optional[str] = None,
+    ):
+        super().__init__()
+        self.read_range = read_range
+        self.size = size
+        self.block_size = max(block_size, 1)
+        self.name = name
+        self.request_count = 0
+        self.fetched_bytes = 0
+        self._position = 0
+        self._blocks: OrderedDict[int, bytes] = OrderedDict()
+
+    def __repr__(self):
+        return f"RangedReader({self.name!r}, size={self.size})"
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._position + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence ({whence!r})")
+
+        if position < 0:
+            raise OSError(f"Negative seek position {position}")
+
+        self._position = position
+        return position
+
+    def _fetch_blocks(self, first_block: int, last_block: int) -> bytes:
+        start = first_block * self.block_size
+        end = min((last_block + 1) * self.block_size, self.size)
+        content = self.read_range(start, end)
+        if len(content) != end - start:
+            raise OSError(f"Expected {end - start} bytes at offset {start} of {self.name!r}, got {len(content)}")
+
+        self.request_count += 1
+        self.fetched_bytes += len(content)
+        for block in range(first_block, last_block + 1):
+            offset = (block - first_block) * self.block_size
+            self._blocks[block] = content[offset:offset + self.block_size]
+            self._blocks.move_to_end(block)
+        while len(self._blocks) > MAX_CACHED_BLOCKS:
+            self._blocks.popitem(last=False)
+        return content
+
+    def readinto(self, buffer) -> int:
+        end = min(self._position + len(buffer), self.size)
+        if end <= self._position:
+            return 0
+
+        first_block = self._position // self.block_size
+        last_block = (end - 1) // self.block_size
+
+        # Large reads can evict their own first blocks, so pieces are kept aside
+        pieces = []
+        missing_block = None
+        for block in range(first_block, last_block + 2):
+            cached = self._blocks.get(block) if block <= last_block else None
+            if block <= last_block and cached is None:
+                if missing_block is None:
+                    missing_block = block
+                continue
+
+            if missing_block is not None:
+                pieces.append(self._fetch_blocks(missing_block, block - 1))
+                missing_block = None
+            if cached is not None:
+                pieces.append(cached)
+
+        # Touched once every run is fetched, a fetch may have evicted cached blocks of this read
+        for block in range(first_block, last_block + 1):
+            if block in self._blocks:
+                self._blocks.move_to_end(block)
+
+        content = b"".join(pieces)
+        offset = self._position - first_block * self.block_size
+        length = end - self._position
+        buffer[:length] = content[offset:offset + length]
+        self._position = end
+        return length
+
+
+def _is_s3_filesystem(filesystem: FS) -> bool:
+    # fs_s3fs (and boto3) are only imported once an s3:// storage URL is opened
+    s3fs_module = sys.modules.get("fs_s3fs")
+    return s3fs_module is not None and isinstance(filesystem, s3fs_module.S3FS)
+
+
+def _get_s3_range_reader(filesystem: FS, file_path: str) -> RangedReader:
+    # S3FS downloads whole objects when they are opened, ranges are requested on its client
+    bucket_name = filesystem._bucket_name
+    key = filesystem._path_to_key(file_path)
+
+    def read_range(start: int, end: int) -> bytes:
+        response = filesystem.client.get_object(Bucket=bucket_name, Key=key, Range=f"bytes={start}-{end - 1}")
+        return response["Body"].read()
+
+    return RangedReader(read_range, filesystem.getsize(file_path), name=file_path)
+
+
+def open_ranged_reader(filesystem: FS, file_path: str) -> BinaryIO:
+    """
+    Seekable binary file of a stored file. Files already in the storage cache are read
+    locally, S3 objects with ranged requests and other filesystems are opened as is.
+    """
+    if isinstance(filesystem, CachedFS):
+        local_path = filesystem.get_cached_path(file_path)
+        if local_path is not None:
+            try:
+                return open(local_path, "rb")
+            except FileNotFoundError:
+                # Evicted between lookup and open
+                pass
+        filesystem, file_path = filesystem.delegate_path(file_path)
+
+    if _is_s3_filesystem(filesystem):
+        logger.debug(f"Reading {file_path!r} with ranged requests")
+        return _get_s3_range_reader(filesystem, file_path)
+
+    return filesystem.openbin(file_path, "r")
@@ -0,0 +1,223 @@
+"""
+Retention policies pruning old builds.
+
+A build is kept when any configured policy keeps it: it is among the last N builds
+of its bundle/platform, or it is newer than X days. Pinned builds, the latest build
+of each bundle/platform, the build marked latest for each bundle and builds of unknown
+upload date are always kept. Deletions run in rate limited batches.
+"""
+import asyncio
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from pydantic import BaseModel
+
+from app_distribution_server.build_info import BuildInfo, Platform
+from app_distribution_server.config import (
+    RETENTION_BATCH_PAUSE_SECONDS,
+    RETENTION_BATCH_SIZE,
+    RETENTION_DELETE_INTERVAL_SECONDS,
+    RETENTION_DRY_RUN,
+    RETENTION_INTERVAL_SECONDS,
+    RETENTION_KEEP_DAYS,
+    RETENTION_KEEP_LAST_BUILDS,
+)
+from app_distribution_server.logger import logger
+from app_distribution_server.storage import (
+    delete_upload,
+    get_latest_upload_id_by_bundle_id,
+    list_upload_ids,
+    load_build_info,
+    load_pinned_upload_ids,
+)
+
+
+class RetentionPolicy(BaseModel):
+    keep_last_builds: Optional[int] = RETENTION_KEEP_LAST_BUILDS
+    keep_days: Optional[int] = RETENTION_KEEP_DAYS
+
+    @property
+    def is_configured(self) -> bool:
+        return self.keep_last_builds is not None or self.keep_days is not None
+
+
+class RetentionCandidate(BaseModel):
+    upload_id: str
+    bundle_id: str
+    platform: Platform
+    bundle_version: str
+    created_at: Optional[datetime]
+    file_size: int
+
+
+class RetentionReport(BaseModel):
+    dry_run: bool
+    policy: RetentionPolicy
+    started_at: datetime
+    finished_at: Optional[datetime] = None
+    scanned_builds: int = 0
+    kept_builds: int = 0
+    candidates: list[RetentionCandidate] = []
+    deleted_builds: int = 0
+    reclaimed_bytes: int = 0
+    failed_upload_ids: list[str] = []
+
+
+class RetentionMetrics(BaseModel):
+    runs: int = 0
+    deleted_builds: int = 0
+    reclaimed_bytes: int = 0
+    last_report: Optional[RetentionReport] = None
+
+
+retention_metrics = RetentionMetrics()
+
+_retention_lock = asyncio.Lock()
+
+
+def _created_at_sort_key(build_info: BuildInfo):
+    if build_info.created_at is None:
+        return datetime.min.replace(tzinfo=timezone.utc)
+
+    if build_info.created_at.tzinfo is None:
+        return build_info.created_at.replace(tzinfo=timezone.utc)
+
+    return build_info.created_at
+
+
+async def _load_all_builds() -> list[BuildInfo]:
+    builds = []
+
+    for upload_id in await asyncio.to_thread(lambda: list(list_upload_ids())):
+        # Placeholder uploads created from the admin hold app metadata, not builds
+        if upload_id.startswith("dummy-"):
+            continue
+
+        try:
+            build_info = await load_build_info(upload_id)
+        except Exception as e:
+            logger.warning(f"Retention skipped upload {upload_id!r}: {e}")
+            continue
+
+        # Never act on the placeholder returned when the build info could not be read
+        if build_info.bundle_id == "unknown":
+            continue
+
+        builds.append(build_info)
+
+    return builds
+
+
+async def plan_retention(policy: RetentionPolicy, report: RetentionReport):
+    builds = await _load_all_builds()
+    report.scanned_builds = len(builds)
+
+    if not policy.is_configured:
+        report.kept_builds = len(builds)
+        return
+
+    pinned_upload_ids = await asyncio.to_thread(load_pinned_upload_ids)
+    keep_newer_than = (
+        datetime.now(timezone.utc) - timedelta(days=policy.keep_days)
+        if policy.keep_days is not None
+        else None
+    )
+
+    builds_by_bundle_and_platform = defaultdict(list)
+    for build_info in builds:
+        builds_by_bundle_and_platform[(build_info.bundle_id, build_info.platform)].append(build_info)
+
+    for (bundle_id, _), bundle_builds in builds_by_bundle_and_platform.items():
+        latest_upload_id = await asyncio.to_thread(get_latest_upload_id_by_bundle_id, bundle_id)
+        bundle_builds.sort(key=_created_at_sort_key, reverse=True)
+
+        for position, build_info in enumerate(bundle_builds):
+            keep = (
+                build_info.upload_id in pinned_upload_ids
+                or position == 0
+                # Their age is unknown, deleting them could remove recent builds
+                or build_info.created_at is None
+                or build_info.upload_id == latest_upload_id
+                or (policy.keep_last_builds is not None and position < policy.keep_last_builds)
+                or (
+                    keep_newer_than is not None
+                    and _created_at_sort_key(build_info) >= keep_newer_than
+                )
+            )
+
+            if keep:
+                report.kept_builds += 1
+                continue
+
+            report.candidates.append(
+                RetentionCandidate(
+                    upload_id=build_info.upload_id,
+                    bundle_id=build_info.bundle_id,
+                    platform=build_info.platform,
+                    bundle_version=build_info.bundle_version,
+                    created_at=build_info.created_at,
+                    file_size=build_info.file_size or 0,
+                ),
+            )
+
+
+async def apply_retention(
+    policy: Optional[RetentionPolicy] = None,
+    dry_run: bool = RETENTION_DRY_RUN,
+) -> RetentionReport:
+    policy = policy or RetentionPolicy()
+    report = RetentionReport(
+        dry_run=dry_run,
+        policy=policy,
+        started_at=datetime.now(timezone.utc),
+    )
+
+    async with _retention_lock:
+        await plan_retention(policy, report)
+
+        if not dry_run:
+            for index, candidate in enumerate(report.candidates, start=1):
+                try:
+                    await delete_upload(candidate.upload_id)
+                    report.deleted_builds += 1
+                    report.reclaimed_bytes += candidate.file_size
+                except Exception as e:
+                    logger.warning(f"Retention failed to delete {candidate.upload_id!r}: {e}")
+                    report.failed_upload_ids.append(candidate.upload_id)
+
+                if index % max(RETENTION_BATCH_SIZE, 1) == 0:
+                    await asyncio.sleep(RETENTION_BATCH_PAUSE_SECONDS)
+                else:
+                    await asyncio.sleep(RETENTION_DELETE_INTERVAL_SECONDS)
+
+        report.finished_at = datetime.now(timezone.utc)
+
+        # Reports (dry runs) leave the metrics of actual runs untouched
+        if not dry_run:
+            retention_metrics.runs += 1
+            retention_metrics.deleted_builds += report.deleted_builds
+            retention_metrics.reclaimed_bytes += report.reclaimed_bytes
+            retention_metrics.last_report = report
+
+    logger.info(
+        f"Retention {'dry run' if dry_run else 'run'} finished:"
+        f" {len(report.candidates)} of {report.scanned_builds} builds eligible for deletion,"
+        f" {report.deleted_builds} deleted, {report.reclaimed_bytes} bytes reclaimed"
+    )
+
+    return report
+
+
+async def run_retention_scheduler():
+    if RETENTION_INTERVAL_SECONDS <= 0 or not RetentionPolicy().is_configured:
+        return
+
+    logger.info(f"Retention scheduler started, running every {RETENTION_INTERVAL_SECONDS}s")
+
+    while True:
+        await asyncio.sleep(RETENTION_INTERVAL_SECONDS)
+        try:
+            await apply_retention()
+        except Exception:
+            logger.exception("Retention run failed")
@@ -1,36 +1,66 @@
+import asyncio
+import base64
+import hashlib
+import io
 import secrets
+import time
 import os
 import json
 import datetime
 from collections import defaultdict
+from typing import Optional
 
-from fastapi import APIRouter, Depends, File, Path, UploadFile, Query, Request
-from fastapi.responses import PlainTextResponse, JSONResponse
+from fastapi import APIRouter, Depends, File, HTTPException, Path, UploadFile, Query, Request, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import PlainTextResponse, JSONResponse, StreamingResponse
 from fastapi.security import APIKeyHeader
+from pydantic import BaseModel
 
 from app_distribution_server.build_info import (
+    ApkVariant,
     BuildInfo,
     Platform,
+    get_apk_variant,
     get_build_info,
+    read_apks_standalone_apks,
 )
 from app_distribution_server.config import (
+    ADMIN_DASHBOARD_CACHE_TTL_SECONDS,
+    EVENTS_KEEPALIVE_SECONDS,
+    RETENTION_DRY_RUN,
+    UPLOAD_BATCH_CONCURRENCY,
     UPLOADS_SECRET_AUTH_TOKEN,
     get_absolute_url,
 )
 from app_distribution_server.errors import (
+    InternalServerError,
+    InvalidApkVariantError,
     InvalidFileTypeError,
     NotFoundError,
     UnauthorizedError,
 )
+from app_distribution_server.deltas import DeltaMetrics, delta_metrics
+from app_distribution_server.events import Event, event_broker
 from app_distribution_server.logger import logger
 from app_distribution_server.storage import (
     delete_upload,
     get_latest_upload_id_by_bundle_id,
     get_upload_asserted_platform,
     load_build_info,
+    save_apk_variants,
     save_upload,
+    set_upload_pinned,
 )
-from app_distribution_server.routers.html_router import load_reviews, get_current_user
+from app_distribution_server.retention import (
+    RetentionMetrics,
+    RetentionPolicy,
+    RetentionReport,
+    apply_retention,
+    retention_metrics,
+)
+from app_distribution_server.routers.app_files_router import log_download
+from app_distribution_server.routers.html_router import load_recent_reviews, get_current_user
+from app_distribution_server.upload_jobs import UploadJob, get_upload_job, submit_upload_job
 
 x_auth_token_dependency = APIKeyHeader(name="X-Auth-Token")
 
@@ -48,26 +78,24 @@ router = APIRouter(
 )
 
 
-async def _upload_app(
-    app_file: UploadFile,
-) -> BuildInfo:
-    platform: Platform
-
-    if app_file.filename is None:
+def get_platform_from_file_name(file_name: Optional[str]) -> Platform:
+    if file_name is None:
         raise InvalidFileTypeError()
 
-    if app_file.filename.endswith(".ipa"):
-        platform = Platform.ios
+    if file_name.endswith(".ipa"):
+        return Platform.ios
 
-    elif app_file.filename.endswith(".apk"):
-        platform = Platform.android
+    if file_name.endswith(".apk"):
+        return Platform.android
 
-    else:
-        raise InvalidFileTypeError()
+    raise InvalidFileTypeError()
 
-    app_file_content = app_file.file.read()
 
-    build_info = get_build_info(platform, app_file_content)
+async def process_upload(
+    platform: Platform,
+    app_file_content: bytes,
+) -> BuildInfo:
+    build_info = await asyncio.to_thread(get_build_info, platform, app_file_content)
     upload_id = build_info.upload_id
 
     logger.debug(f"Starting upload of {upload_id!r}")
@@ -79,6 +107,15 @@ async def _upload_app(
     return build_info
 
 
+async def _upload_app(
+    app_file: UploadFile,
+) -> BuildInfo:
+    platform = get_platform_from_file_name(app_file.filename)
+    app_file_content = app_file.file.read()
+
+    return await process_upload(platform, app_file_content)
+
+
 _upload_route_kwargs = {
     "responses": {
         InvalidFileTypeError.STATUS_CODE: {
@@ -104,17 +141,180 @@ async def _plaintext_post_upload(
     )
 
 
-@router.post("/api/upload", **_upload_route_kwargs)
+_json_upload_route_kwargs = {
+    **_upload_route_kwargs,
+    "responses": {
+        **_upload_route_kwargs["responses"],
+        status.HTTP_202_ACCEPTED: {
+            "model": UploadJob,
+            "description": "Upload accepted for background processing (`async=true`).",
+        },
+    },
+}
+
+
+@router.post("/api/upload", **_json_upload_route_kwargs)
 async def _json_api_post_upload(
     app_file: UploadFile = File(description="An `.ipa` or `.apk` build"),
+    async_processing: bool = Query(
+        False,
+        alias="async",
+        description="Process the build in the background and return a job to poll",
+    ),
+) -> BuildInfo:
+    if not async_processing:
+        return await _upload_app(app_file)
+
+    upload_job = await submit_upload_job(
+        file_name=app_file.filename,
+        platform=get_platform_from_file_name(app_file.filename),
+        file=app_file.file,
+        processor=process_upload,
+    )
+
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content=jsonable_encoder(upload_job),
+        headers={"Location": f"/api/upload/jobs/{upload_job.job_id}"},
+    )
+
+
+class BatchUploadResult(BaseModel):
+    file_name: Optional[str]
+    success: bool
+    build_info: Optional[BuildInfo] = None
+    error: Optional[str] = None
+
+
+async def _upload_batch_item(
+    app_file: UploadFile,
+    semaphore: asyncio.Semaphore,
+) -> BatchUploadResult:
+    async with semaphore:
+        try:
+            platform = get_platform_from_file_name(app_file.filename)
+            app_file_content = await app_file.read()
+            build_info = await process_upload(platform, app_file_content)
+
+        except HTTPException as exception:
+            logger.warning(f"Batch upload of {app_file.filename!r} failed: {exception.detail}")
+            return BatchUploadResult(
+                file_name=app_file.filename,
+                success=False,
+                error=exception.detail,
+            )
+
+        except Exception:
+            logger.exception(f"Batch upload of {app_file.filename!r} failed unexpectedly")
+            return BatchUploadResult(
+                file_name=app_file.filename,
+                success=False,
+                error=InternalServerError.ERROR_MESSAGE,
+            )
+
+    return BatchUploadResult(
+        file_name=app_file.filename,
+        success=True,
+        build_info=build_info,
+    )
+
+
+@router.post(
+    "/api/upload/batch",
+    summary="Upload several iOS/Android app builds at once",
+    description=(
+        "Builds are parsed and stored concurrently once the request is received."
+        " Each file gets its own result, a failing file does not abort the others."
+    ),
+    responses={
+        UnauthorizedError.STATUS_CODE: {
+            "description": UnauthorizedError.ERROR_MESSAGE,
+        },
+    },
+)
+async def api_post_upload_batch(
+    app_files: list[UploadFile] = File(description="Several `.ipa` and/or `.apk` builds"),
+) -> list[BatchUploadResult]:
+    # The whole body is received before this runs: parsing and storage writes of the files
+    # overlap with each other, not with the transfer
+    semaphore = asyncio.Semaphore(max(UPLOAD_BATCH_CONCURRENCY, 1))
+
+    return await asyncio.gather(
+        *(_upload_batch_item(app_file, semaphore) for app_file in app_files),
+    )
+
+
+@router.get(
+    "/api/upload/jobs/{job_id}",
+    summary="Retrieve the status of a background upload job",
+    responses={
+        NotFoundError.STATUS_CODE: {
+            "description": NotFoundError.ERROR_MESSAGE,
+        },
+    },
+)
+async def api_get_upload_job(
+    job_id: str = Path(),
+) -> UploadJob:
+    upload_job = get_upload_job(job_id)
+
+    if upload_job is None:
+        raise NotFoundError()
+
+    return upload_job
+
+
+def read_apk_variants(build_info: BuildInfo, file_name: Optional[str], content: bytes) -> list[tuple[ApkVariant, bytes]]:
+    if file_name is not None and file_name.endswith(".apks"):
+        apk_contents = read_apks_standalone_apks(io.BytesIO(content))
+    elif file_name is not None and file_name.endswith(".apk"):
+        apk_contents = [content]
+    else:
+        raise InvalidFileTypeError()
+
+    if not apk_contents:
+        raise InvalidApkVariantError()
+
+    return [(get_apk_variant(build_info, io.BytesIO(apk_content)), apk_content) for apk_content in apk_contents]
+
+
+@router.post(
+    "/api/upload/{upload_id}/variants",
+    summary="Add ABI-specific APKs to an Android upload",
+    description=(
+        "Downloads of the upload then get the smallest variant for the ABIs of the device,"
+        " the universal APK stays the fallback. A variant replaces the one for the same ABIs."
+    ),
+    responses={
+        InvalidApkVariantError.STATUS_CODE: {
+            "description": InvalidApkVariantError.ERROR_MESSAGE,
+        },
+        UnauthorizedError.STATUS_CODE: {
+            "description": UnauthorizedError.ERROR_MESSAGE,
+        },
+    },
+)
+async def api_post_apk_variants(
+    upload_id: str = Path(),
+    variant_files: list[UploadFile] = File(
+        description="ABI-specific `.apk` builds, or `.apks` archives from `bundletool build-apks`",
+    ),
 ) -> BuildInfo:
-    return await _upload_app(app_file)
+    await get_upload_asserted_platform(upload_id, expected_platform=Platform.android)
+    build_info = await load_build_info(upload_id)
+
+    variants = []
+    for variant_file in variant_files:
+        content = await variant_file.read()
+        variants += await asyncio.to_thread(read_apk_variants, build_info, variant_file.filename, content)
+
+    return await save_apk_variants(upload_id, variants)
 
 
 async def _api_delete_app_upload(
     upload_id: str = Path(),
 ) -> PlainTextResponse:
-    get_upload_asserted_platform(upload_id)
+    await get_upload_asserted_platform(upload_id)
 
     await delete_upload(upload_id)
     logger.info(f"Upload {upload_id!r} deleted successfully")
@@ -150,69 +350,174 @@ async def api_get_latest_upload_by_bundle_id(
     if not upload_id:
         raise NotFoundError()
 
-    get_upload_asserted_platform(upload_id)
+    await get_upload_asserted_platform(upload_id)
     return await load_build_info(upload_id)
 
 
+class EdgeDownloadEvent(BaseModel):
+    upload_id: str
+    timestamp: Optional[datetime.datetime] = None
+    ip: Optional[str] = None
+
+
+@router.post(
+    "/api/downloads/ingest",
+    summary="Count downloads served by a CDN from its edge logs",
+    description="Entries whose upload cannot be found are skipped.",
+)
+async def api_ingest_edge_downloads(
+    events: list[EdgeDownloadEvent],
+) -> dict:
+    ingested_count = 0
+
+    for event in events:
+        try:
+            build_info = await load_build_info(event.upload_id)
+        except Exception as e:
+            logger.warning(f"Skipping edge download of {event.upload_id!r}: {e}")
+            continue
+
+        log_download(build_info, event.ip or "unknown", event.timestamp)
+        ingested_count += 1
+
+    return {"ingested": ingested_count, "skipped": len(events) - ingested_count}
+
+
+@router.post(
+    "/api/pin/{upload_id}",
+    summary="Pin an upload so retention policies never delete it",
+    response_class=PlainTextResponse,
+)
+async def api_pin_upload(
+    upload_id: str = Path(),
+) -> PlainTextResponse:
+    await get_upload_asserted_platform(upload_id)
+
+    await asyncio.to_thread(set_upload_pinned, upload_id, True)
+
+    return PlainTextResponse(content="Upload pinned successfully")
+
+
+@router.delete(
+    "/api/pin/{upload_id}",
+    summary="Unpin an upload, making it subject to retention policies again",
+    response_class=PlainTextResponse,
+)
+async def api_unpin_upload(
+    upload_id: str = Path(),
+) -> PlainTextResponse:
+    await asyncio.to_thread(set_upload_pinned, upload_id, False)
+
+    return PlainTextResponse(content="Upload unpinned successfully")
+
+
+@router.get(
+    "/api/retention/report",
+    summary="Dry run of the retention policies: list the builds that would be deleted",
+)
+async def api_get_retention_report(
+    keep_last_builds: Optional[int] = Query(None, ge=1),
+    keep_days: Optional[int] = Query(None, ge=1),
+) -> RetentionReport:
+    policy = RetentionPolicy()
+    if keep_last_builds is not None or keep_days is not None:
+        policy = RetentionPolicy(keep_last_builds=keep_last_builds, keep_days=keep_days)
+
+    return await apply_retention(policy, dry_run=True)
+
+
+@router.post(
+    "/api/retention/run",
+    summary="Apply the configured retention policies now",
+)
+async def api_run_retention(
+    dry_run: bool = Query(RETENTION_DRY_RUN),
+) -> RetentionReport:
+    return await apply_retention(dry_run=dry_run)
+
+
+@router.get(
+    "/api/retention/metrics",
+    summary="Retention runs, deleted builds and reclaimed bytes since the server started",
+)
+async def api_get_retention_metrics() -> RetentionMetrics:
+    return retention_metrics
+
+
+@router.get(
+    "/api/deltas/metrics",
+    summary="Android deltas built and served, and bytes saved over full downloads since the server started",
+)
+async def api_get_delta_metrics() -> DeltaMetrics:
+    return delta_metrics
+
+
 # Move this endpoint outside the router with API key dependency
 download_stats_router = APIRouter(tags=["Admin Stats"])
 
-@download_stats_router.get("/admin/api/download-stats", response_class=JSONResponse)
-async def download_stats(
-    group_by: str = Query("day", enum=["day", "month", "year"]),
-    bundle_id: str = Query(None)
-):
-    log_path = os.path.join("logs", "downloads.log")
+def iter_log_entries(log_name: str, start: int = 0, end: Optional[int] = None):
+    """Yields (entry, offset after it) for the JSON lines of a log between byte offsets."""
+    log_path = os.path.join("logs", log_name)
     if not os.path.exists(log_path):
-        return {"data": []}
-    counts = defaultdict(int)
-    with open(log_path, "r") as f:
-        for line in f:
+        return
+    with open(log_path, "rb") as f:
+        if end is None:
+            end = os.fstat(f.fileno()).st_size
+        f.seek(start)
+        offset = start
+        while offset < end:
+            line = f.readline()
+            # Stop at a line that is still being written
+            if not line.endswith(b"\n"):
+                break
+            offset += len(line)
             try:
-                entry = json.loads(line)
-                if bundle_id and entry.get("bundle_id") != bundle_id:
-                    continue
-                ts = entry.get("timestamp")
-                dt = datetime.datetime.fromisoformat(ts)
-                if group_by == "day":
-                    key = dt.strftime("%Y-%m-%d")
-                elif group_by == "month":
-                    key = dt.strftime("%Y-%m")
-                else:
-                    key = dt.strftime("%Y")
-                counts[key] += 1
-            except Exception:
+                yield json.loads(line), offset
+            except ValueError:
                 continue
-    data = [{"period": k, "count": v} for k, v in sorted(counts.items())]
-    return {"data": data}
 
-@download_stats_router.get("/admin/api/activity", response_class=JSONResponse)
-async def activity_feed(request: Request, limit: int = Query(10)):
-    user = await get_current_user(request)
-    if user.get("role") not in ["owner", "admin"]:
-        return JSONResponse({"error": "forbidden"}, status_code=403)
-    lang = request.cookies.get("lang", "en")
-    log_path = os.path.join("logs", "activity.log")
-    if not os.path.exists(log_path):
-        return {"data": []}
-    lines = []
-    with open(log_path, "r") as f:
-        for line in f:
-            try:
-                lines.append(json.loads(line))
-            except Exception:
-                continue
+def get_download_period(entry: dict, group_by: str) -> str:
+    dt = datetime.datetime.fromisoformat(entry.get("timestamp"))
+    if group_by == "day":
+        return dt.strftime("%Y-%m-%d")
+    elif group_by == "month":
+        return dt.strftime("%Y-%m")
+    return dt.strftime("%Y")
+
+def count_downloads(group_by: str, bundle_id: Optional[str] = None, start: int = 0,
+                    end: Optional[int] = None) -> tuple[dict[str, int], int]:
+    """Counts downloads per period, returns the counts and the log offset they cover."""
+    counts = defaultdict(int)
+    offset = start
+    for entry, offset in iter_log_entries("downloads.log", start, end):
+        if bundle_id and entry.get("bundle_id") != bundle_id:
+            continue
+        try:
+            counts[get_download_period(entry, group_by)] += 1
+        except Exception:
+            continue
+    return counts, offset
+
+def read_activity_entries(limit: int, start: int = 0, end: Optional[int] = None) -> tuple[list[dict], int]:
+    """Reads the newest activity entries, returns them and the log offset they cover."""
+    entries = []
+    offset = start
+    for entry, offset in iter_log_entries("activity.log", start, end):
+        entries.append(entry)
     # Sort by timestamp descending
-    lines = sorted(lines, key=lambda x: x.get("timestamp", ""), reverse=True)[:limit]
-    # Load translations
+    return sorted(entries, key=lambda x: x.get("timestamp", ""), reverse=True)[:limit], offset
+
+def load_activity_translations(lang: str) -> dict:
     try:
         with open(os.path.join("translations", f"{lang}.json"), "r") as tf:
-            translations = json.load(tf)
+            return json.load(tf)
     except Exception:
         with open(os.path.join("translations", "en.json"), "r") as tf:
-            translations = json.load(tf)
+            return json.load(tf)
+
+def format_activity_messages(entries: list[dict], translations: dict) -> list[dict]:
     messages = []
-    for entry in lines:
+    for entry in entries:
         user = entry.get("username", "admin")
         if entry["type"] == "create_app":
             msg = translations["activity_created_app"].format(user=user, app=entry.get('app_title'), id=entry.get('bundle_id'))
@@ -227,33 +532,184 @@ async def activity_feed(request: Request, limit: int = Query(10)):
         else:
             msg = translations["activity_default"].format(user=user)
         messages.append({"timestamp": entry.get("timestamp"), "message": msg})
-    return {"data": messages}
+    return messages
+
+@download_stats_router.get("/admin/api/download-stats", response_class=JSONResponse)
+async def download_stats(
+    group_by: str = Query("day", enum=["day", "month", "year"]),
+    bundle_id: str = Query(None)
+):
+    counts, _ = await asyncio.to_thread(count_downloads, group_by, bundle_id)
+    data = [{"period": k, "count": v} for k, v in sorted(counts.items())]
+    return {"data": data}
+
+@download_stats_router.get("/admin/api/activity", response_class=JSONResponse)
+async def activity_feed(request: Request, limit: int = Query(10)):
+    user = await get_current_user(request)
+    if user.get("role") not in ["owner", "admin"]:
+        return JSONResponse({"error": "forbidden"}, status_code=403)
+    lang = request.cookies.get("lang", "en")
+    entries, _ = await asyncio.to_thread(read_activity_entries, limit)
+    return {"data": format_activity_messages(entries, load_activity_translations(lang))}
+
+async def load_review_app_info(bundle_id: str) -> dict:
+    app_info = {
+        "app_title": bundle_id,
+        "app_picture_url": None,
+        "app_page_url": f"/app/{bundle_id}",
+    }
+    try:
+        upload_id = await asyncio.to_thread(get_latest_upload_id_by_bundle_id, bundle_id)
+        if upload_id:
+            build = await load_build_info(upload_id)
+            app_info["app_title"] = build.app_title
+            app_info["app_picture_url"] = build.get_picture_url(128)
+    except Exception:
+        pass
+    return app_info
+
+async def get_recent_reviews(limit: int) -> list[dict]:
+    reviews = await load_recent_reviews(max(1, min(limit, 100)))
+    # Attach app info to each review, looking up each app once
+    bundle_ids = list(dict.fromkeys(r["bundle_id"] for r in reviews))
+    app_infos = dict(zip(bundle_ids, await asyncio.gather(*map(load_review_app_info, bundle_ids))))
+    for r in reviews:
+        r.update(app_infos[r["bundle_id"]])
+    return reviews
 
 @download_stats_router.get("/admin/api/recent-reviews", response_class=JSONResponse)
 async def recent_reviews(request: Request, limit: int = 20):
     user = await get_current_user(request)
     if user["role"] not in ["owner", "admin"]:
         return JSONResponse({"error": "forbidden"}, status_code=403)
-    reviews = await load_reviews()
-    reviews = sorted(reviews, key=lambda r: r.get("timestamp", 0), reverse=True)[:limit]
-    # Attach app info to each review
-    for r in reviews:
-        upload_id = get_latest_upload_id_by_bundle_id(r["bundle_id"])
-        if upload_id:
-            try:
-                build = await load_build_info(upload_id)
-                r["app_title"] = build.app_title
-                r["app_picture_url"] = build.app_picture_url
-                r["app_page_url"] = f"/app/{build.bundle_id}"
-            except Exception:
-                r["app_title"] = r["bundle_id"]
-                r["app_picture_url"] = None
-                r["app_page_url"] = f"/app/{r['bundle_id']}"
-        else:
-            r["app_title"] = r["bundle_id"]
-            r["app_picture_url"] = None
-            r["app_page_url"] = f"/app/{r['bundle_id']}"
-    return {"reviews": reviews}
+    return {"reviews": await get_recent_reviews(limit)}
+
+# Snapshots shared by all admins, keyed by (group_by, activity_limit, reviews_limit)
+_dashboard_snapshots: dict[tuple, tuple[float, dict]] = {}
+_dashboard_snapshot_lock = asyncio.Lock()
+
+async def get_dashboard_snapshot(group_by: str, activity_limit: int, reviews_limit: int) -> dict:
+    key = (group_by, activity_limit, reviews_limit)
+    async with _dashboard_snapshot_lock:
+        cached = _dashboard_snapshots.get(key)
+        if cached and time.monotonic() - cached[0] < ADMIN_DASHBOARD_CACHE_TTL_SECONDS:
+            return cached[1]
+
+        (activity, activity_offset), (download_counts, downloads_offset), reviews = await asyncio.gather(
+            asyncio.to_thread(read_activity_entries, activity_limit),
+            asyncio.to_thread(count_downloads, group_by),
+            get_recent_reviews(reviews_limit),
+        )
+        reviews = jsonable_encoder(reviews)
+        snapshot = {
+            "activity": activity,
+            "activity_offset": activity_offset,
+            "download_counts": download_counts,
+            "downloads_offset": downloads_offset,
+            "reviews": reviews,
+            "reviews_hash": hashlib.sha1(json.dumps(reviews, sort_keys=True).encode()).hexdigest(),
+        }
+        _dashboard_snapshots[key] = (time.monotonic(), snapshot)
+        return snapshot
+
+def encode_dashboard_cursor(snapshot: dict) -> str:
+    cursor = [snapshot["activity_offset"], snapshot["downloads_offset"], snapshot["reviews_hash"]]
+    return base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+
+def decode_dashboard_cursor(cursor: Optional[str]) -> Optional[tuple[int, int, str]]:
+    if not cursor:
+        return None
+    try:
+        activity_offset, downloads_offset, reviews_hash = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return int(activity_offset), int(downloads_offset), str(reviews_hash)
+    except (ValueError, TypeError):
+        return None
+
+@download_stats_router.get("/admin/api/dashboard", response_class=JSONResponse)
+async def dashboard(
+    request: Request,
+    group_by: str = Query("day", enum=["day", "month", "year"]),
+    activity_limit: int = Query(10, ge=1, le=100),
+    reviews_limit: int = Query(20, ge=1, le=100),
+    since: str = Query(None, description="Cursor of a previous response, to only get what changed since"),
+):
+    """Activity, download stats and recent reviews in one response.
+    With `since`, only new activity, the download periods that changed and the
+    reviews if they changed (otherwise `null`) are returned."""
+    user = await get_current_user(request)
+    if user.get("role") not in ["owner", "admin"]:
+        return JSONResponse({"error": "forbidden"}, status_code=403)
+
+    snapshot = await get_dashboard_snapshot(group_by, activity_limit, reviews_limit)
+    translations = load_activity_translations(request.cookies.get("lang", "en"))
+    response = {
+        "cursor": encode_dashboard_cursor(snapshot),
+        "full": True,
+        "activity": format_activity_messages(snapshot["activity"], translations),
+        "download_stats": [{"period": k, "count": v} for k, v in sorted(snapshot["download_counts"].items())],
+        "recent_reviews": snapshot["reviews"],
+    }
+
+    cursor = decode_dashboard_cursor(since)
+    # Logs are append only, a cursor past their end means they were rotated
+    if cursor is None or cursor[0] > snapshot["activity_offset"] or cursor[1] > snapshot["downloads_offset"]:
+        return response
+
+    activity_offset, downloads_offset, reviews_hash = cursor
+    (new_activity, _), (new_downloads, _) = await asyncio.gather(
+        asyncio.to_thread(read_activity_entries, activity_limit, activity_offset, snapshot["activity_offset"]),
+        asyncio.to_thread(count_downloads, group_by, None, downloads_offset, snapshot["downloads_offset"]),
+    )
+    response.update({
+        "full": False,
+        "activity": format_activity_messages(new_activity, translations),
+        # Full counts of the periods that got new downloads
+        "download_stats": [
+            {"period": k, "count": snapshot["download_counts"][k]} for k in sorted(new_downloads)
+        ],
+        "recent_reviews": None if reviews_hash == snapshot["reviews_hash"] else snapshot["reviews"],
+    })
+    return response
+
+def format_server_sent_event(event: Event, translations: dict) -> str:
+    data = event.data
+    if event.type == "activity":
+        data = format_activity_messages([data], translations)[0]
+    return f"id: {event.id}\nevent: {event.type}\ndata: {json.dumps(data)}\n\n"
+
+@download_stats_router.get("/admin/api/events")
+async def admin_events(request: Request):
+    """Server-sent events: `download`, `upload` and `activity` as they happen.
+    A `resync` event means events were dropped for this (slow) client, reload the
+    dashboard snapshot to catch up."""
+    user = await get_current_user(request)
+    if user.get("role") not in ["owner", "admin"]:
+        return JSONResponse({"error": "forbidden"}, status_code=403)
+
+    translations = load_activity_translations(request.cookies.get("lang", "en"))
+    subscription = event_broker.subscribe()
+
+    async def stream():
+        try:
+            yield "retry: 5000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(subscription.get(), timeout=EVENTS_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if subscription.dropped_events:
+                    subscription.dropped_events = 0
+                    yield "event: resync\ndata: {}\n\n"
+                yield format_server_sent_event(event, translations)
+        finally:
+            event_broker.unsubscribe(subscription)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @download_stats_router.get("/admin/api/unique-downloads", response_class=JSONResponse)
 async def unique_downloads(bundle_id: str):
@@ -1,28 +1,59 @@
-from typing import Literal
+from email.utils import format_datetime
+from typing import Literal, Optional
 from urllib.parse import quote
+import asyncio
 import datetime
+import hashlib
 import json
 import os
+import re
 
-from fastapi import APIRouter, Request, Response
-from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
+from fastapi import APIRouter, Query, Request, Response
+from fastapi.responses import HTMLResponse, RedirectResponse
 
 from app_distribution_server.build_info import (
+    ANDROID_ABIS,
+    ApkVariant,
+    BuildInfo,
     Platform,
+    select_apk_variant,
 )
+from app_distribution_server import cdn, deltas
+from app_distribution_server.events import event_broker
 from app_distribution_server.config import (
-    get_absolute_url,
+    CDN_MODE,
 )
+from app_distribution_server.errors import NotFoundError
+from app_distribution_server.install_artifacts import PLIST_FILE_NAME, QR_CODE_FILE_NAME, InstallArtifact
 from app_distribution_server.storage import (
+    ensure_install_artifact,
+    get_app_picture_directory,
+    get_delta_size,
+    get_icons_directory,
     get_upload_asserted_platform,
+    load_apk_variant_file,
     load_app_file,
     load_build_info,
+    load_delta,
+    load_icon,
 )
 
 router = APIRouter(tags=["App files"])
 
-templates = Jinja2Templates(directory="templates")
+
+def get_install_artifact_response(request: Request, artifact: Optional[InstallArtifact], upload_id: str) -> Response:
+    if artifact is None:
+        raise NotFoundError()
+
+    headers = {
+        "ETag": artifact.etag,
+        # Regenerated when APP_BASE_URL changes, which purges the upload key
+        **cdn.page_cache_headers(cdn.get_upload_surrogate_key(upload_id)),
+    }
+    if artifact.etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+
+    return Response(content=artifact.content, media_type=artifact.media_type, headers=headers)
 
 
 @router.get(
@@ -32,54 +63,67 @@ templates = Jinja2Templates(directory="templates")
 async def get_item_plist(
     request: Request,
     upload_id: str,
-) -> HTMLResponse:
-    get_upload_asserted_platform(
-        upload_id,
-        expected_platform=Platform.ios,
-    )
-
-    build_info = await load_build_info(upload_id)
+) -> Response:
+    artifact = await ensure_install_artifact(upload_id, PLIST_FILE_NAME)
 
-    return templates.TemplateResponse(
-        request=request,
-        name="plist.xml",
-        media_type="application/xml",
-        context={
-            "ipa_file_url": get_absolute_url(f"/get/{upload_id}/{Platform.ios.app_file_name}"),
-            "app_title": build_info.app_title,
-            "bundle_id": build_info.bundle_id,
-            "bundle_version": build_info.bundle_version,
-        },
-    )
+    return get_install_artifact_response(request, artifact, upload_id)
 
 
-@router.get(
-    "/get/{upload_id}/app.{file_type}",
-    response_class=HTMLResponse,
-)
-async def get_app_file(
+@router.get("/get/{upload_id}/qrcode")
+async def get_qrcode_image(
     request: Request,
     upload_id: str,
-    file_type: Literal["ipa", "apk"],
 ) -> Response:
-    expected_platform = Platform.ios if file_type == "ipa" else Platform.android
-    get_upload_asserted_platform(upload_id, expected_platform=expected_platform)
+    artifact = await ensure_install_artifact(upload_id, QR_CODE_FILE_NAME)
 
-    build_info = await load_build_info(upload_id)
-    app_file_content = load_app_file(build_info)
+    return get_install_artifact_response(request, artifact, upload_id)
+
+
+def get_build_surrogate_keys(build_info: BuildInfo) -> list[str]:
+    return [
+        cdn.get_upload_surrogate_key(build_info.upload_id),
+        cdn.get_bundle_surrogate_key(build_info.bundle_id),
+    ]
 
+
+def get_app_file_headers(build_info: BuildInfo, file_type: str) -> dict[str, str]:
     created_at_prefix = (
         build_info.created_at.strftime("%Y-%m-%d_%H-%M-%S") if build_info.created_at else ""
     )
     file_name = f"{build_info.app_title} {build_info.bundle_version}{created_at_prefix}"
 
-    # Log download event
-    ip = request.client.host if hasattr(request, 'client') and request.client else request.headers.get('x-forwarded-for', 'unknown')
+    # Encode the filename for HTTP headers
+    safe_filename = quote(file_name)
+    headers = {
+        "Content-Disposition": f"attachment; filename*=UTF-8''{safe_filename}.{file_type}",
+        # Upload ids are never reused and their binary never changes
+        "ETag": f'"{build_info.upload_id}"',
+        **cdn.immutable_cache_headers(*get_build_surrogate_keys(build_info)),
+    }
+
+    if build_info.created_at:
+        headers["Last-Modified"] = format_datetime(
+            build_info.created_at.astimezone(datetime.timezone.utc),
+            usegmt=True,
+        )
+
+    return headers
+
+
+def get_client_ip(request: Request) -> str:
+    return request.client.host if hasattr(request, 'client') and request.client else request.headers.get('x-forwarded-for', 'unknown')
+
+
+def log_download(
+    build_info: BuildInfo,
+    ip: str,
+    timestamp: Optional[datetime.datetime] = None,
+):
     log_entry = {
-        "timestamp": datetime.datetime.utcnow().isoformat(),
+        "timestamp": (timestamp or datetime.datetime.utcnow()).isoformat(),
         "bundle_id": build_info.bundle_id,
         "platform": build_info.platform.value,
-        "upload_id": upload_id,
+        "upload_id": build_info.upload_id,
         "ip": ip
     }
     os.makedirs("logs", exist_ok=True)
@@ -87,13 +131,362 @@ async def get_app_file(
     with open(log_path, "a") as f:
         f.write(json.dumps(log_entry) + "\n")
     print(f"[DEBUG] Logged download: {log_entry} to {log_path}")
+    event_broker.publish("download", {key: value for key, value in log_entry.items() if key != "ip"})
 
-    # Encode the filename for HTTP headers
-    safe_filename = quote(file_name)
-    content_disposition = f"attachment; filename*=UTF-8''{safe_filename}.{file_type}"
+
+# Architecture tokens of Android user agents, armv8l is a 32-bit browser or system on a 64-bit CPU
+USER_AGENT_ABIS = [
+    (re.compile(r"\b(aarch64|arm64)\b", re.IGNORECASE), "arm64-v8a"),
+    (re.compile(r"\b(armv7l?|armv8l|armeabi)\b", re.IGNORECASE), "armeabi-v7a"),
+    (re.compile(r"\b(x86_64|amd64)\b", re.IGNORECASE), "x86_64"),
+    (re.compile(r"\b(i[3-6]86|x86)\b", re.IGNORECASE), "x86"),
+]
+
+# `Sec-CH-UA-Arch` and `Sec-CH-UA-Bitness` client hints, requested by the app pages
+CLIENT_HINT_ABIS = {
+    ("arm", "64"): "arm64-v8a",
+    ("arm", "32"): "armeabi-v7a",
+    ("x86", "64"): "x86_64",
+    ("x86", "32"): "x86",
+}
+
+
+def get_device_abis(request: Request, abi: Optional[str]) -> list[str]:
+    """
+    ABIs the device runs, preferred first: the `abi` query parameter (as `Build.SUPPORTED_ABIS`),
+    else the ABIs of the architecture from the client hints or the user agent. Empty when unknown.
+    """
+    if abi:
+        return [abi.strip() for abi in abi.split(",") if abi.strip()]
+
+    client_hint = (
+        request.headers.get("sec-ch-ua-arch", "").strip('"').lower(),
+        request.headers.get("sec-ch-ua-bitness", "").strip('"'),
+    )
+    if client_hint in CLIENT_HINT_ABIS:
+        return ANDROID_ABIS[CLIENT_HINT_ABIS[client_hint]]
+
+    user_agent = request.headers.get("user-agent", "")
+    for pattern, primary_abi in USER_AGENT_ABIS:
+        if pattern.search(user_agent):
+            return ANDROID_ABIS[primary_abi]
+    return []
+
+
+def get_apk_variant_redirect(request: Request, build_info: BuildInfo, abi: Optional[str]) -> Optional[Response]:
+    """Redirect to the variant for the device, when the upload has one."""
+    variant = select_apk_variant(build_info.variants, get_device_abis(request, abi))
+    if variant is None:
+        return None
+
+    return RedirectResponse(
+        f"/get/{build_info.upload_id}/variants/{variant.file_name}",
+        status_code=307,
+        headers=cdn.no_store_headers(),
+    )
+
+
+def get_universal_app_file_headers(build_info: BuildInfo, file_type: str) -> dict[str, str]:
+    headers = get_app_file_headers(build_info, file_type)
+    if build_info.variants:
+        # Another device may get a variant from the same URL
+        headers.update(cdn.no_store_headers())
+    return headers
+
+
+ABI_QUERY = Query(
+    None,
+    description="Android: ABIs supported by the device, preferred first and comma separated",
+)
+
+
+@router.get(
+    "/get/{upload_id}/app.{file_type}",
+    response_class=HTMLResponse,
+)
+async def get_app_file(
+    request: Request,
+    upload_id: str,
+    file_type: Literal["ipa", "apk"],
+    abi: Optional[str] = ABI_QUERY,
+) -> Response:
+    expected_platform = Platform.ios if file_type == "ipa" else Platform.android
+    await get_upload_asserted_platform(upload_id, expected_platform=expected_platform)
+
+    build_info = await load_build_info(upload_id)
+    variant_redirect = get_apk_variant_redirect(request, build_info, abi)
+    if variant_redirect is not None:
+        return variant_redirect
+
+    app_file_content = load_app_file(build_info)
+
+    # Log download event, in CDN mode they are reported by the beacon or the edge logs instead
+    if not CDN_MODE:
+        log_download(build_info, get_client_ip(request))
 
     return Response(
         content=app_file_content,
         media_type="application/octet-stream",
-        headers={"Content-Disposition": content_disposition},
+        headers=get_universal_app_file_headers(build_info, file_type),
+    )
+
+
+async def load_apk_variant(upload_id: str, file_name: str) -> tuple[BuildInfo, ApkVariant]:
+    await get_upload_asserted_platform(upload_id, expected_platform=Platform.android)
+
+    build_info = await load_build_info(upload_id)
+    variant = next((variant for variant in build_info.variants if variant.file_name == file_name), None)
+    if variant is None:
+        raise NotFoundError()
+    return build_info, variant
+
+
+def get_apk_variant_headers(build_info: BuildInfo, variant: ApkVariant) -> dict[str, str]:
+    return {
+        **get_app_file_headers(build_info, "apk"),
+        "ETag": f'"{variant.sha256}"',
+    }
+
+
+@router.get(
+    "/get/{upload_id}/variants/{file_name}",
+    summary="ABI-specific APK of an Android upload",
+    response_class=HTMLResponse,
+)
+async def get_apk_variant_file(
+    request: Request,
+    upload_id: str,
+    file_name: str,
+) -> Response:
+    build_info, variant = await load_apk_variant(upload_id, file_name)
+
+    content = await asyncio.to_thread(load_apk_variant_file, upload_id, variant)
+    if not CDN_MODE:
+        log_download(build_info, get_client_ip(request))
+
+    return Response(
+        content=content,
+        media_type="application/octet-stream",
+        headers=get_apk_variant_headers(build_info, variant),
+    )
+
+
+@router.head(
+    "/get/{upload_id}/variants/{file_name}",
+    response_class=HTMLResponse,
+)
+async def head_apk_variant_file(
+    upload_id: str,
+    file_name: str,
+) -> Response:
+    """
+    Answered from the variant metadata alone: the binary is not read
+    and the request is not counted as a download.
+    """
+    build_info, variant = await load_apk_variant(upload_id, file_name)
+
+    return Response(
+        media_type="application/octet-stream",
+        headers={
+            **get_apk_variant_headers(build_info, variant),
+            "Content-Length": str(variant.file_size),
+        },
+    )
+
+
+@router.head(
+    "/get/{upload_id}/app.{file_type}",
+    response_class=HTMLResponse,
+)
+async def head_app_file(
+    request: Request,
+    upload_id: str,
+    file_type: Literal["ipa", "apk"],
+    abi: Optional[str] = ABI_QUERY,
+) -> Response:
+    """
+    Answered from the build metadata alone: the binary is not read
+    and the request is not counted as a download.
+    """
+    expected_platform = Platform.ios if file_type == "ipa" else Platform.android
+    await get_upload_asserted_platform(upload_id, expected_platform=expected_platform)
+
+    build_info = await load_build_info(upload_id)
+    variant_redirect = get_apk_variant_redirect(request, build_info, abi)
+    if variant_redirect is not None:
+        return variant_redirect
+
+    return Response(
+        media_type="application/octet-stream",
+        headers={
+            **get_universal_app_file_headers(build_info, file_type),
+            "Content-Length": str(build_info.file_size),
+        },
+    )
+
+
+def is_valid_upload_id(upload_id: str) -> bool:
+    return upload_id.replace("-", "").isalnum()
+
+
+def get_full_apk_redirect(upload_id: str) -> Response:
+    # Not cached: the delta may still be in the works
+    return RedirectResponse(
+        f"/get/{upload_id}/app.apk",
+        status_code=307,
+        headers=cdn.no_store_headers(),
+    )
+
+
+def get_delta_headers(build_info: BuildInfo, from_upload_id: str) -> dict[str, str]:
+    upload_id = build_info.upload_id
+    return {
+        "Content-Disposition": f"attachment; filename={from_upload_id}-{upload_id}{deltas.DELTA_FILE_EXTENSION}",
+        "ETag": f'"{from_upload_id}-{upload_id}"',
+        "X-Delta-From": from_upload_id,
+        "X-Full-Size": str(build_info.file_size),
+        **cdn.immutable_cache_headers(*get_build_surrogate_keys(build_info)),
+    }
+
+
+@router.get(
+    "/get/{upload_id}/delta",
+    summary="Patch from a previous Android build, redirects to the full APK when there is none",
+    response_class=HTMLResponse,
+)
+async def get_app_delta(
+    request: Request,
+    upload_id: str,
+    from_upload_id: str = Query(alias="from"),
+) -> Response:
+    await get_upload_asserted_platform(upload_id, expected_platform=Platform.android)
+
+    delta_content = None
+    if is_valid_upload_id(from_upload_id):
+        delta_content = await asyncio.to_thread(load_delta, upload_id, from_upload_id)
+
+    if delta_content is None:
+        deltas.record_full_download_fallback()
+        return get_full_apk_redirect(upload_id)
+
+    build_info = await load_build_info(upload_id)
+    deltas.record_delta_download(build_info.file_size, len(delta_content))
+    if not CDN_MODE:
+        log_download(build_info, get_client_ip(request))
+
+    return Response(
+        content=delta_content,
+        media_type="application/octet-stream",
+        headers=get_delta_headers(build_info, from_upload_id),
+    )
+
+
+@router.head(
+    "/get/{upload_id}/delta",
+    response_class=HTMLResponse,
+)
+async def head_app_delta(
+    upload_id: str,
+    from_upload_id: str = Query(alias="from"),
+) -> Response:
+    """
+    Answered from the stored size of the delta: the delta is not read, the request
+    is not counted as a download and leaves the delta metrics untouched.
+    """
+    await get_upload_asserted_platform(upload_id, expected_platform=Platform.android)
+
+    delta_size = None
+    if is_valid_upload_id(from_upload_id):
+        delta_size = await asyncio.to_thread(get_delta_size, upload_id, from_upload_id)
+
+    if delta_size is None:
+        return get_full_apk_redirect(upload_id)
+
+    build_info = await load_build_info(upload_id)
+    return Response(
+        media_type="application/octet-stream",
+        headers={
+            **get_delta_headers(build_info, from_upload_id),
+            "Content-Length": str(delta_size),
+        },
+    )
+
+
+@router.post(
+    "/get/{upload_id}/beacon",
+    status_code=204,
+    summary="Count a download served by the CDN",
+)
+async def post_download_beacon(
+    request: Request,
+    upload_id: str,
+) -> Response:
+    await get_upload_asserted_platform(upload_id)
+
+    build_info = await load_build_info(upload_id)
+    log_download(build_info, get_client_ip(request))
+
+    return Response(status_code=204, headers=cdn.no_store_headers())
+
+
+def get_icon_response(request: Request, directory: str, size: int, surrogate_key: str) -> Response:
+    icon = load_icon(directory, size, accept_webp="image/webp" in request.headers.get("accept", ""))
+    if icon is None:
+        raise NotFoundError()
+
+    content, media_type, is_thumbnail = icon
+    headers = {
+        "ETag": f'"{hashlib.sha1(content).hexdigest()}"',
+        "Vary": "Accept",
+    }
+    if is_thumbnail:
+        # Thumbnails of an icon are rendered once and never change
+        headers["Cache-Control"] = "public, max-age=86400"
+        headers.update(cdn.immutable_cache_headers(surrogate_key))
+    else:
+        # The original is only served until the thumbnails are ready
+        headers["Cache-Control"] = "no-cache"
+
+    return Response(content=content, media_type=media_type, headers=headers)
+
+
+@router.get(
+    "/get/{upload_id}/icon",
+    summary="App icon extracted from a build",
+)
+async def get_app_icon(
+    request: Request,
+    upload_id: str,
+    size: int = Query(256, ge=1, le=1024),
+) -> Response:
+    await get_upload_asserted_platform(upload_id)
+
+    return await asyncio.to_thread(
+        get_icon_response,
+        request,
+        get_icons_directory(upload_id),
+        size,
+        cdn.get_upload_surrogate_key(upload_id),
+    )
+
+
+@router.get(
+    "/app-pictures/{bundle_id}/{picture_id}",
+    summary="Picture uploaded for an app from the admin pages",
+)
+async def get_app_picture(
+    request: Request,
+    bundle_id: str,
+    picture_id: str,
+    size: int = Query(256, ge=1, le=1024),
+) -> Response:
+    if not picture_id.isalnum():
+        raise NotFoundError()
+
+    return await asyncio.to_thread(
+        get_icon_response,
+        request,
+        get_app_picture_directory(bundle_id, picture_id),
+        size,
+        cdn.get_bundle_surrogate_key(bundle_id),
     )
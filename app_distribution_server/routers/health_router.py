@@ -1,5 +1,7 @@
 from fastapi import APIRouter
-from fastapi.responses import PlainTextResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from app_distribution_server import database, readiness
 
 router = APIRouter(tags=["Healthz"])
 
@@ -10,3 +12,18 @@ router = APIRouter(tags=["Healthz"])
 )
 async def healthz() -> PlainTextResponse:
     return PlainTextResponse(content="OK")
+
+
+@router.get("/readyz")
+async def readyz() -> JSONResponse:
+    """503 until the startup warm-up is done and while the database or storage fail."""
+    is_ready, details = await readiness.get_readiness()
+    return JSONResponse(content=details, status_code=200 if is_ready else 503)
+
+
+@router.get("/healthz/details")
+async def healthz_details() -> dict:
+    return {
+        "status": "OK",
+        "database": database.circuit_breaker.status(),
+    }
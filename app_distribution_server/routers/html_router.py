@@ -1,38 +1,43 @@
 from fastapi import APIRouter, Request, Response, Form, UploadFile
 from fastapi import HTTPException as FastApiHTTPException
-from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from starlette.status import HTTP_303_SEE_OTHER
 from starlette.responses import Response as StarletteResponse
 import os
 from app_distribution_server.config import LOGO_URL
 from typing import Union
-from app_distribution_server import database
+from app_distribution_server import cdn, database
+from app_distribution_server.lazy import LazyObject
+from app_distribution_server.events import event_broker
 
 from app_distribution_server.build_info import (
+    AppRecord,
     Platform,
     BuildInfo,
     get_build_info,
 )
 from app_distribution_server.config import (
     APP_TITLE,
+    CDN_MODE,
     LOGO_URL,
     get_absolute_url,
     COMPANY_NAME,
 )
-from app_distribution_server.qrcode import get_qr_code_svg
 from app_distribution_server.storage import (
     get_upload_asserted_platform,
+    list_apps,
+    load_app_record,
     load_build_info,
     list_builds_by_bundle_id,
-    save_build_info,
+    save_app_picture,
+    save_app_record,
     save_upload,
 )
-import shutil
+import asyncio
+import base64
 import json
 import datetime
-import time
 async def get_settings():
     """Get settings from database."""
     try:
@@ -75,6 +80,51 @@ async def save_reviews(reviews):
     # This is kept for compatibility but individual reviews should be saved via database.save_review
     print("Note: Use database.save_review() for adding individual reviews")
 
+async def load_recent_reviews(limit):
+    """Load the most recent reviews of all apps from database."""
+    try:
+        return await database.list_recent_reviews(limit)
+    except Exception as e:
+        print(f"Error loading reviews from database: {e}")
+        return []
+
+async def load_review_summary(bundle_id):
+    """Load the review count and average rating of an app from database."""
+    try:
+        return await database.get_review_summary(bundle_id)
+    except Exception as e:
+        print(f"Error loading review summary from database: {e}")
+        return {"reviews_count": 0, "avg_rating": 0}
+
+def encode_review_cursor(review):
+    return base64.urlsafe_b64encode(f"{review['created_at'].isoformat()}|{review['id']}".encode()).decode()
+
+def decode_review_cursor(cursor):
+    try:
+        created_at, review_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.datetime.fromisoformat(created_at), int(review_id)
+    except ValueError:
+        raise FastApiHTTPException(status_code=400, detail="Invalid cursor")
+
+async def load_reviews_page(bundle_id, upload_id=None, limit=20, cursor=None):
+    """Load a page of reviews of an app, with the cursor of the next page."""
+    limit = max(1, min(limit, 100))
+    before = decode_review_cursor(cursor) if cursor else None
+    try:
+        reviews = await database.list_reviews(bundle_id, upload_id=upload_id, limit=limit, before=before)
+    except Exception as e:
+        print(f"Error loading reviews from database: {e}")
+        reviews = []
+    next_cursor = encode_review_cursor(reviews[-1]) if len(reviews) == limit else None
+    return reviews, next_cursor
+
+def log_activity(activity):
+    """Append an entry to the admin activity log and notify live dashboards."""
+    os.makedirs("logs", exist_ok=True)
+    with open(os.path.join("logs", "activity.log"), "a") as f:
+        f.write(json.dumps(activity) + "\n")
+    event_broker.publish("activity", activity)
+
 async def get_current_user(request):
     username = request.cookies.get("username")
     admin_auth = request.cookies.get("admin_auth")
@@ -88,7 +138,16 @@ async def get_current_user(request):
 
 router = APIRouter(tags=["HTML page handling"])
 
-templates = Jinja2Templates(directory="templates")
+
+def create_templates():
+    from fastapi.templating import Jinja2Templates
+
+    templates = Jinja2Templates(directory="templates")
+    templates.env.globals["cdn_mode"] = CDN_MODE
+    return templates
+
+
+templates = LazyObject(create_templates, "page templates")
 
 ADMIN_USERNAME = "admin"
 ADMIN_PASSWORD = "admin123"  # Change this in production!
@@ -160,25 +219,14 @@ async def admin_apps(request: Request):
     user = await get_current_user(request)
     if user["role"] not in ["owner", "admin"]:
         return RedirectResponse("/", status_code=HTTP_303_SEE_OTHER)
-    from app_distribution_server.storage import load_build_info
-    from fs import errors
-    apps = {}
-    for upload_id in list_builds_by_bundle_id.__globals__["filesystem"].listdir("."):
-        try:
-            build_info = await load_build_info(upload_id)
-            if build_info.bundle_id not in apps:
-                apps[build_info.bundle_id] = build_info
-        except errors.ResourceNotFound:
-            continue
-        except Exception:
-            continue
+    apps = await list_apps()
     lang = get_lang(request)
     translations = load_translations(lang)
     def tr(key):
         return translations.get(key, key)
     return templates.TemplateResponse(
         "admin-apps.jinja.html",
-        {"request": request, "apps": list(apps.values()), "lang": lang, "tr": tr, "active_menu": "apps"}
+        {"request": request, "apps": apps, "lang": lang, "tr": tr, "active_menu": "apps"}
     )
 
 @router.get("/admin/apps/create", response_class=HTMLResponse)
@@ -200,22 +248,18 @@ async def admin_create_app_post(request: Request, app_title: str = Form(...), bu
     def tr(key):
         return translations.get(key, key)
     # Check if app already exists
-    builds = await list_builds_by_bundle_id(bundle_id)
-    if builds:
+    if await load_app_record(bundle_id) or await list_builds_by_bundle_id(bundle_id):
         return templates.TemplateResponse("admin-create-app.jinja.html", {"request": request, "error": "App with this Bundle ID already exists.", "tr": tr, "lang": lang, "translations": translations})
-    # Create a dummy BuildInfo entry (no version yet)
-    dummy_build = BuildInfo(
-        upload_id=f"dummy-{bundle_id}",
-        platform=Platform.ios,  # Default, can be updated later
-        app_title=app_title,
-        bundle_id=bundle_id,
-        bundle_version="-",
-        created_at=None,
-        file_size=0,
-        app_description=app_description,
-        app_picture_url=app_picture_url,
-    )
-    save_build_info(dummy_build)
+    try:
+        app_record = AppRecord(
+            bundle_id=bundle_id,
+            app_title=app_title,
+            app_description=app_description,
+            app_picture_url=app_picture_url,
+        )
+    except ValueError as e:
+        return templates.TemplateResponse("admin-create-app.jinja.html", {"request": request, "error": str(e), "tr": tr, "lang": lang, "translations": translations})
+    await save_app_record(app_record)
     # Log activity
     username = request.cookies.get("username", "admin")
     activity = {
@@ -225,18 +269,25 @@ async def admin_create_app_post(request: Request, app_title: str = Form(...), bu
         "app_title": app_title,
         "username": username
     }
-    with open(os.path.join("logs", "activity.log"), "a") as f:
-        f.write(json.dumps(activity) + "\n")
+    log_activity(activity)
     return RedirectResponse("/admin/apps", status_code=HTTP_303_SEE_OTHER)
 
+async def load_app_info(bundle_id: str) -> Union[AppRecord, BuildInfo]:
+    """App record of a bundle, or its latest build for apps that were never edited."""
+    app_record = await load_app_record(bundle_id)
+    if app_record is not None:
+        return app_record
+
+    builds = await list_builds_by_bundle_id(bundle_id)
+    if not builds:
+        raise FastApiHTTPException(status_code=404, detail="App not found")
+    return builds[0]
+
 @router.get("/admin/apps/{bundle_id}/edit", response_class=HTMLResponse)
 async def admin_edit_app_get(request: Request, bundle_id: str):
     if request.cookies.get("admin_auth") != "1":
         return RedirectResponse("/login", status_code=HTTP_303_SEE_OTHER)
-    builds = await list_builds_by_bundle_id(bundle_id)
-    if not builds:
-        raise FastApiHTTPException(status_code=404, detail="App not found")
-    app_info = builds[0]
+    app_info = await load_app_info(bundle_id)
     lang = get_lang(request)
     translations = load_translations(lang)
     def tr(key):
@@ -247,9 +298,7 @@ async def admin_edit_app_get(request: Request, bundle_id: str):
 async def admin_edit_app_post(request: Request, bundle_id: str, app_title: str = Form(...), app_description: str = Form(None), app_picture_url: str = Form(None), app_picture_file: UploadFile = None):
     if request.cookies.get("admin_auth") != "1":
         return RedirectResponse("/login", status_code=HTTP_303_SEE_OTHER)
-    builds = await list_builds_by_bundle_id(bundle_id)
-    if not builds:
-        raise FastApiHTTPException(status_code=404, detail="App not found")
+    app_info = await load_app_info(bundle_id)
     lang = get_lang(request)
     translations = load_translations(lang)
     def tr(key):
@@ -258,19 +307,20 @@ async def admin_edit_app_post(request: Request, bundle_id: str, app_title: str =
     if app_picture_file and app_picture_file.filename:
         ext = app_picture_file.filename.split('.')[-1].lower()
         if ext not in ["jpg", "jpeg", "png", "webp", "gif"]:
-            return templates.TemplateResponse("admin-edit-app.jinja.html", {"request": request, "app_info": builds[0], "bundle_id": bundle_id, "error": "Invalid image format.", "tr": tr, "lang": lang, "translations": translations})
-        photo_dir = os.path.join("static", "app_photos")
-        os.makedirs(photo_dir, exist_ok=True)
-        photo_path = os.path.join(photo_dir, f"{bundle_id}.{ext}")
-        with open(photo_path, "wb") as f:
-            shutil.copyfileobj(app_picture_file.file, f)
-        app_picture_url = f"/static/app_photos/{bundle_id}.{ext}"
-    # Update all builds for this app with new metadata
-    for build in builds:
-        build.app_title = app_title
-        build.app_description = app_description
-        build.app_picture_url = app_picture_url
-        save_build_info(build)
+            return templates.TemplateResponse("admin-edit-app.jinja.html", {"request": request, "app_info": app_info, "bundle_id": bundle_id, "error": "Invalid image format.", "tr": tr, "lang": lang, "translations": translations})
+        # Kept in the storage backend with resized copies, so every node can serve it
+        try:
+            app_picture_url = await asyncio.to_thread(save_app_picture, bundle_id, await app_picture_file.read())
+        except ValueError:
+            return templates.TemplateResponse("admin-edit-app.jinja.html", {"request": request, "app_info": app_info, "bundle_id": bundle_id, "error": "Invalid image format.", "tr": tr, "lang": lang, "translations": translations})
+    # Builds pick the app record up when they are loaded, one write updates all of them
+    await save_app_record(AppRecord(
+        bundle_id=bundle_id,
+        app_title=app_title,
+        app_description=app_description,
+        app_picture_url=app_picture_url,
+        created_at=app_info.created_at if isinstance(app_info, AppRecord) else None,
+    ))
     # Log activity
     username = request.cookies.get("username", "admin")
     activity = {
@@ -280,8 +330,7 @@ async def admin_edit_app_post(request: Request, bundle_id: str, app_title: str =
         "app_title": app_title,
         "username": username
     }
-    with open(os.path.join("logs", "activity.log"), "a") as f:
-        f.write(json.dumps(activity) + "\n")
+    log_activity(activity)
     return RedirectResponse(f"/admin/apps", status_code=HTTP_303_SEE_OTHER)
 
 @router.get("/admin/new-app/upload", response_class=HTMLResponse)
@@ -332,26 +381,12 @@ async def admin_upload_version_post(request: Request, app_file: UploadFile = For
         "version": build_info.bundle_version,
         "username": username
     }
-    with open(os.path.join("logs", "activity.log"), "a") as f:
-        f.write(json.dumps(activity) + "\n")
+    log_activity(activity)
     return RedirectResponse(f"/app/{build_info.bundle_id}", status_code=HTTP_303_SEE_OTHER)
 
 
-@router.get("/get/{upload_id}/qrcode")
-async def get_qrcode_image(request: Request, upload_id: str):
-    build_info = await load_build_info(upload_id)
-    
-    # Get the base URL from the request to ensure it matches the current domain
-    base_url = f"{request.url.scheme}://{request.url.netloc}"
-    
-    if build_info.platform == Platform.ios:
-        plist_url = f"{base_url}/get/{upload_id}/app.plist"
-        install_url = f"itms-services://?action=download-manifest&url={plist_url}"
-    else:
-        install_url = f"{base_url}/get/{upload_id}/app.apk"
-    
-    svg = get_qr_code_svg(install_url)
-    return Response(content=svg, media_type="image/svg+xml")
+# Asks browsers for their architecture, APK downloads started from the app pages then get the matching variant
+ABI_CLIENT_HINT_HEADERS = {"Accept-CH": "Sec-CH-UA-Arch, Sec-CH-UA-Bitness"}
 
 
 @router.get(
@@ -373,10 +408,7 @@ async def app_overview_page(request: Request, bundle_id: str) -> HTMLResponse:
     def tr(key):
         return translations.get(key, key)
     # Calculate reviews_count and avg_rating
-    all_reviews = await load_reviews()
-    app_reviews = [r for r in all_reviews if r["bundle_id"] == bundle_id]
-    reviews_count = len(app_reviews)
-    avg_rating = round(sum(r.get("rating", 0) for r in app_reviews) / reviews_count, 1) if reviews_count else 0
+    review_summary = await load_review_summary(bundle_id)
     # Calculate downloads_count
     downloads_count = 0
     log_path = os.path.join("logs", "downloads.log")
@@ -395,10 +427,14 @@ async def app_overview_page(request: Request, bundle_id: str) -> HTMLResponse:
             "tr": tr,
             "company_name": COMPANY_NAME,
             "translations": translations,
-            "avg_rating": avg_rating,
-            "reviews_count": reviews_count,
+            "avg_rating": review_summary["avg_rating"],
+            "reviews_count": review_summary["reviews_count"],
             "downloads_count": downloads_count,
         },
+        headers={
+            **cdn.page_cache_headers(cdn.get_bundle_surrogate_key(bundle_id)),
+            **ABI_CLIENT_HINT_HEADERS,
+        },
     )
 
 @router.get("/app/{bundle_id}/{upload_id}", response_class=HTMLResponse)
@@ -426,6 +462,10 @@ async def app_version_page(request: Request, bundle_id: str, upload_id: str) ->
             "tr": tr,
             "translations": translations,
         },
+        headers={
+            **cdn.page_cache_headers(cdn.get_bundle_surrogate_key(bundle_id)),
+            **ABI_CLIENT_HINT_HEADERS,
+        },
     )
 
 @router.get("/admin/settings", response_class=HTMLResponse)
@@ -460,8 +500,7 @@ async def admin_settings_post(request: Request, duplicate_upload_policy: str = F
             "lang": lang,
             "username": username
         }
-        with open(os.path.join("logs", "activity.log"), "a") as f:
-            f.write(json.dumps(activity) + "\n")
+        log_activity(activity)
     # Set language cookie if changed
     response = templates.TemplateResponse(
         "admin-settings.jinja.html",
@@ -495,13 +534,31 @@ def get_lang(request: Request):
         return "ar"
     return "en"
 
+_translations: dict[str, dict] = {}
+
+
+def load_all_translations():
+    """Reads every language once per process, pages share the loaded dicts."""
+    global _translations
+
+    translations = {}
+    for file_name in os.listdir("translations"):
+        if file_name.endswith(".json"):
+            with open(os.path.join("translations", file_name), "r") as f:
+                translations[file_name.removesuffix(".json")] = json.load(f)
+    _translations = translations
+
+
 def load_translations(lang):
-    try:
-        with open(os.path.join("translations", f"{lang}.json"), "r") as f:
-            return json.load(f)
-    except Exception:
-        with open(os.path.join("translations", "en.json"), "r") as f:
-            return json.load(f)
+    if not _translations:
+        load_all_translations()
+    return _translations.get(lang) or _translations["en"]
+
+
+def compile_templates():
+    """Compiles every page template ahead of the first requests."""
+    for template_name in templates.env.list_templates(extensions=["html"]):
+        templates.env.get_template(template_name)
 
 # Patch all template responses to include lang
 from functools import wraps
@@ -558,25 +615,16 @@ async def home(request: Request):
 
 @router.get("/apps", response_class=HTMLResponse)
 async def public_apps(request: Request):
-    from app_distribution_server.storage import load_build_info
-    from fs import errors
     lang = get_lang(request)
     translations = load_translations(lang)
     def tr(key):
         return translations.get(key, key)
-    apps = {}
-    for upload_id in list_builds_by_bundle_id.__globals__["filesystem"].listdir("."):
-        try:
-            build_info = await load_build_info(upload_id)
-            if build_info.bundle_id not in apps:
-                apps[build_info.bundle_id] = build_info
-        except errors.ResourceNotFound:
-            continue
-        except Exception:
-            continue
+    # Apps without a build yet have nothing to install
+    apps = [app for app in await list_apps() if isinstance(app, BuildInfo)]
     return templates.TemplateResponse(
         "apps.jinja.html",
-        {"request": request, "apps": list(apps.values()), "lang": lang, "tr": tr, "logo_url": LOGO_URL, "page_title": f"Apps - {APP_TITLE}"}
+        {"request": request, "apps": apps, "lang": lang, "tr": tr, "logo_url": LOGO_URL, "page_title": f"Apps - {APP_TITLE}"},
+        headers=cdn.page_cache_headers(cdn.APPS_SURROGATE_KEY),
     )
 
 @router.get("/about", response_class=HTMLResponse)
@@ -702,21 +750,26 @@ async def api_update_user(request: Request):
     return {"ok": True}
 
 @router.get("/api/reviews/app/{bundle_id}")
-async def api_get_app_reviews(bundle_id: str, request: Request):
-    reviews = await load_reviews()
+async def api_get_app_reviews(bundle_id: str, request: Request, limit: int = 20, cursor: str = None):
+    reviews, next_cursor = await load_reviews_page(bundle_id, limit=limit, cursor=cursor)
     user = await get_current_user(request)
     user_review = None
     if user["username"]:
-        for r in reviews:
-            if r["bundle_id"] == bundle_id and r["username"] == user["username"]:
-                user_review = r
-                break
-    return {"reviews": [r for r in reviews if r["bundle_id"] == bundle_id], "user_review": user_review}
+        try:
+            user_review = await database.get_user_review(bundle_id, user["username"])
+        except Exception as e:
+            print(f"Error loading review from database: {e}")
+    return {
+        "reviews": reviews,
+        "user_review": user_review,
+        "next_cursor": next_cursor,
+        **await load_review_summary(bundle_id),
+    }
 
 @router.get("/api/reviews/version/{bundle_id}/{upload_id}")
-async def api_get_version_reviews(bundle_id: str, upload_id: str):
-    reviews = await load_reviews()
-    return {"reviews": [r for r in reviews if r["bundle_id"] == bundle_id and r.get("upload_id") == upload_id]}
+async def api_get_version_reviews(bundle_id: str, upload_id: str, limit: int = 20, cursor: str = None):
+    reviews, next_cursor = await load_reviews_page(bundle_id, upload_id=upload_id, limit=limit, cursor=cursor)
+    return {"reviews": reviews, "next_cursor": next_cursor}
 
 @router.post("/api/reviews/add")
 async def api_add_review(request: Request):
@@ -724,20 +777,20 @@ async def api_add_review(request: Request):
     if not user["username"]:
         return {"error": "not_logged_in"}
     data = await request.json()
-    reviews = await load_reviews()
-    # Remove existing review for this user/app
-    reviews = [r for r in reviews if not (r["bundle_id"] == data["bundle_id"] and r["username"] == user["username"])]
-    review = {
-        "bundle_id": data["bundle_id"],
-        "username": user["username"],
-        "rating": data.get("rating", 0),
-        "comment": data.get("comment", ""),
-        "timestamp": int(time.time()),
-        "reply": None,
-        "reply_timestamp": None
-    }
-    reviews.append(review)
-    await save_reviews(reviews)
+    try:
+        rating = int(data.get("rating", 0))
+    except (TypeError, ValueError):
+        rating = 0
+    if not 1 <= rating <= 5:
+        return JSONResponse({"error": "invalid_rating"}, status_code=400)
+    # Replaces any existing review of this user for this app
+    await database.upsert_review(
+        data["bundle_id"],
+        user["username"],
+        rating,
+        data.get("comment", ""),
+        upload_id=data.get("upload_id"),
+    )
     return {"ok": True}
 
 @router.post("/api/reviews/reply")
@@ -746,17 +799,8 @@ async def api_reply_review(request: Request):
     if user["role"] not in ["owner", "admin"]:
         return {"error": "forbidden"}
     data = await request.json()
-    reviews = await load_reviews()
-    found = False
-    for r in reviews:
-        if r["bundle_id"] == data["bundle_id"] and r["username"] == data["username"]:
-            r["reply"] = data["reply"]
-            r["reply_timestamp"] = int(time.time())
-            found = True
-            break
-    if not found:
+    if not await database.save_review_reply(data["bundle_id"], data["username"], data["reply"]):
         return {"error": "notfound"}
-    await save_reviews(reviews)
     # Log activity for admin reply
     activity = {
         "timestamp": datetime.datetime.utcnow().isoformat(),
@@ -766,6 +810,5 @@ async def api_reply_review(request: Request):
         "reply": data["reply"],
         "admin": user["username"]
     }
-    with open(os.path.join("logs", "activity.log"), "a") as f:
-        f.write(json.dumps(activity) + "\n")
+    log_activity(activity)
     return {"ok": True}
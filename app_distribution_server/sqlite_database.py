@@ -0,0 +1,567 @@
+"""
+Embedded SQLite implementation of the database layer, for single node deployments.
+
+Enabled with `DATABASE_URL=sqlite:///path/to/appsyra.db`. It exposes the same
+functions as the PostgreSQL implementation in `database.py`. Queries run in a
+worker thread over a single WAL mode connection.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from app_distribution_server.logger import logger
+
+DATABASE_URL = os.getenv("DATABASE_URL", "")
+
+_connection: Optional[sqlite3.Connection] = None
+_connection_lock = threading.Lock()
+
+DATETIME_COLUMNS = ("created_at", "updated_at", "reply_at")
+
+
+def get_database_path() -> str:
+    return DATABASE_URL.removeprefix("sqlite:///") or "appsyra.db"
+
+
+def _get_connection() -> sqlite3.Connection:
+    global _connection
+
+    if _connection is None:
+        database_path = get_database_path()
+        if os.path.dirname(database_path):
+            os.makedirs(os.path.dirname(database_path), exist_ok=True)
+
+        _connection = sqlite3.connect(database_path, check_same_thread=False)
+        _connection.row_factory = sqlite3.Row
+        _connection.execute("PRAGMA journal_mode=WAL")
+        _connection.execute("PRAGMA synchronous=NORMAL")
+        _connection.execute("PRAGMA busy_timeout=5000")
+
+    return _connection
+
+
+def _row_to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+    record = dict(row)
+    for column in DATETIME_COLUMNS:
+        if isinstance(record.get(column), str):
+            record[column] = datetime.fromisoformat(record[column])
+    return record
+
+
+async def _run(function, *args):
+    def locked_function():
+        with _connection_lock:
+            connection = _get_connection()
+            with connection:
+                return function(connection, *args)
+
+    return await asyncio.to_thread(locked_function)
+
+
+def _format_datetime(value: datetime) -> str:
+    # Same format as the column defaults, so text comparisons order correctly
+    return value.isoformat(timespec="milliseconds")
+
+
+def _to_timestamp(value: Optional[datetime]) -> Optional[int]:
+    # SQLite stores UTC
+    return int(value.replace(tzinfo=timezone.utc).timestamp()) if value else None
+
+
+def _add_missing_columns(connection: sqlite3.Connection, table: str, columns: tuple[tuple[str, str], ...]):
+    # SQLite has no ADD COLUMN IF NOT EXISTS
+    existing_columns = {row["name"] for row in connection.execute(f"PRAGMA table_info({table})")}
+    for column, column_type in columns:
+        if column not in existing_columns:
+            connection.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+
+
+def _migrate_initial_tables(connection: sqlite3.Connection):
+    for statement in (
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            role TEXT NOT NULL,
+            created_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now'))
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS reviews (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            app_name TEXT,
+            reviewer_name TEXT,
+            rating INTEGER,
+            comment TEXT,
+            created_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now'))
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS apps (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            upload_id TEXT UNIQUE NOT NULL,
+            app_title TEXT,
+            bundle_id TEXT,
+            bundle_version TEXT,
+            version_code INTEGER,
+            build_number TEXT,
+            platform TEXT,
+            file_size INTEGER,
+            file_url TEXT,
+            created_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now'))
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS settings (
+            key TEXT PRIMARY KEY,
+            value TEXT,
+            updated_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now'))
+        )
+        ''',
+        # Default owner user, only when no users exist
+        '''
+        INSERT INTO users (username, password, role)
+        SELECT 'owner', 'owner123', 'owner' WHERE NOT EXISTS (SELECT 1 FROM users)
+        ''',
+    ):
+        connection.execute(statement)
+
+
+def _migrate_reviews_by_bundle(connection: sqlite3.Connection):
+    # Reviews are keyed by bundle and user, app_name/reviewer_name are kept for older rows
+    _add_missing_columns(connection, "reviews", (
+        ("bundle_id", "TEXT"),
+        ("upload_id", "TEXT"),
+        ("username", "TEXT"),
+        ("reply", "TEXT"),
+        ("reply_at", "TEXT"),
+    ))
+    for statement in (
+        '''
+        UPDATE reviews SET bundle_id = app_name, username = reviewer_name
+        WHERE bundle_id IS NULL AND id = (
+            SELECT MAX(d.id) FROM reviews d
+            WHERE d.app_name = reviews.app_name AND d.reviewer_name = reviews.reviewer_name
+        )
+        ''',
+        "CREATE UNIQUE INDEX IF NOT EXISTS reviews_bundle_id_username_idx ON reviews (bundle_id, username)",
+        "CREATE INDEX IF NOT EXISTS reviews_bundle_id_created_at_idx ON reviews (bundle_id, created_at DESC, id DESC)",
+        '''
+        CREATE INDEX IF NOT EXISTS reviews_bundle_id_upload_id_created_at_idx
+            ON reviews (bundle_id, upload_id, created_at DESC, id DESC)
+        ''',
+        "CREATE INDEX IF NOT EXISTS reviews_created_at_idx ON reviews (created_at DESC, id DESC)",
+        '''
+        CREATE TABLE IF NOT EXISTS review_summaries (
+            bundle_id TEXT PRIMARY KEY,
+            reviews_count INTEGER NOT NULL DEFAULT 0,
+            rating_sum INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now'))
+        )
+        ''',
+        '''
+        INSERT INTO review_summaries (bundle_id, reviews_count, rating_sum)
+        SELECT bundle_id, COUNT(*), COALESCE(SUM(rating), 0)
+        FROM reviews WHERE bundle_id IS NOT NULL GROUP BY bundle_id
+        ON CONFLICT (bundle_id) DO NOTHING
+        ''',
+    ):
+        connection.execute(statement)
+
+
+def _migrate_app_records(connection: sqlite3.Connection):
+    connection.execute('''
+        CREATE TABLE IF NOT EXISTS app_records (
+            bundle_id TEXT PRIMARY KEY,
+            app_title TEXT NOT NULL,
+            app_description TEXT,
+            app_picture_url TEXT,
+            created_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now')),
+            updated_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now'))
+        )
+    ''')
+
+
+def _migrate_app_icons(connection: sqlite3.Connection):
+    _add_missing_columns(connection, "apps", (("has_icon", "INTEGER NOT NULL DEFAULT 0"),))
+
+
+def _migrate_app_listing_indexes(connection: sqlite3.Connection):
+    connection.execute("CREATE INDEX IF NOT EXISTS apps_bundle_id_created_at_idx ON apps (bundle_id, created_at DESC)")
+    connection.execute("CREATE INDEX IF NOT EXISTS apps_created_at_idx ON apps (created_at DESC)")
+
+
+def _migrate_apk_variants(connection: sqlite3.Connection):
+    _add_missing_columns(connection, "apps", (("variants", "TEXT"),))
+
+
+# Same versions as `database.MIGRATIONS`, the schema version is kept in `PRAGMA user_version`
+MIGRATIONS = [
+    (1, "Initial tables", _migrate_initial_tables),
+    (2, "Reviews keyed by bundle and user", _migrate_reviews_by_bundle),
+    (3, "App records", _migrate_app_records),
+    (4, "App icons", _migrate_app_icons),
+    (5, "App listing indexes", _migrate_app_listing_indexes),
+    (6, "APK variants", _migrate_apk_variants),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def _get_schema_version(connection: sqlite3.Connection) -> int:
+    return connection.execute("PRAGMA user_version").fetchone()[0]
+
+
+def _init_database(connection: sqlite3.Connection):
+    if _get_schema_version(connection) >= SCHEMA_VERSION:
+        return
+
+    # Takes the write lock right away, other processes wait instead of migrating too
+    connection.execute("BEGIN IMMEDIATE")
+    schema_version = _get_schema_version(connection)
+    for version, description, migrate in MIGRATIONS:
+        if version <= schema_version:
+            continue
+
+        logger.info(f"Applying database migration {version}: {description}")
+        migrate(connection)
+        connection.execute(f"PRAGMA user_version = {version}")
+
+
+async def init_database():
+    """Initialize database tables, a single pragma read when the schema is up to date."""
+    await _run(_init_database)
+
+
+async def get_users() -> List[Dict[str, Any]]:
+    """Get all users from database."""
+    def query(connection):
+        rows = connection.execute("SELECT username, password, role FROM users").fetchall()
+        return [{"username": row["username"], "password": row["password"], "role": row["role"]} for row in rows]
+
+    return await _run(query)
+
+
+async def save_user(username: str, password: str, role: str) -> bool:
+    """Add a new user to database."""
+    def query(connection):
+        try:
+            connection.execute(
+                "INSERT INTO users (username, password, role) VALUES (?, ?, ?)",
+                (username, password, role),
+            )
+            return True
+        except sqlite3.IntegrityError:
+            return False
+
+    return await _run(query)
+
+
+async def delete_user(username: str) -> bool:
+    """Delete a user from database."""
+    def query(connection):
+        return connection.execute("DELETE FROM users WHERE username = ?", (username,)).rowcount != 0
+
+    return await _run(query)
+
+
+REVIEW_COLUMNS = "id, bundle_id, upload_id, username, rating, comment, reply, reply_at, created_at"
+
+
+def _review_row_to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+    record = _row_to_dict(row)
+    return {
+        "id": record["id"],
+        "bundle_id": record["bundle_id"],
+        "upload_id": record["upload_id"],
+        "username": record["username"],
+        "rating": record["rating"] or 0,
+        "comment": record["comment"],
+        "timestamp": _to_timestamp(record["created_at"]),
+        "reply": record["reply"],
+        "reply_timestamp": _to_timestamp(record["reply_at"]),
+        "created_at": record["created_at"],
+    }
+
+
+async def get_reviews() -> List[Dict[str, Any]]:
+    """Get all reviews from database."""
+    def query(connection):
+        rows = connection.execute(
+            f"SELECT {REVIEW_COLUMNS} FROM reviews WHERE bundle_id IS NOT NULL ORDER BY created_at DESC, id DESC"
+        ).fetchall()
+        return [_review_row_to_dict(row) for row in rows]
+
+    return await _run(query)
+
+
+async def list_recent_reviews(limit: int = 20) -> List[Dict[str, Any]]:
+    """Get the most recent reviews across all bundles."""
+    def query(connection):
+        rows = connection.execute(
+            f"SELECT {REVIEW_COLUMNS} FROM reviews WHERE bundle_id IS NOT NULL"
+            " ORDER BY created_at DESC, id DESC LIMIT ?",
+            (limit,),
+        ).fetchall()
+        return [_review_row_to_dict(row) for row in rows]
+
+    return await _run(query)
+
+
+async def list_reviews(bundle_id: str, upload_id: Optional[str] = None, limit: int = 20,
+                       before: Optional[tuple[datetime, int]] = None) -> List[Dict[str, Any]]:
+    """Get a page of reviews of a bundle, newest first. `before` is the (created_at, id) of the last review of the previous page."""
+    conditions = ["bundle_id = ?"]
+    arguments: List[Any] = [bundle_id]
+    if upload_id is not None:
+        conditions.append("upload_id = ?")
+        arguments.append(upload_id)
+    if before is not None:
+        conditions.append("(created_at, id) < (?, ?)")
+        arguments.extend((_format_datetime(before[0]), before[1]))
+    arguments.append(limit)
+
+    def query(connection):
+        rows = connection.execute(
+            f"SELECT {REVIEW_COLUMNS} FROM reviews WHERE {' AND '.join(conditions)}"
+            " ORDER BY created_at DESC, id DESC LIMIT ?",
+            arguments,
+        ).fetchall()
+        return [_review_row_to_dict(row) for row in rows]
+
+    return await _run(query)
+
+
+async def get_user_review(bundle_id: str, username: str) -> Optional[Dict[str, Any]]:
+    """Get the review of a user for a bundle."""
+    def query(connection):
+        row = connection.execute(
+            f"SELECT {REVIEW_COLUMNS} FROM reviews WHERE bundle_id = ? AND username = ?",
+            (bundle_id, username),
+        ).fetchone()
+        return _review_row_to_dict(row) if row else None
+
+    return await _run(query)
+
+
+async def get_review_summary(bundle_id: str) -> Dict[str, Any]:
+    """Get the review count and average rating of a bundle."""
+    def query(connection):
+        row = connection.execute(
+            "SELECT reviews_count, rating_sum FROM review_summaries WHERE bundle_id = ?", (bundle_id,)
+        ).fetchone()
+        if not row or not row["reviews_count"]:
+            return {"reviews_count": 0, "avg_rating": 0}
+        return {
+            "reviews_count": row["reviews_count"],
+            "avg_rating": round(row["rating_sum"] / row["reviews_count"], 1),
+        }
+
+    return await _run(query)
+
+
+async def upsert_review(bundle_id: str, username: str, rating: int, comment: str,
+                        upload_id: Optional[str] = None) -> None:
+    """Add or replace the review of a user for a bundle, updating the bundle summary."""
+    def query(connection):
+        previous = connection.execute(
+            "SELECT rating FROM reviews WHERE bundle_id = ? AND username = ?", (bundle_id, username)
+        ).fetchone()
+        # A new review replaces the previous one, including the reply to it
+        connection.execute("""
+            INSERT INTO reviews (bundle_id, username, upload_id, rating, comment, app_name, reviewer_name)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (bundle_id, username) DO UPDATE SET
+                upload_id = excluded.upload_id,
+                rating = excluded.rating,
+                comment = excluded.comment,
+                reply = NULL,
+                reply_at = NULL,
+                created_at = strftime('%Y-%m-%dT%H:%M:%f', 'now')
+        """, (bundle_id, username, upload_id, rating, comment, bundle_id, username))
+        connection.execute("""
+            INSERT INTO review_summaries (bundle_id, reviews_count, rating_sum) VALUES (?, ?, ?)
+            ON CONFLICT (bundle_id) DO UPDATE SET
+                reviews_count = review_summaries.reviews_count + excluded.reviews_count,
+                rating_sum = review_summaries.rating_sum + excluded.rating_sum,
+                updated_at = strftime('%Y-%m-%dT%H:%M:%f', 'now')
+        """, (bundle_id, 0 if previous else 1, rating - ((previous and previous["rating"]) or 0)))
+
+    await _run(query)
+
+
+async def save_review(app_name: str, reviewer_name: str, rating: int, comment: str) -> None:
+    """Save a review to database."""
+    await upsert_review(app_name, reviewer_name, rating, comment)
+
+
+async def save_review_reply(bundle_id: str, username: str, reply: str) -> bool:
+    """Reply to the review of a user for a bundle."""
+    def query(connection):
+        return connection.execute(
+            "UPDATE reviews SET reply = ?, reply_at = strftime('%Y-%m-%dT%H:%M:%f', 'now')"
+            " WHERE bundle_id = ? AND username = ?",
+            (reply, bundle_id, username),
+        ).rowcount != 0
+
+    return await _run(query)
+
+
+async def save_app_metadata(upload_id: str, app_title: str, bundle_id: str,
+                            bundle_version: str, platform: str, file_size: int,
+                            file_url: str, version_code: int = None, build_number: str = None,
+                            has_icon: bool = False, variants: Optional[str] = None) -> None:
+    """Save app metadata to database."""
+    def query(connection):
+        connection.execute("""
+            INSERT INTO apps (upload_id, app_title, bundle_id, bundle_version,
+                              version_code, build_number, platform, file_size, file_url, has_icon, variants)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (upload_id) DO UPDATE SET
+                app_title = excluded.app_title,
+                bundle_id = excluded.bundle_id,
+                bundle_version = excluded.bundle_version,
+                version_code = excluded.version_code,
+                build_number = excluded.build_number,
+                platform = excluded.platform,
+                file_size = excluded.file_size,
+                file_url = excluded.file_url,
+                has_icon = excluded.has_icon,
+                variants = excluded.variants
+        """, (upload_id, app_title, bundle_id, bundle_version, version_code,
+              build_number, platform, file_size, file_url, has_icon, variants))
+
+    await _run(query)
+
+
+async def save_app_metadata_batch(apps: List[Dict[str, Any]]) -> None:
+    """Upserts many builds in one transaction, `created_at` is kept when None."""
+    if not apps:
+        return
+
+    def query(connection):
+        connection.executemany("""
+            INSERT INTO apps (upload_id, app_title, bundle_id, bundle_version, version_code,
+                              build_number, platform, file_size, file_url, has_icon, variants, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, COALESCE(?12, strftime('%Y-%m-%dT%H:%M:%f', 'now')))
+            ON CONFLICT (upload_id) DO UPDATE SET
+                app_title = excluded.app_title,
+                bundle_id = excluded.bundle_id,
+                bundle_version = excluded.bundle_version,
+                version_code = excluded.version_code,
+                build_number = excluded.build_number,
+                platform = excluded.platform,
+                file_size = excluded.file_size,
+                file_url = excluded.file_url,
+                has_icon = excluded.has_icon,
+                variants = excluded.variants,
+                created_at = COALESCE(?12, apps.created_at)
+        """, [
+            (
+                app["upload_id"], app["app_title"], app["bundle_id"], app["bundle_version"],
+                app.get("version_code"), app.get("build_number"), app["platform"],
+                app["file_size"], app["file_url"], app.get("has_icon", False), app.get("variants"),
+                _format_datetime(app["created_at"].astimezone(timezone.utc).replace(tzinfo=None))
+                if app.get("created_at") else None,
+            )
+            for app in apps
+        ])
+
+    await _run(query)
+
+
+async def get_app_metadata(upload_id: str) -> dict:
+    """Get app metadata from database."""
+    def query(connection):
+        row = connection.execute("SELECT * FROM apps WHERE upload_id = ?", (upload_id,)).fetchone()
+        return _row_to_dict(row) if row else None
+
+    return await _run(query)
+
+
+async def list_all_apps() -> List[Dict[str, Any]]:
+    """Get all apps from database."""
+    def query(connection):
+        rows = connection.execute("SELECT * FROM apps ORDER BY created_at DESC").fetchall()
+        return [_row_to_dict(row) for row in rows]
+
+    return await _run(query)
+
+
+async def delete_app_metadata(upload_id: str) -> bool:
+    """Delete app metadata from database."""
+    def query(connection):
+        return connection.execute("DELETE FROM apps WHERE upload_id = ?", (upload_id,)).rowcount != 0
+
+    return await _run(query)
+
+
+async def get_app_record(bundle_id: str) -> Optional[Dict[str, Any]]:
+    """Get the app record of a bundle from database."""
+    def query(connection):
+        row = connection.execute("SELECT * FROM app_records WHERE bundle_id = ?", (bundle_id,)).fetchone()
+        return _row_to_dict(row) if row else None
+
+    return await _run(query)
+
+
+async def list_app_records() -> List[Dict[str, Any]]:
+    """Get all app records from database."""
+    def query(connection):
+        rows = connection.execute("SELECT * FROM app_records ORDER BY bundle_id").fetchall()
+        return [_row_to_dict(row) for row in rows]
+
+    return await _run(query)
+
+
+async def save_app_record(bundle_id: str, app_title: str, app_description: Optional[str],
+                          app_picture_url: Optional[str]) -> None:
+    """Save the app record of a bundle to database."""
+    def query(connection):
+        connection.execute("""
+            INSERT INTO app_records (bundle_id, app_title, app_description, app_picture_url)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (bundle_id) DO UPDATE SET
+                app_title = excluded.app_title,
+                app_description = excluded.app_description,
+                app_picture_url = excluded.app_picture_url,
+                updated_at = strftime('%Y-%m-%dT%H:%M:%f', 'now')
+        """, (bundle_id, app_title, app_description, app_picture_url))
+
+    await _run(query)
+
+
+async def get_setting(key: str, default_value=None):
+    """Get setting from database."""
+    def query(connection):
+        row = connection.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return default_value
+        try:
+            return json.loads(row["value"])
+        except (json.JSONDecodeError, TypeError):
+            return row["value"]
+
+    return await _run(query)
+
+
+async def save_setting(key: str, value) -> None:
+    """Save setting to database."""
+    def query(connection):
+        connection.execute("""
+            INSERT INTO settings (key, value) VALUES (?, ?)
+            ON CONFLICT (key) DO UPDATE SET
+                value = excluded.value,
+                updated_at = strftime('%Y-%m-%dT%H:%M:%f', 'now')
+        """, (key, json.dumps(value)))
+
+    await _run(query)
+
+
+async def ping() -> None:
+    """Round trip to the database file, raises when it is unusable."""
+    await _run(lambda connection: connection.execute("SELECT 1").fetchone())
@@ -0,0 +1,144 @@
+"""
+Cold start report: import time of the app and latency of the first requests.
+
+Every run starts a fresh interpreter, imports the app like a new serverless instance
+does and times the first and second request of a route, without a server in between.
+Runs use the environment of the command (STORAGE_URL, DATABASE_URL, ...):
+
+    python -m app_distribution_server.startup_benchmark --runs 5 --path /healthz --path /get/<upload_id>/app.ipa
+    python -m app_distribution_server.startup_benchmark --imports
+"""
+import argparse
+import json
+import re
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+APP_MODULE = "app_distribution_server.app"
+DEFAULT_PATHS = ["/healthz", "/about"]
+RESULT_PREFIX = "STARTUP_BENCHMARK_RESULT "
+IMPORT_TIME_PATTERN = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def measure_cold_start(path: str) -> dict:
+    """Runs in the child interpreter, nothing from the app may be imported before."""
+    started_at = time.perf_counter()
+    from app_distribution_server import app as app_module
+    from app_distribution_server import lazy
+    imported_at = time.perf_counter()
+
+    from fastapi.testclient import TestClient
+
+    # Without the lifespan, like the first request an instance gets before startup work is done
+    client = TestClient(app_module.app)
+    first_request_started_at = time.perf_counter()
+    status_code = client.get(path, follow_redirects=False).status_code
+    first_request_ended_at = time.perf_counter()
+    client.get(path, follow_redirects=False)
+    second_request_ended_at = time.perf_counter()
+
+    return {
+        "import_seconds": imported_at - started_at,
+        "first_request_seconds": first_request_ended_at - first_request_started_at,
+        "second_request_seconds": second_request_ended_at - first_request_ended_at,
+        "status_code": status_code,
+        "lazy_load_seconds": dict(lazy.load_durations),
+    }
+
+
+def run_cold_start(path: str) -> dict:
+    process = subprocess.run(
+        [sys.executable, "-m", __spec__.name, "--child", path],
+        capture_output=True,
+        text=True,
+    )
+    for line in process.stdout.splitlines():
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line.removeprefix(RESULT_PREFIX))
+
+    raise RuntimeError(f"Benchmark of {path!r} failed:\n{process.stderr[-2000:]}")
+
+
+def print_benchmark(paths: list[str], runs: int):
+    path_width = max(len(path) for path in paths)
+    print(f"Median of {runs} cold starts per route (milliseconds)")
+    print(f"{'route':<{path_width}} {'status':>6} {'import':>8} {'first':>8} {'second':>8}  lazily loaded on first request")
+
+    for path in paths:
+        results = [run_cold_start(path) for _ in range(runs)]
+
+        def median_ms(key: str) -> float:
+            return statistics.median(result[key] for result in results) * 1000
+
+        lazy_loads = ", ".join(
+            f"{name} ({duration * 1000:.1f})"
+            for name, duration in sorted(results[-1]["lazy_load_seconds"].items())
+        )
+        print(
+            f"{path:<{path_width}} {results[-1]['status_code']:>6} {median_ms('import_seconds'):>8.1f}"
+            f" {median_ms('first_request_seconds'):>8.1f} {median_ms('second_request_seconds'):>8.1f}"
+            f"  {lazy_loads or '-'}"
+        )
+
+
+def print_import_report(limit: int):
+    """Parses `python -X importtime`, grouped by top level package and by module."""
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {APP_MODULE}"],
+        capture_output=True,
+        text=True,
+    )
+
+    self_us_by_package: dict[str, int] = defaultdict(int)
+    cumulative_us_by_module: dict[str, int] = {}
+    total_us = 0
+    for line in process.stderr.splitlines():
+        match = IMPORT_TIME_PATTERN.match(line)
+        if not match:
+            continue
+
+        self_us, cumulative_us, indentation, module_name = match.groups()
+        self_us_by_package[module_name.split(".")[0]] += int(self_us)
+        cumulative_us_by_module[module_name] = int(cumulative_us)
+        # Interpreter startup imports are reported too, only the app and what it pulls in count
+        if len(indentation) == 1 and module_name.split(".")[0] == APP_MODULE.split(".")[0]:
+            total_us += int(cumulative_us)
+
+    print(f"Importing {APP_MODULE} took {total_us / 1000:.1f}ms")
+
+    print(f"\nTop {limit} packages (own import time, ms)")
+    for package, self_us in sorted(self_us_by_package.items(), key=lambda item: -item[1])[:limit]:
+        print(f"{self_us / 1000:>10.1f}  {package}")
+
+    print(f"\nTop {limit} modules (cumulative import time, ms)")
+    for module_name, cumulative_us in sorted(cumulative_us_by_module.items(), key=lambda item: -item[1])[:limit]:
+        print(f"{cumulative_us / 1000:>10.1f}  {module_name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--imports", action="store_true", help="Print the import time report instead")
+    parser.add_argument("--limit", type=int, default=20, help="Rows of the import time report (default: 20)")
+    parser.add_argument("--runs", type=int, default=3, help="Cold starts per route (default: 3)")
+    parser.add_argument(
+        "--path",
+        action="append",
+        dest="paths",
+        help=f"Route to request, can be repeated (default: {' '.join(DEFAULT_PATHS)})",
+    )
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(RESULT_PREFIX + json.dumps(measure_cold_start(args.child)))
+    elif args.imports:
+        print_import_report(args.limit)
+    else:
+        print_benchmark(args.paths or DEFAULT_PATHS, args.runs)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,63 @@
+import asyncio
+import functools
+import hashlib
 import json
+import math
+import re
+import socket
+import time
 
 from fs import errors, open_fs, path
-from typing import Optional
+from concurrent.futures import Future
+from datetime import datetime, timezone
+from typing import BinaryIO, Optional, Union
 
-from app_distribution_server.build_info import BuildInfo, LegacyAppInfo, Platform
-from app_distribution_server.config import STORAGE_URL, AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY, AWS_ENDPOINT_URL, AWS_DEFAULT_REGION
+from app_distribution_server.build_info import (
+    ApkVariant,
+    AppRecord,
+    BuildInfo,
+    LegacyAppInfo,
+    Platform,
+    get_build_info_from_apk,
+    get_build_info_from_ipa,
+)
+from app_distribution_server.config import (
+    STORAGE_URL,
+    AWS_ACCESS_KEY_ID,
+    AWS_SECRET_ACCESS_KEY,
+    AWS_ENDPOINT_URL,
+    AWS_DEFAULT_REGION,
+    STORAGE_CACHE_DIRECTORY,
+    STORAGE_CACHE_MAX_BYTES,
+    STORAGE_CACHE_METADATA_TTL_SECONDS,
+    STORAGE_LAYOUT,
+    CDN_MODE,
+    APP_BASE_URL,
+    DELTA_BASE_BUILDS,
+    DELTA_MAX_RATIO,
+    UPLOAD_LOOKUP_CACHE_SIZE,
+    APP_RECORD_CACHE_TTL_SECONDS,
+    UPLOAD_LOOKUP_CACHE_TTL_SECONDS,
+    UPLOAD_LOOKUP_NEGATIVE_TTL_SECONDS,
+)
 from app_distribution_server.errors import NotFoundError
 from app_distribution_server.logger import logger
-from app_distribution_server import database
+from app_distribution_server.events import event_broker
+from app_distribution_server.lazy import LazyObject
+from app_distribution_server.storage_cache import CachedFS
+from app_distribution_server import cdn, database, deltas, icons, install_artifacts, remote_zip
+from app_distribution_server.install_artifacts import InstallArtifact
 import os
 
 PLIST_FILE_NAME = "info.plist"
 BUILD_INFO_JSON_FILE_NAME = "build_info.json"
 LEGACY_BUILD_INFO_JSON_FILE_NAME = "app_info.json"
 INDEXES_DIRECTORY = "_indexes"
+ICONS_DIRECTORY_NAME = "icons"
+DELTAS_DIRECTORY_NAME = "deltas"
+VARIANTS_DIRECTORY_NAME = "variants"
+APP_PICTURES_DIRECTORY = path.join(INDEXES_DIRECTORY, "app_pictures")
+SHARD_DIRECTORY_NAME_PATTERN = re.compile(r"^[0-9a-f]{2}$")
 
 
 # Configure filesystem with R2/S3 credentials if needed
@@ -30,13 +74,109 @@ def get_filesystem():
         
         logger.info(f"Initializing S3 filesystem with endpoint: {AWS_ENDPOINT_URL}")
     
-    return open_fs(STORAGE_URL, create=True)
+    storage_filesystem = open_fs(STORAGE_URL, create=True)
 
-filesystem = get_filesystem()
+    if STORAGE_CACHE_DIRECTORY:
+        logger.info(
+            f"Caching {STORAGE_URL!r} reads in {STORAGE_CACHE_DIRECTORY!r}"
+            f" (up to {STORAGE_CACHE_MAX_BYTES} bytes)"
+        )
+        return CachedFS(
+            storage_filesystem,
+            cache_directory=STORAGE_CACHE_DIRECTORY,
+            max_bytes=STORAGE_CACHE_MAX_BYTES,
+            mutable_ttl_seconds=STORAGE_CACHE_METADATA_TTL_SECONDS,
+        )
+
+    return storage_filesystem
+
+# Opened on first use, an S3 bucket (and boto3) is not needed to serve most pages
+filesystem = LazyObject(get_filesystem, "storage filesystem")
+
+
+# Resolved directory of recently used uploads with its expiry time
+_upload_directories: dict[str, tuple[float, str]] = {}
+
+# Platform of recently looked up uploads with its expiry time, None for ids known not to exist
+_upload_platforms: dict[str, tuple[float, Optional[Platform]]] = {}
+
+# App records read from storage with their expiry time, None for bundles without one
+_stored_app_records: dict[str, tuple[float, Optional[AppRecord]]] = {}
+
+
+def get_sharded_upload_directory(upload_id: str) -> str:
+    """Sharded location of an upload, e.g. `3f/a2/<upload_id>`."""
+    digest = hashlib.sha1(upload_id.encode("utf-8")).hexdigest()
+    return path.join(digest[:2], digest[2:4], upload_id)
+
+
+def remember_upload_directory(upload_id: str, directory: str, ttl_seconds: float = math.inf):
+    _upload_directories.pop(upload_id, None)
+    _upload_directories[upload_id] = (time.monotonic() + ttl_seconds, directory)
+
+    while len(_upload_directories) > UPLOAD_LOOKUP_CACHE_SIZE:
+        _upload_directories.pop(next(iter(_upload_directories)))
+
+
+def get_upload_directory(upload_id: str) -> str:
+    """
+    Resolves where an upload lives.
+    Uploads are found in the sharded layout first, then in the legacy flat layout
+    (directly at the storage root) which is kept readable while they get migrated.
+    The result is reused, so storage is only probed once per upload and TTL.
+    """
+    cached_directory = _upload_directories.get(upload_id)
+    if cached_directory is not None and time.monotonic() < cached_directory[0]:
+        return cached_directory[1]
+
+    sharded_directory = get_sharded_upload_directory(upload_id)
+    # Build info is the last file written by the migrator, it marks a complete directory
+    if filesystem.exists(path.join(sharded_directory, BUILD_INFO_JSON_FILE_NAME)):
+        # Sharded uploads never move back
+        remember_upload_directory(upload_id, sharded_directory)
+        return sharded_directory
+
+    if filesystem.exists(upload_id):
+        # Until another process migrates it to the sharded layout
+        remember_upload_directory(upload_id, upload_id, UPLOAD_LOOKUP_CACHE_TTL_SECONDS)
+        return upload_id
+
+    # Where a new upload is written
+    directory = upload_id if STORAGE_LAYOUT == "flat" else sharded_directory
+    remember_upload_directory(upload_id, directory, UPLOAD_LOOKUP_NEGATIVE_TTL_SECONDS)
+    return directory
+
+
+def list_upload_ids():
+    """
+    Yields the ids of all uploads, in both the sharded and the legacy flat layout.
+    Their directories are remembered on the way, scans then do not probe storage per upload.
+    """
+    entry_names = [entry_name for entry_name in filesystem.listdir(".") if entry_name != INDEXES_DIRECTORY]
+    legacy_upload_ids = {entry_name for entry_name in entry_names if not SHARD_DIRECTORY_NAME_PATTERN.match(entry_name)}
+    migrating_upload_ids = set()
+
+    for entry_name in entry_names:
+        if not SHARD_DIRECTORY_NAME_PATTERN.match(entry_name):
+            continue
+
+        for second_level_name in filesystem.listdir(entry_name):
+            shard_directory = path.join(entry_name, second_level_name)
+            for upload_id in filesystem.listdir(shard_directory):
+                if upload_id in legacy_upload_ids:
+                    # Being migrated, get_upload_directory checks which copy is complete
+                    migrating_upload_ids.add(upload_id)
+                else:
+                    remember_upload_directory(upload_id, path.join(shard_directory, upload_id))
+                yield upload_id
+
+    for upload_id in legacy_upload_ids - migrating_upload_ids:
+        remember_upload_directory(upload_id, upload_id, UPLOAD_LOOKUP_CACHE_TTL_SECONDS)
+        yield upload_id
 
 
 def create_parent_directories(upload_id: str):
-    filesystem.makedirs(upload_id, recreate=True)
+    filesystem.makedirs(get_upload_directory(upload_id), recreate=True)
 
 
 async def find_existing_upload(bundle_id: str, version_code: Optional[int] = None, build_number: Optional[str] = None) -> Optional[str]:
@@ -53,9 +193,9 @@ async def find_existing_upload(bundle_id: str, version_code: Optional[int] = Non
         logger.warning(f"Database query failed, falling back to filesystem: {e}")
     
     # Fallback to filesystem
-    for upload_id in filesystem.listdir("."):
+    for upload_id in list_upload_ids():
         try:
-            build_info = await load_build_info(upload_id)
+            build_info = await load_stored_build_info(upload_id)
             if build_info.bundle_id == bundle_id:
                 if version_code is not None and hasattr(build_info, 'version_code') and build_info.version_code == version_code:
                     return upload_id
@@ -76,44 +216,122 @@ async def save_upload(build_info: BuildInfo, app_file_content: bytes):
     if existing_upload_id:
         await delete_upload(existing_upload_id)
     
-    create_parent_directories(build_info.upload_id)
-    save_build_info(build_info)
-    save_app_file(build_info, app_file_content)
+    # Storage writes are blocking, run them off the event loop so concurrent uploads overlap
+    await asyncio.to_thread(create_parent_directories, build_info.upload_id)
+    if build_info._icon_content is not None:
+        try:
+            await asyncio.to_thread(save_icon, get_icons_directory(build_info.upload_id), build_info._icon_content)
+        except Exception as e:
+            # Icons are best effort, the build is stored without one
+            logger.warning(f"Failed to save the app icon of {build_info.upload_id!r}: {e}")
+            build_info.has_icon = False
+    await asyncio.to_thread(save_build_info, build_info)
+    await asyncio.to_thread(save_app_file, build_info, app_file_content)
+    await asyncio.to_thread(save_install_artifacts, build_info)
     await set_latest_build(build_info)
+    remember_upload_platform(build_info.upload_id, build_info.platform)
+    await cdn.purge(cdn.APPS_SURROGATE_KEY, cdn.get_bundle_surrogate_key(build_info.bundle_id))
+    event_broker.publish("upload", {
+        "upload_id": build_info.upload_id,
+        "bundle_id": build_info.bundle_id,
+        "app_title": build_info.app_title,
+        "bundle_version": build_info.bundle_version,
+        "platform": build_info.platform.value,
+    })
     
     # Also save to database for persistence
     try:
-        file_url = f"/api/uploads/{build_info.upload_id}/{build_info.platform.app_file_name}"
-        await database.save_app_metadata(
-            upload_id=build_info.upload_id,
-            app_title=build_info.app_title,
-            bundle_id=build_info.bundle_id,
-            bundle_version=build_info.bundle_version,
-            platform=build_info.platform.value,
-            file_size=build_info.file_size,
-            file_url=file_url,
-            version_code=getattr(build_info, 'version_code', None),
-            build_number=getattr(build_info, 'build_number', None)
-        )
+        await database.save_app_metadata(**get_app_metadata_row(build_info))
         logger.info(f"App metadata saved to database for upload {build_info.upload_id}")
     except Exception as e:
         logger.error(f"Failed to save app metadata to database: {e}")
         # Continue without failing the upload
 
+    try:
+        await schedule_deltas(build_info)
+    except Exception as e:
+        logger.warning(f"Failed to schedule the deltas of upload {build_info.upload_id!r}: {e}")
+
+
+def get_app_metadata_row(build_info: BuildInfo) -> dict:
+    """Row of the `apps` table for a build, as arguments of `database.save_app_metadata`."""
+    return {
+        "upload_id": build_info.upload_id,
+        "app_title": build_info.app_title,
+        "bundle_id": build_info.bundle_id,
+        "bundle_version": build_info.bundle_version,
+        "platform": build_info.platform.value,
+        "file_size": build_info.file_size,
+        "file_url": f"/api/uploads/{build_info.upload_id}/{build_info.platform.app_file_name}",
+        "version_code": build_info.version_code,
+        "build_number": build_info.build_number,
+        "has_icon": build_info.has_icon,
+        "variants": json.dumps([variant.model_dump() for variant in build_info.variants]) if build_info.variants else None,
+    }
+
+
+def remember_upload_platform(upload_id: str, platform: Optional[Platform]):
+    ttl_seconds = UPLOAD_LOOKUP_CACHE_TTL_SECONDS if platform else UPLOAD_LOOKUP_NEGATIVE_TTL_SECONDS
+    _upload_platforms.pop(upload_id, None)
+    _upload_platforms[upload_id] = (time.monotonic() + ttl_seconds, platform)
 
-def get_upload_platform(upload_id: str) -> Optional[Platform]:
-    for platform in Platform:
-        if filesystem.exists(path.join(upload_id, platform.app_file_name)):
+    # Oldest lookups go first, a scan of unknown ids cannot grow the cache unbounded
+    while len(_upload_platforms) > UPLOAD_LOOKUP_CACHE_SIZE:
+        _upload_platforms.pop(next(iter(_upload_platforms)))
+
+
+def probe_upload_platform(upload_id: str) -> Optional[Platform]:
+    """
+    Resolves the platform from storage: the build info names it and the app file
+    confirms the upload is complete. Legacy uploads without build info are probed
+    for both app files.
+    """
+    upload_directory = get_upload_directory(upload_id)
+    try:
+        with filesystem.open(path.join(upload_directory, BUILD_INFO_JSON_FILE_NAME), "r") as build_info_file:
+            candidate_platforms = [Platform(json.load(build_info_file)["platform"])]
+    except (errors.ResourceNotFound, KeyError, ValueError):
+        candidate_platforms = list(Platform)
+
+    for platform in candidate_platforms:
+        if filesystem.exists(path.join(upload_directory, platform.app_file_name)):
             return platform
 
     return None
 
 
-def get_upload_asserted_platform(
+async def get_upload_platform(upload_id: str) -> Optional[Platform]:
+    """
+    Platform of an upload, or None when it does not exist. Answered from the lookup
+    cache, then the database metadata, storage is only probed as a last resort.
+    """
+    cached_lookup = _upload_platforms.get(upload_id)
+    if cached_lookup is not None:
+        expires_at, platform = cached_lookup
+        if time.monotonic() < expires_at:
+            return platform
+
+    platform = None
+    try:
+        app_metadata = await database.get_app_metadata(upload_id)
+        if app_metadata and app_metadata.get("platform"):
+            platform = Platform(app_metadata["platform"])
+    except Exception as e:
+        if database.DATABASE_URL:
+            logger.warning(f"Failed to look up upload {upload_id!r} in database: {e}")
+
+    if platform is None:
+        platform = await asyncio.to_thread(probe_upload_platform, upload_id)
+
+    remember_upload_platform(upload_id, platform)
+    return platform
+
+
+async def get_upload_asserted_platform(
     upload_id: str,
     expected_platform: Optional[Platform] = None,
 ) -> Platform:
-    upload_platform = get_upload_platform(upload_id)
+    upload_platform = await get_upload_platform(upload_id)
 
     if upload_platform is None:
         raise NotFoundError()
@@ -128,8 +346,7 @@ def get_upload_asserted_platform(
 
 
 def save_build_info(build_info: BuildInfo):
-    upload_id = build_info.upload_id
-    filepath = f"{upload_id}/{BUILD_INFO_JSON_FILE_NAME}"
+    filepath = path.join(get_upload_directory(build_info.upload_id), BUILD_INFO_JSON_FILE_NAME)
 
     with filesystem.open(filepath, "w") as app_info_file:
         app_info_file.write(
@@ -138,6 +355,12 @@ def save_build_info(build_info: BuildInfo):
 
 
 async def load_build_info(upload_id: str, expected_platform: Optional[Platform] = None) -> BuildInfo:
+    build_info = await load_stored_build_info(upload_id)
+    return apply_app_record(build_info, await load_app_record(build_info.bundle_id))
+
+
+async def load_stored_build_info(upload_id: str) -> BuildInfo:
+    """Build info as stored with the upload, without the app record applied."""
     # First try to get from database
     try:
         app_metadata = await database.get_app_metadata(upload_id)
@@ -152,47 +375,66 @@ async def load_build_info(upload_id: str, expected_platform: Optional[Platform]
                 build_number=app_metadata.get("build_number", 1),
                 platform=Platform(app_metadata.get("platform", "android")),
                 file_size=app_metadata.get("file_size", 0),
-                created_at=app_metadata.get("created_at")
+                created_at=app_metadata.get("created_at"),
+                has_icon=bool(app_metadata.get("has_icon")),
+                variants=json.loads(app_metadata.get("variants") or "[]"),
             )
     except Exception as e:
         logger.warning(f"Failed to load app metadata from database: {e}")
     
     # Fall back to file system
     try:
-        filepath = path.join(upload_id, BUILD_INFO_JSON_FILE_NAME)
+        return await asyncio.to_thread(read_build_info_from_storage, upload_id)
+    except Exception as e:
+        logger.error(f"Failed to load build info for {upload_id}: {e}")
+        # Return a minimal build info if everything fails
+        return BuildInfo(
+            upload_id=upload_id,
+            app_title="Unknown App",
+            bundle_id="unknown",
+            bundle_version="1.0",
+            version_code=1,
+            build_number=1,
+            platform=Platform.ANDROID,
+            file_size=0,
+            created_at=None
+        )
+
+
+def read_build_info_from_storage(upload_id: str) -> BuildInfo:
+    """
+    Build info from `build_info.json`, migrating a v1 `app_info.json` or rebuilding it
+    from the app file when it is missing. Never reads the database.
+    """
+    try:
+        filepath = path.join(get_upload_directory(upload_id), BUILD_INFO_JSON_FILE_NAME)
         with filesystem.open(filepath, "r") as app_info_file:
             build_info_json = json.load(app_info_file)
             return BuildInfo.model_validate(build_info_json)
+    except errors.ResourceNotFound:
+        pass
 
+    try:
+        return migrate_legacy_app_info(upload_id)
     except errors.ResourceNotFound:
-        try:
-            return migrate_legacy_app_info(upload_id)
-        except Exception as e:
-            logger.error(f"Failed to load build info for {upload_id}: {e}")
-            # Return a minimal build info if everything fails
-            return BuildInfo(
-                upload_id=upload_id,
-                app_title="Unknown App",
-                bundle_id="unknown",
-                bundle_version="1.0",
-                version_code=1,
-                build_number=1,
-                platform=Platform.ANDROID,
-                file_size=0,
-                created_at=None
-            )
+        pass
+    except Exception as e:
+        logger.warning(f"Failed to migrate the legacy app info of {upload_id}: {e}")
+
+    return rebuild_build_info(upload_id)
 
 
 def migrate_legacy_app_info(upload_id: str) -> BuildInfo:
     logger.info(f"Migrating legacy upload {upload_id!r} to v2")
 
-    filepath = path.join(upload_id, LEGACY_BUILD_INFO_JSON_FILE_NAME)
+    upload_directory = get_upload_directory(upload_id)
+    filepath = path.join(upload_directory, LEGACY_BUILD_INFO_JSON_FILE_NAME)
     with filesystem.open(filepath, "r") as app_info_file:
         legacy_info_json = json.load(app_info_file)
         legacy_app_info = LegacyAppInfo.model_validate(legacy_info_json)
 
     file_size = filesystem.getsize(
-        path.join(upload_id, Platform.ios.app_file_name),
+        path.join(upload_directory, Platform.ios.app_file_name),
     )
 
     build_info = BuildInfo(
@@ -205,17 +447,189 @@ def migrate_legacy_app_info(upload_id: str) -> BuildInfo:
         platform=Platform.ios,
     )
 
+    # v1 did not record the build number nor the icon, both are cheap to read from the IPA now
+    try:
+        extracted_build_info = extract_stored_build_info(upload_id, Platform.ios)
+        build_info.build_number = extracted_build_info.build_number
+        if extracted_build_info._icon_content is not None:
+            save_icon(get_icons_directory(upload_id), extracted_build_info._icon_content)
+            build_info.has_icon = True
+    except Exception as e:
+        logger.warning(f"Failed to read the IPA of legacy upload {upload_id!r}: {e}")
+
     save_build_info(build_info)
     logger.info(f"Successfully migrated legacy upload {upload_id!r} to v2")
 
     return build_info
 
 
+def open_app_file_reader(upload_id: str, platform: Platform) -> BinaryIO:
+    """Seekable reader of a stored build, which only downloads the parts that are read."""
+    return remote_zip.open_ranged_reader(
+        filesystem.resolve(),
+        path.join(get_upload_directory(upload_id), platform.app_file_name),
+    )
+
+
+def extract_stored_build_info(upload_id: str, platform: Platform) -> BuildInfo:
+    """Parses the metadata of a stored build again, without downloading all of it."""
+    with open_app_file_reader(upload_id, platform) as app_file:
+        if platform == Platform.ios:
+            build_info = get_build_info_from_ipa(upload_id, app_file)
+        else:
+            build_info = get_build_info_from_apk(upload_id, app_file)
+
+        if isinstance(app_file, remote_zip.RangedReader):
+            logger.info(
+                f"Read the metadata of {upload_id!r} with {app_file.request_count} requests"
+                f" ({app_file.fetched_bytes} of {app_file.size} bytes)"
+            )
+
+    return build_info
+
+
+def rebuild_build_info(upload_id: str) -> BuildInfo:
+    """Recreates the `build_info.json` of an upload from its app file."""
+    upload_directory = get_upload_directory(upload_id)
+    platform = next(
+        (
+            platform
+            for platform in Platform
+            if filesystem.exists(path.join(upload_directory, platform.app_file_name))
+        ),
+        None,
+    )
+    if platform is None:
+        raise NotFoundError()
+
+    logger.info(f"Rebuilding the build info of {upload_id!r} from its {platform.display_name} app file")
+    build_info = extract_stored_build_info(upload_id, platform)
+    build_info.created_at = filesystem.getinfo(
+        path.join(upload_directory, platform.app_file_name),
+        namespaces=["details"],
+    ).modified
+    if build_info._icon_content is not None:
+        save_icon(get_icons_directory(upload_id), build_info._icon_content)
+
+    save_build_info(build_info)
+    return build_info
+
+
+def get_icons_directory(upload_id: str) -> str:
+    return path.join(get_upload_directory(upload_id), ICONS_DIRECTORY_NAME)
+
+
+def save_icon(directory: str, content: bytes):
+    """Stores an icon as is, its thumbnails are added in the background by the icon workers."""
+    image_format = icons.get_image_format(content)
+    if image_format is None:
+        raise ValueError("Unsupported icon image format")
+
+    filesystem.makedirs(directory, recreate=True)
+    with filesystem.open(path.join(directory, f"{icons.ORIGINAL_ICON_NAME}.{image_format}"), "wb") as file:
+        file.write(content)
+
+    def write_thumbnail(file_name: str, thumbnail: bytes):
+        # Written aside first, a thumbnail is never served half written
+        temporary_path = path.join(directory, f"{file_name}.tmp")
+        with filesystem.open(temporary_path, "wb") as file:
+            file.write(thumbnail)
+        filesystem.move(temporary_path, path.join(directory, file_name), overwrite=True)
+
+    return icons.submit_thumbnails(content, write_thumbnail)
+
+
+def load_icon(directory: str, size: int, accept_webp: bool) -> Optional[tuple[bytes, str, bool]]:
+    """Best stored file for the size as `(content, media type, is_thumbnail)`."""
+    if not filesystem.exists(directory):
+        return None
+
+    file_name = icons.select_icon_file(filesystem.listdir(directory), size, accept_webp)
+    if file_name is None:
+        return None
+
+    with filesystem.open(path.join(directory, file_name), "rb") as file:
+        content = file.read()
+
+    image_format = path.splitext(file_name)[1].lstrip(".")
+    return content, icons.MEDIA_TYPES[image_format], not file_name.startswith(icons.ORIGINAL_ICON_NAME)
+
+
+def get_app_picture_directory(bundle_id: str, picture_id: str) -> str:
+    return path.join(APP_PICTURES_DIRECTORY, bundle_id, picture_id)
+
+
+def save_app_picture(bundle_id: str, content: bytes) -> str:
+    """Stores a picture uploaded from the admin pages and returns its URL."""
+    picture_id = hashlib.sha256(content).hexdigest()[:16]
+    save_icon(get_app_picture_directory(bundle_id, picture_id), content)
+    return f"/app-pictures/{bundle_id}/{picture_id}"
+
+
+def get_install_artifacts_directory(upload_id: str) -> str:
+    return path.join(get_upload_directory(upload_id), install_artifacts.INSTALL_ARTIFACTS_DIRECTORY_NAME)
+
+
+def save_install_artifacts(build_info: BuildInfo, base_url: str = APP_BASE_URL):
+    directory = get_install_artifacts_directory(build_info.upload_id)
+    filesystem.makedirs(directory, recreate=True)
+
+    for file_name, content in install_artifacts.render_install_artifacts(build_info, base_url).items():
+        with filesystem.open(path.join(directory, file_name), "wb") as file:
+            file.write(content)
+
+    install_artifacts.cache.invalidate(build_info.upload_id)
+
+
+def get_install_artifacts_base_url(upload_id: str) -> Optional[str]:
+    """Base URL the artifacts of an upload were rendered for, None when they are missing."""
+    artifact = load_install_artifact(upload_id, install_artifacts.MANIFEST_FILE_NAME)
+    return json.loads(artifact.content).get("base_url") if artifact else None
+
+
+def load_install_artifact(upload_id: str, file_name: str) -> Optional[InstallArtifact]:
+    artifact = install_artifacts.cache.get(upload_id, file_name)
+    if artifact is not None:
+        return artifact
+
+    try:
+        with filesystem.open(path.join(get_install_artifacts_directory(upload_id), file_name), "rb") as file:
+            content = file.read()
+    except errors.ResourceNotFound:
+        return None
+
+    artifact = InstallArtifact(
+        content=content,
+        media_type=install_artifacts.MEDIA_TYPES[file_name],
+        etag=install_artifacts.get_etag(content),
+    )
+    install_artifacts.cache.set(upload_id, file_name, artifact)
+    return artifact
+
+
+async def ensure_install_artifact(upload_id: str, file_name: str) -> Optional[InstallArtifact]:
+    """Artifact of an upload, rendered on first use for builds uploaded before they existed."""
+    artifact = await asyncio.to_thread(load_install_artifact, upload_id, file_name)
+    if artifact is not None:
+        return artifact
+
+    # Rendered already, the file does not exist for this platform
+    if await asyncio.to_thread(load_install_artifact, upload_id, install_artifacts.MANIFEST_FILE_NAME):
+        return None
+
+    if await get_upload_platform(upload_id) is None:
+        return None
+
+    build_info = await load_stored_build_info(upload_id)
+    await asyncio.to_thread(save_install_artifacts, build_info)
+    return await asyncio.to_thread(load_install_artifact, upload_id, file_name)
+
+
 def get_app_file_path(
     build_info: BuildInfo,
 ):
     return path.join(
-        build_info.upload_id,
+        get_upload_directory(build_info.upload_id),
         build_info.platform.app_file_name,
     )
 
@@ -235,7 +649,145 @@ def load_app_file(
         return app_file.read()
 
 
+def get_apk_variant_file_path(upload_id: str, variant: ApkVariant) -> str:
+    return path.join(get_upload_directory(upload_id), VARIANTS_DIRECTORY_NAME, variant.file_name)
+
+
+async def save_apk_variants(upload_id: str, variants: list[tuple[ApkVariant, bytes]]) -> BuildInfo:
+    """
+    Stores ABI-specific APKs of an Android upload, replacing variants for the same ABIs,
+    and indexes them in its build info.
+    """
+    build_info = await asyncio.to_thread(read_build_info_from_storage, upload_id)
+
+    def write_variant_files():
+        filesystem.makedirs(path.join(get_upload_directory(upload_id), VARIANTS_DIRECTORY_NAME), recreate=True)
+        for variant, content in variants:
+            with filesystem.open(get_apk_variant_file_path(upload_id, variant), "wb") as variant_file:
+                variant_file.write(content)
+
+    await asyncio.to_thread(write_variant_files)
+
+    new_variants = {variant.name: variant for variant, _ in variants}
+    replaced_variants = [
+        variant
+        for variant in build_info.variants
+        if variant.name in new_variants and variant.file_name != new_variants[variant.name].file_name
+    ]
+    build_info.variants = sorted(
+        [variant for variant in build_info.variants if variant.name not in new_variants] + list(new_variants.values()),
+        key=lambda variant: variant.file_size,
+    )
+    await asyncio.to_thread(save_build_info, build_info)
+
+    try:
+        await database.save_app_metadata(**get_app_metadata_row(build_info))
+    except Exception as e:
+        logger.error(f"Failed to save app metadata to database: {e}")
+
+    for variant in replaced_variants:
+        try:
+            await asyncio.to_thread(filesystem.remove, get_apk_variant_file_path(upload_id, variant))
+        except errors.ResourceNotFound:
+            pass
+
+    await cdn.purge(cdn.get_upload_surrogate_key(upload_id), cdn.get_bundle_surrogate_key(build_info.bundle_id))
+    logger.info(f"Stored APK variants {list(new_variants)} of upload {upload_id!r}")
+    return build_info
+
+
+def load_apk_variant_file(upload_id: str, variant: ApkVariant) -> bytes:
+    with filesystem.open(get_apk_variant_file_path(upload_id, variant), "rb") as variant_file:
+        return variant_file.read()
+
+
+def get_delta_file_path(upload_id: str, from_upload_id: str) -> str:
+    return path.join(
+        get_upload_directory(upload_id),
+        DELTAS_DIRECTORY_NAME,
+        f"{from_upload_id}{deltas.DELTA_FILE_EXTENSION}",
+    )
+
+
+def build_delta(build_info: BuildInfo, base_build_info: BuildInfo) -> Optional[int]:
+    """
+    Stores the delta from a previous build to a new one and returns its size,
+    or None when it is too close to the full APK to be worth serving.
+    """
+    delta_file_path = get_delta_file_path(build_info.upload_id, base_build_info.upload_id)
+    # Written aside first, a delta is never served half written
+    temporary_path = f"{delta_file_path}.tmp"
+    filesystem.makedirs(path.dirname(delta_file_path), recreate=True)
+
+    with (
+        filesystem.openbin(get_app_file_path(base_build_info), "r") as old_file,
+        filesystem.openbin(get_app_file_path(build_info), "r") as new_file,
+        filesystem.openbin(temporary_path, "w") as output,
+    ):
+        deltas.create_delta(old_file, new_file, output)
+
+    delta_size = filesystem.getsize(temporary_path)
+    if delta_size > build_info.file_size * DELTA_MAX_RATIO:
+        filesystem.remove(temporary_path)
+        logger.info(
+            f"Delta from {base_build_info.upload_id!r} to {build_info.upload_id!r} not kept"
+            f" ({delta_size} of {build_info.file_size} bytes)"
+        )
+        return None
+
+    filesystem.move(temporary_path, delta_file_path, overwrite=True)
+    logger.info(
+        f"Delta from {base_build_info.upload_id!r} to {build_info.upload_id!r} stored"
+        f" ({delta_size} of {build_info.file_size} bytes)"
+    )
+    return delta_size
+
+
+async def schedule_deltas(build_info: BuildInfo) -> list[Future]:
+    """Queues the deltas from the previous Android builds of the bundle to a new build."""
+    if build_info.platform != Platform.android or DELTA_BASE_BUILDS <= 0:
+        return []
+
+    base_builds = [
+        build
+        for build in await list_builds_by_bundle_id(build_info.bundle_id)
+        if build.upload_id != build_info.upload_id and build.platform == Platform.android
+    ][:DELTA_BASE_BUILDS]
+
+    return [
+        deltas.submit_delta(
+            build_info.upload_id,
+            base_build.upload_id,
+            functools.partial(build_delta, build_info, base_build),
+        )
+        for base_build in base_builds
+    ]
+
+
+def load_delta(upload_id: str, from_upload_id: str) -> Optional[bytes]:
+    try:
+        with filesystem.openbin(get_delta_file_path(upload_id, from_upload_id), "r") as delta_file:
+            return delta_file.read()
+    except errors.ResourceNotFound:
+        return None
+
+
+def get_delta_size(upload_id: str, from_upload_id: str) -> Optional[int]:
+    try:
+        return filesystem.getsize(get_delta_file_path(upload_id, from_upload_id))
+    except errors.ResourceNotFound:
+        return None
+
+
 async def delete_upload(upload_id: str):
+    surrogate_keys = [cdn.APPS_SURROGATE_KEY, cdn.get_upload_surrogate_key(upload_id)]
+    if CDN_MODE:
+        try:
+            build_info = await load_build_info(upload_id)
+            surrogate_keys.append(cdn.get_bundle_surrogate_key(build_info.bundle_id))
+        except Exception as e:
+            logger.warning(f"Failed to resolve the bundle of {upload_id!r} for the CDN purge: {e}")
+
     try:
         # Delete from database
         await database.delete_app_metadata(upload_id)
@@ -245,15 +797,21 @@ async def delete_upload(upload_id: str):
     
     try:
         # Delete from filesystem
-        if filesystem.exists(upload_id):
-            filesystem.removetree(upload_id)
-            logger.info(f"Upload directory {upload_id!r} deleted successfully")
+        upload_directory = get_upload_directory(upload_id)
+        if filesystem.exists(upload_directory):
+            filesystem.removetree(upload_directory)
+            _upload_directories.pop(upload_id, None)
+            install_artifacts.cache.invalidate(upload_id)
+            remember_upload_platform(upload_id, None)
+            logger.info(f"Upload directory {upload_directory!r} deleted successfully")
         else:
             logger.info(f"Upload directory {upload_id!r} does not exist (already deleted or lost)")
     except Exception as e:
         logger.warning(f"Failed to delete upload directory {upload_id!r}: {e}")
         # Don't raise - allow the upload to continue even if file deletion fails
 
+    await cdn.purge(*surrogate_keys)
+
 
 def get_latest_upload_by_bundle_id_filepath(bundle_id):
     return path.join(INDEXES_DIRECTORY, "latest_upload_by_bundle_id", f"{bundle_id}.txt")
@@ -284,6 +842,12 @@ def get_latest_upload_id_by_bundle_id(bundle_id: str) -> Optional[str]:
 
 async def list_builds_by_bundle_id(bundle_id: str):
     """Return a list of BuildInfo objects for all uploads with the given bundle_id, sorted by created_at descending."""
+    builds = await _list_stored_builds_by_bundle_id(bundle_id)
+    app_record = await load_app_record(bundle_id)
+    return [apply_app_record(build, app_record) for build in builds]
+
+
+async def _list_stored_builds_by_bundle_id(bundle_id: str):
     builds = []
     
     # Try database first
@@ -293,7 +857,7 @@ async def list_builds_by_bundle_id(bundle_id: str):
             if app['bundle_id'] == bundle_id:
                 # Convert database record to BuildInfo-like object
                 try:
-                    build_info = await load_build_info(app['upload_id'])
+                    build_info = await load_stored_build_info(app['upload_id'])
                     builds.append(build_info)
                 except Exception:
                     # If file doesn't exist, create BuildInfo from database data
@@ -308,7 +872,9 @@ async def list_builds_by_bundle_id(bundle_id: str):
                         file_size=app['file_size'],
                         created_at=app['created_at'].timestamp() if app.get('created_at') else None,
                         version_code=app.get('version_code'),
-                        build_number=app.get('build_number')
+                        build_number=app.get('build_number'),
+                        has_icon=bool(app.get('has_icon')),
+                        variants=json.loads(app.get('variants') or "[]"),
                     )
                     builds.append(build_info)
         if builds:
@@ -318,12 +884,306 @@ async def list_builds_by_bundle_id(bundle_id: str):
         logger.warning(f"Database query failed, falling back to filesystem: {e}")
     
     # Fallback to filesystem
-    for upload_id in filesystem.listdir("."):
+    for upload_id in list_upload_ids():
         try:
-            build_info = await load_build_info(upload_id)
+            build_info = await load_stored_build_info(upload_id)
             if build_info.bundle_id == bundle_id:
                 builds.append(build_info)
         except Exception:
             continue
     builds.sort(key=lambda b: b.created_at or 0, reverse=True)
     return builds
+
+
+def list_indexed_bundle_ids() -> list[str]:
+    """Bundles that have a latest build index entry."""
+    indexes_directory = path.dirname(get_latest_upload_by_bundle_id_filepath("_"))
+    if not filesystem.exists(indexes_directory):
+        return []
+
+    return [path.splitext(index_file_name)[0] for index_file_name in filesystem.listdir(indexes_directory)]
+
+
+def get_app_record_filepath(bundle_id: str) -> str:
+    return path.join(INDEXES_DIRECTORY, "apps", f"{bundle_id}.json")
+
+
+def _read_stored_app_record(bundle_id: str) -> Optional[AppRecord]:
+    try:
+        with filesystem.open(get_app_record_filepath(bundle_id), "r") as file:
+            return AppRecord.model_validate_json(file.read())
+    except errors.ResourceNotFound:
+        return None
+
+
+def _load_stored_app_record(bundle_id: str) -> Optional[AppRecord]:
+    """Storage copy of an app record, cached: every build load and download looks it up."""
+    cached = _stored_app_records.get(bundle_id)
+    if cached is not None and cached[0] > time.monotonic():
+        return cached[1]
+
+    app_record = _read_stored_app_record(bundle_id)
+    _stored_app_records[bundle_id] = (time.monotonic() + APP_RECORD_CACHE_TTL_SECONDS, app_record)
+    return app_record
+
+
+def list_stored_app_records() -> list[AppRecord]:
+    records_directory = path.dirname(get_app_record_filepath("_"))
+    if not filesystem.exists(records_directory):
+        return []
+
+    app_records = []
+    for file_name in filesystem.listdir(records_directory):
+        app_record = _read_stored_app_record(path.splitext(file_name)[0])
+        if app_record is not None:
+            app_records.append(app_record)
+    return app_records
+
+
+def _write_stored_app_record(app_record: AppRecord):
+    filepath = get_app_record_filepath(app_record.bundle_id)
+    filesystem.makedirs(path.dirname(filepath), recreate=True)
+
+    with filesystem.open(filepath, "w") as file:
+        file.write(app_record.model_dump_json(indent=2))
+    _stored_app_records.pop(app_record.bundle_id, None)
+
+
+async def load_app_record(bundle_id: str) -> Optional[AppRecord]:
+    """
+    The database is authoritative when one is configured, the copy kept in storage
+    serves deployments without a database and periods where it is unreachable.
+    """
+    try:
+        app_record = await database.get_app_record(bundle_id)
+        return AppRecord.model_validate(app_record) if app_record else None
+    except Exception as e:
+        if database.DATABASE_URL:
+            logger.warning(f"Failed to load app record of {bundle_id!r} from database: {e}")
+
+    return await asyncio.to_thread(_load_stored_app_record, bundle_id)
+
+
+async def list_app_records() -> list[AppRecord]:
+    try:
+        return [AppRecord.model_validate(app_record) for app_record in await database.list_app_records()]
+    except Exception as e:
+        if database.DATABASE_URL:
+            logger.warning(f"Failed to list app records from database: {e}")
+
+    return await asyncio.to_thread(list_stored_app_records)
+
+
+async def save_app_record(app_record: AppRecord):
+    now = datetime.now(timezone.utc)
+    app_record = app_record.model_copy(update={
+        "created_at": app_record.created_at or now,
+        "updated_at": now,
+    })
+    await asyncio.to_thread(_write_stored_app_record, app_record)
+
+    try:
+        await database.save_app_record(
+            bundle_id=app_record.bundle_id,
+            app_title=app_record.app_title,
+            app_description=app_record.app_description,
+            app_picture_url=app_record.app_picture_url,
+        )
+    except Exception as e:
+        if database.DATABASE_URL:
+            logger.error(f"Failed to save app record of {app_record.bundle_id!r} to database: {e}")
+
+    await cdn.purge(cdn.APPS_SURROGATE_KEY, cdn.get_bundle_surrogate_key(app_record.bundle_id))
+
+
+def apply_app_record(build_info: BuildInfo, app_record: Optional[AppRecord]) -> BuildInfo:
+    if app_record is None:
+        return build_info
+
+    return build_info.model_copy(update={
+        "app_title": app_record.app_title,
+        "app_description": app_record.app_description,
+        "app_picture_url": app_record.app_picture_url,
+    })
+
+
+async def list_apps() -> list[Union[BuildInfo, AppRecord]]:
+    """
+    One entry per bundle: its latest build with the app record applied, or the bare
+    app record for apps created from the admin pages that have no build yet.
+    """
+    app_records = {app_record.bundle_id: app_record for app_record in await list_app_records()}
+    bundle_ids = set(await asyncio.to_thread(list_indexed_bundle_ids)) | set(app_records)
+
+    async def load_app(bundle_id: str) -> Optional[Union[BuildInfo, AppRecord]]:
+        build_info = None
+        try:
+            upload_id = await asyncio.to_thread(get_latest_upload_id_by_bundle_id, bundle_id)
+            if upload_id:
+                build_info = await load_stored_build_info(upload_id)
+        except Exception as e:
+            logger.warning(f"Failed to load the latest build of {bundle_id!r}: {e}")
+
+        # The indexed build may have been deleted since
+        if build_info is None or build_info.bundle_id != bundle_id:
+            builds = await _list_stored_builds_by_bundle_id(bundle_id)
+            build_info = builds[0] if builds else None
+
+        if build_info is None:
+            return app_records.get(bundle_id)
+
+        return apply_app_record(build_info, app_records.get(bundle_id))
+
+    apps = await asyncio.gather(*(load_app(bundle_id) for bundle_id in bundle_ids))
+    return sorted((app for app in apps if app is not None), key=lambda app: app.app_title.casefold())
+
+
+async def migrate_placeholder_uploads():
+    """
+    Apps created from the admin pages used to be stored as a fake `dummy-<bundle_id>`
+    upload, they are turned into app records. Runs once, a marker file skips the scan afterwards.
+    """
+    marker_filepath = path.join(INDEXES_DIRECTORY, "placeholder_uploads_migrated")
+    if await asyncio.to_thread(filesystem.exists, marker_filepath):
+        return
+
+    placeholder_upload_ids = await asyncio.to_thread(
+        lambda: [upload_id for upload_id in list_upload_ids() if upload_id.startswith("dummy-")]
+    )
+
+    for upload_id in placeholder_upload_ids:
+        try:
+            build_info = await load_stored_build_info(upload_id)
+            if build_info.bundle_id != "unknown" and await load_app_record(build_info.bundle_id) is None:
+                await save_app_record(AppRecord(
+                    bundle_id=build_info.bundle_id,
+                    app_title=build_info.app_title,
+                    app_description=build_info.app_description,
+                    app_picture_url=build_info.app_picture_url,
+                ))
+            await delete_upload(upload_id)
+            logger.info(f"Migrated placeholder upload {upload_id!r} to an app record")
+        except Exception as e:
+            logger.warning(f"Failed to migrate placeholder upload {upload_id!r}: {e}")
+            return
+
+    await asyncio.to_thread(filesystem.makedirs, INDEXES_DIRECTORY, recreate=True)
+    await asyncio.to_thread(filesystem.writetext, marker_filepath, datetime.now(timezone.utc).isoformat())
+
+
+def check_storage_round_trip():
+    """Writes, reads back and removes a small file, raises when storage is not usable."""
+    probe_filepath = path.join(INDEXES_DIRECTORY, "readiness", f"{socket.gethostname()}-{os.getpid()}.txt")
+    token = os.urandom(8).hex()
+
+    filesystem.makedirs(path.dirname(probe_filepath), recreate=True)
+    filesystem.writetext(probe_filepath, token)
+    try:
+        if filesystem.readtext(probe_filepath) != token:
+            raise IOError(f"Read back unexpected content from {probe_filepath!r}")
+    finally:
+        filesystem.remove(probe_filepath)
+
+
+def prewarm_latest_builds_cache():
+    """Pull the latest build of every bundle into the local storage cache."""
+    if not isinstance(filesystem.resolve(), CachedFS):
+        return
+
+    for bundle_id in list_indexed_bundle_ids():
+        try:
+            upload_id = get_latest_upload_id_by_bundle_id(bundle_id)
+            platform = probe_upload_platform(upload_id) if upload_id else None
+            if platform is None:
+                continue
+
+            upload_directory = get_upload_directory(upload_id)
+            filesystem.prewarm(path.join(upload_directory, BUILD_INFO_JSON_FILE_NAME))
+            filesystem.prewarm(path.join(upload_directory, platform.app_file_name))
+            logger.info(f"Pre-warmed storage cache with {bundle_id!r} ({upload_id!r})")
+        except Exception as e:
+            logger.warning(f"Failed to pre-warm storage cache for {bundle_id!r}: {e}")
+
+
+def migrate_upload_to_sharded_layout(upload_id: str):
+    legacy_directory = upload_id
+    sharded_directory = get_sharded_upload_directory(upload_id)
+
+    if not filesystem.exists(path.join(legacy_directory, BUILD_INFO_JSON_FILE_NAME)):
+        migrate_legacy_app_info(upload_id)
+
+    filesystem.makedirs(sharded_directory, recreate=True)
+
+    # Copy everything else first: lookups switch over as soon as the build info exists
+    for entry in filesystem.scandir(legacy_directory):
+        if entry.name == BUILD_INFO_JSON_FILE_NAME:
+            continue
+
+        source_path = path.join(legacy_directory, entry.name)
+        destination_path = path.join(sharded_directory, entry.name)
+        if entry.is_dir:
+            filesystem.copydir(source_path, destination_path, create=True)
+        else:
+            filesystem.copy(source_path, destination_path, overwrite=True)
+
+    filesystem.copy(
+        path.join(legacy_directory, BUILD_INFO_JSON_FILE_NAME),
+        path.join(sharded_directory, BUILD_INFO_JSON_FILE_NAME),
+        overwrite=True,
+    )
+    remember_upload_directory(upload_id, sharded_directory)
+
+    filesystem.removetree(legacy_directory)
+
+
+def migrate_uploads_to_sharded_layout(batch_size: int = 50, pause_seconds: float = 1.0):
+    """
+    Moves uploads from the legacy flat layout into the sharded layout, one at a time.
+    Meant to run in the background: uploads stay readable during the whole migration.
+    """
+    legacy_upload_ids = [
+        entry_name
+        for entry_name in filesystem.listdir(".")
+        if entry_name != INDEXES_DIRECTORY and not SHARD_DIRECTORY_NAME_PATTERN.match(entry_name)
+    ]
+    logger.info(f"Migrating {len(legacy_upload_ids)} uploads to the sharded storage layout")
+
+    migrated_count = 0
+    for index, upload_id in enumerate(legacy_upload_ids, start=1):
+        try:
+            migrate_upload_to_sharded_layout(upload_id)
+            migrated_count += 1
+        except Exception as e:
+            logger.warning(f"Failed to migrate upload {upload_id!r} to the sharded layout: {e}")
+
+        if index % batch_size == 0:
+            logger.info(f"Sharded layout migration progress: {index}/{len(legacy_upload_ids)}")
+            time.sleep(pause_seconds)
+
+    logger.info(f"Migrated {migrated_count} uploads to the sharded storage layout")
+
+
+def get_pinned_uploads_filepath():
+    return path.join(INDEXES_DIRECTORY, "pinned_uploads.json")
+
+
+def load_pinned_upload_ids() -> set[str]:
+    filepath = get_pinned_uploads_filepath()
+    if not filesystem.exists(filepath):
+        return set()
+
+    with filesystem.open(filepath, "r") as file:
+        return set(json.load(file))
+
+
+def set_upload_pinned(upload_id: str, pinned: bool):
+    pinned_upload_ids = load_pinned_upload_ids()
+
+    if pinned:
+        pinned_upload_ids.add(upload_id)
+    else:
+        pinned_upload_ids.discard(upload_id)
+
+    filesystem.makedirs(INDEXES_DIRECTORY, recreate=True)
+    with filesystem.open(get_pinned_uploads_filepath(), "w") as file:
+        json.dump(sorted(pinned_upload_ids), file, indent=2)
@@ -0,0 +1,303 @@
+"""
+Read-through local disk cache for remote storage backends.
+
+`CachedFS` wraps any PyFilesystem (typically `s3://`) and keeps a bounded, LRU
+evicted copy of the files it reads on the local disk. App binaries never change
+once uploaded, so they are cached until evicted; every other file (build info,
+indexes) is refetched after a short TTL so edits made by other nodes show up.
+Concurrent misses for the same file share a single download.
+"""
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from hashlib import sha256
+from typing import Optional
+
+from fs.base import FS
+from fs.mode import Mode
+from fs.path import abspath, normpath
+from fs.wrapfs import WrapFS
+
+from app_distribution_server.logger import logger
+
+IMMUTABLE_FILE_EXTENSIONS = (".ipa", ".apk", ".apkdelta")
+
+
+PROCESS_DIRECTORY_PREFIX = "process-"
+
+
+def _is_process_running(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _remove_exited_process_directories(cache_directory: str):
+    """Leftovers of processes that exited, nothing tracks their entries anymore."""
+    for name in os.listdir(cache_directory):
+        pid = name.removeprefix(PROCESS_DIRECTORY_PREFIX)
+        if name.startswith(PROCESS_DIRECTORY_PREFIX) and pid.isdigit() and not _is_process_running(int(pid)):
+            shutil.rmtree(os.path.join(cache_directory, name), ignore_errors=True)
+
+
+@dataclass
+class _CacheEntry:
+    local_path: str
+    size: int
+    fetched_at: float
+
+
+class CachedFS(WrapFS):
+    def __init__(
+        self,
+        remote_fs: FS,
+        cache_directory: str,
+        max_bytes: int,
+        mutable_ttl_seconds: float,
+    ):
+        super().__init__(remote_fs)
+
+        # Entries are only tracked in memory by the process that fetched them, so each process gets its
+        # own directory: workers sharing the cache directory never remove files another one is serving
+        os.makedirs(cache_directory, exist_ok=True)
+        _remove_exited_process_directories(cache_directory)
+        self.cache_directory = os.path.join(cache_directory, f"{PROCESS_DIRECTORY_PREFIX}{os.getpid()}")
+        self.max_bytes = max_bytes
+        self.mutable_ttl_seconds = mutable_ttl_seconds
+
+        self._entries: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        self._cached_bytes = 0
+        self._lock = threading.Lock()
+        self._fetch_locks: dict[str, threading.Lock] = {}
+
+        shutil.rmtree(self.cache_directory, ignore_errors=True)
+        os.makedirs(self.cache_directory)
+
+    def __repr__(self):
+        return f"CachedFS({self._wrap_fs!r}, {self.cache_directory!r})"
+
+    @staticmethod
+    def _key(path: str) -> str:
+        return abspath(normpath(path))
+
+    def _is_fresh(self, key: str, entry: _CacheEntry) -> bool:
+        if key.endswith(IMMUTABLE_FILE_EXTENSIONS):
+            return True
+
+        return time.monotonic() - entry.fetched_at < self.mutable_ttl_seconds
+
+    def _get_fresh_entry(self, key: str) -> Optional[_CacheEntry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            if not self._is_fresh(key, entry):
+                self._discard(key)
+                return None
+
+            self._entries.move_to_end(key)
+            return entry
+
+    def _discard(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+
+        self._cached_bytes -= entry.size
+        try:
+            os.remove(entry.local_path)
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        while self._cached_bytes > self.max_bytes and self._entries:
+            key = next(iter(self._entries))
+            logger.debug(f"Evicting {key!r} from the storage cache")
+            self._discard(key)
+
+    def invalidate(self, path: str):
+        key = self._key(path)
+        with self._lock:
+            self._discard(key)
+
+    def invalidate_tree(self, path: str):
+        prefix = self._key(path).rstrip("/") + "/"
+        with self._lock:
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                self._discard(key)
+
+    def _fetch(self, key: str) -> Optional[_CacheEntry]:
+        with self._lock:
+            fetch_lock = self._fetch_locks.setdefault(key, threading.Lock())
+
+        # Only one thread downloads a given file, the others wait and reuse its result
+        with fetch_lock:
+            try:
+                return self._get_fresh_entry(key) or self._download(key)
+            finally:
+                with self._lock:
+                    # A waiter may finish after a newer lock replaced this one
+                    if self._fetch_locks.get(key) is fetch_lock:
+                        del self._fetch_locks[key]
+
+    def _download(self, key: str) -> Optional[_CacheEntry]:
+        with self._lock:
+            # Drop the stale copy first, the new one is written to the same local path
+            self._discard(key)
+
+        size = self._wrap_fs.getsize(key)
+        if size > self.max_bytes:
+            return None
+
+        local_path = os.path.join(
+            self.cache_directory,
+            sha256(key.encode("utf-8")).hexdigest(),
+        )
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=self.cache_directory)
+        try:
+            with os.fdopen(file_descriptor, "wb") as local_file:
+                self._wrap_fs.download(key, local_file)
+            os.replace(temporary_path, local_path)
+        except BaseException:
+            os.remove(temporary_path)
+            raise
+
+        entry = _CacheEntry(
+            local_path=local_path,
+            size=os.path.getsize(local_path),
+            fetched_at=time.monotonic(),
+        )
+        with self._lock:
+            self._entries[key] = entry
+            self._cached_bytes += entry.size
+            self._evict()
+
+        return entry
+
+    def _get_local_path(self, path: str) -> Optional[str]:
+        key = self._key(path)
+        entry = self._get_fresh_entry(key) or self._fetch(key)
+        return entry.local_path if entry else None
+
+    def prewarm(self, path: str):
+        self._get_local_path(path)
+
+    def get_cached_path(self, path: str) -> Optional[str]:
+        """Local copy of a file when it is already cached, without fetching it."""
+        entry = self._get_fresh_entry(self._key(path))
+        return entry.local_path if entry else None
+
+    def openbin(self, path, mode="r", buffering=-1, **options):
+        if Mode(mode).writing:
+            self.invalidate(path)
+            return super().openbin(path, mode=mode, buffering=buffering, **options)
+
+        local_path = self._get_local_path(path)
+        if local_path is None:
+            return super().openbin(path, mode=mode, buffering=buffering, **options)
+
+        try:
+            return open(local_path, "rb", buffering=buffering)
+        except FileNotFoundError:
+            # Evicted between lookup and open
+            return super().openbin(path, mode=mode, buffering=buffering, **options)
+
+    def open(
+        self,
+        path,
+        mode="r",
+        buffering=-1,
+        encoding=None,
+        errors=None,
+        newline="",
+        line_buffering=False,
+        **options,
+    ):
+        if Mode(mode).writing:
+            self.invalidate(path)
+            return super().open(
+                path,
+                mode=mode,
+                buffering=buffering,
+                encoding=encoding,
+                errors=errors,
+                newline=newline,
+                line_buffering=line_buffering,
+                **options,
+            )
+
+        if "b" in mode:
+            return self.openbin(path, mode=mode, buffering=buffering, **options)
+
+        local_path = self._get_local_path(path)
+        if local_path is None:
+            return super().open(path, mode=mode, encoding=encoding, errors=errors, newline=newline)
+
+        try:
+            return open(local_path, "r", encoding=encoding or "utf-8", errors=errors, newline=newline)
+        except FileNotFoundError:
+            # Evicted between lookup and open
+            return super().open(path, mode=mode, encoding=encoding, errors=errors, newline=newline)
+
+    def readbytes(self, path):
+        with self.openbin(path) as file:
+            return file.read()
+
+    def readtext(self, path, encoding=None, errors=None, newline=""):
+        with self.open(path, "r", encoding=encoding, errors=errors, newline=newline) as file:
+            return file.read()
+
+    def writebytes(self, path, contents):
+        self.invalidate(path)
+        return super().writebytes(path, contents)
+
+    def writefile(self, path, file, encoding=None, errors=None, newline=""):
+        self.invalidate(path)
+        return super().writefile(path, file, encoding=encoding, errors=errors, newline=newline)
+
+    def upload(self, path, file, chunk_size=None, **options):
+        self.invalidate(path)
+        return super().upload(path, file, chunk_size=chunk_size, **options)
+
+    def appendbytes(self, path, data):
+        self.invalidate(path)
+        return super().appendbytes(path, data)
+
+    def appendtext(self, path, text, encoding="utf-8", errors=None, newline=""):
+        self.invalidate(path)
+        return super().appendtext(path, text, encoding=encoding, errors=errors, newline=newline)
+
+    def copy(self, src_path, dst_path, overwrite=False, preserve_time=False):
+        self.invalidate(dst_path)
+        return super().copy(src_path, dst_path, overwrite=overwrite, preserve_time=preserve_time)
+
+    def move(self, src_path, dst_path, overwrite=False, preserve_time=False):
+        self.invalidate(src_path)
+        self.invalidate(dst_path)
+        return super().move(src_path, dst_path, overwrite=overwrite, preserve_time=preserve_time)
+
+    def remove(self, path):
+        self.invalidate(path)
+        return super().remove(path)
+
+    def removetree(self, dir_path):
+        self.invalidate_tree(dir_path)
+        return super().removetree(dir_path)
+
+    def copydir(self, src_path, dst_path, create=False, preserve_time=False):
+        self.invalidate_tree(dst_path)
+        return super().copydir(src_path, dst_path, create=create, preserve_time=preserve_time)
+
+    def movedir(self, src_path, dst_path, create=False, preserve_time=False):
+        self.invalidate_tree(src_path)
+        self.invalidate_tree(dst_path)
+        return super().movedir(src_path, dst_path, create=create, preserve_time=preserve_time)
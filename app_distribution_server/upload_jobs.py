@@ -0,0 +1,179 @@
+"""
+Background processing of app uploads.
+
+Uploads submitted in async mode are spooled to disk and handed to a bounded pool
+of workers, so the HTTP request can return as soon as the file is received.
+Job state is kept in memory: status must be polled on the same server process.
+"""
+import asyncio
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta, timezone
+from enum import Enum
+from typing import Awaitable, BinaryIO, Callable, Optional
+from uuid import uuid4
+
+from fastapi import HTTPException
+from pydantic import BaseModel
+
+from app_distribution_server.build_info import BuildInfo, Platform
+from app_distribution_server.config import (
+    UPLOAD_JOBS_CONCURRENCY,
+    UPLOAD_JOBS_RETENTION_SECONDS,
+    UPLOAD_JOBS_SPOOL_DIRECTORY,
+)
+from app_distribution_server.errors import InternalServerError
+from app_distribution_server.logger import logger
+
+UploadProcessor = Callable[[Platform, bytes], Awaitable[BuildInfo]]
+
+
+class UploadJobStatus(str, Enum):
+    queued = "queued"
+    processing = "processing"
+    succeeded = "succeeded"
+    failed = "failed"
+
+
+class UploadJob(BaseModel):
+    job_id: str
+    status: UploadJobStatus
+    file_name: str
+    platform: Platform
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+    build_info: Optional[BuildInfo] = None
+    error: Optional[str] = None
+
+
+_jobs: dict[str, UploadJob] = {}
+_spooled_files: dict[str, str] = {}
+_queue: Optional[asyncio.Queue] = None
+_workers: list[asyncio.Task] = []
+
+
+def _spool_file(file: BinaryIO) -> str:
+    file_descriptor, spool_path = tempfile.mkstemp(
+        prefix="upload-",
+        dir=UPLOAD_JOBS_SPOOL_DIRECTORY,
+    )
+    with os.fdopen(file_descriptor, "wb") as spool_file:
+        shutil.copyfileobj(file, spool_file)
+
+    return spool_path
+
+
+def _read_spooled_file(spool_path: str) -> bytes:
+    with open(spool_path, "rb") as spool_file:
+        return spool_file.read()
+
+
+def _remove_spooled_file(job_id: str):
+    spool_path = _spooled_files.pop(job_id, None)
+    if spool_path is None:
+        return
+
+    try:
+        os.remove(spool_path)
+    except FileNotFoundError:
+        pass
+
+
+def _prune_finished_jobs():
+    expiry = datetime.now(timezone.utc) - timedelta(seconds=UPLOAD_JOBS_RETENTION_SECONDS)
+
+    for job_id, job in list(_jobs.items()):
+        if job.finished_at is not None and job.finished_at < expiry:
+            del _jobs[job_id]
+
+
+async def _run_job(job: UploadJob, processor: UploadProcessor):
+    job.status = UploadJobStatus.processing
+    logger.info(f"Processing upload job {job.job_id!r} ({job.file_name!r})")
+
+    try:
+        app_file_content = await asyncio.to_thread(
+            _read_spooled_file,
+            _spooled_files[job.job_id],
+        )
+        job.build_info = await processor(job.platform, app_file_content)
+        job.status = UploadJobStatus.succeeded
+        logger.info(f"Upload job {job.job_id!r} succeeded ({job.build_info.upload_id!r})")
+
+    except HTTPException as exception:
+        job.status = UploadJobStatus.failed
+        job.error = exception.detail
+        logger.warning(f"Upload job {job.job_id!r} failed: {exception.detail}")
+
+    except Exception:
+        job.status = UploadJobStatus.failed
+        job.error = InternalServerError.ERROR_MESSAGE
+        logger.exception(f"Upload job {job.job_id!r} failed unexpectedly")
+
+    finally:
+        job.finished_at = datetime.now(timezone.utc)
+        _remove_spooled_file(job.job_id)
+
+
+async def _worker(queue: asyncio.Queue):
+    while True:
+        job, processor = await queue.get()
+        try:
+            await _run_job(job, processor)
+        finally:
+            queue.task_done()
+
+
+def _get_queue() -> asyncio.Queue:
+    global _queue
+
+    if _queue is None:
+        _queue = asyncio.Queue()
+
+    # Workers are (re)started lazily so they are bound to the running event loop
+    _workers[:] = [worker for worker in _workers if not worker.done()]
+    for _ in range(max(UPLOAD_JOBS_CONCURRENCY, 1) - len(_workers)):
+        _workers.append(asyncio.create_task(_worker(_queue)))
+
+    return _queue
+
+
+async def submit_upload_job(
+    file_name: str,
+    platform: Platform,
+    file: BinaryIO,
+    processor: UploadProcessor,
+) -> UploadJob:
+    _prune_finished_jobs()
+
+    job = UploadJob(
+        job_id=str(uuid4()),
+        status=UploadJobStatus.queued,
+        file_name=file_name,
+        platform=platform,
+        created_at=datetime.now(timezone.utc),
+    )
+
+    _spooled_files[job.job_id] = await asyncio.to_thread(_spool_file, file)
+    _jobs[job.job_id] = job
+
+    await _get_queue().put((job, processor))
+    logger.info(f"Queued upload job {job.job_id!r} ({file_name!r})")
+
+    return job
+
+
+def get_upload_job(job_id: str) -> Optional[UploadJob]:
+    return _jobs.get(job_id)
+
+
+async def stop_upload_workers():
+    for worker in _workers:
+        worker.cancel()
+
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+
+    for job_id in list(_spooled_files):
+        _remove_spooled_file(job_id)
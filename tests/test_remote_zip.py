@@ -0,0 +1,39 @@
+import io
+import os
+import zipfile
+
+import pytest
+
+from app_distribution_server.remote_zip import RangedReader
+
+
+def make_reader(content: bytes, block_size: int) -> RangedReader:
+    return RangedReader(lambda start, end: content[start:end], len(content), block_size=block_size)
+
+
+def make_apk(large_entry_size: int) -> bytes:
+    output = io.BytesIO()
+    with zipfile.ZipFile(output, "w") as apk_zip:
+        apk_zip.writestr("AndroidManifest.xml", b"manifest" * 100, compress_type=zipfile.ZIP_DEFLATED)
+        # Stored right before the central directory, whose blocks are cached when the zip is opened
+        apk_zip.writestr("resources.arsc", os.urandom(large_entry_size), compress_type=zipfile.ZIP_STORED)
+    return output.getvalue()
+
+
+def test_large_entry_next_to_cached_blocks():
+    content = make_apk(5 * 1024 * 1024)
+    reader = make_reader(content, 64 * 1024)
+
+    with zipfile.ZipFile(reader) as apk_zip, zipfile.ZipFile(io.BytesIO(content)) as expected_zip:
+        assert apk_zip.read("resources.arsc") == expected_zip.read("resources.arsc")
+        assert apk_zip.read("AndroidManifest.xml") == expected_zip.read("AndroidManifest.xml")
+
+
+@pytest.mark.parametrize("block_size", [1, 7, 4096])
+def test_small_blocks(block_size):
+    content = make_apk(20 * 1024)
+    reader = make_reader(content, block_size)
+
+    with zipfile.ZipFile(reader) as apk_zip, zipfile.ZipFile(io.BytesIO(content)) as expected_zip:
+        for file_name in expected_zip.namelist():
+            assert apk_zip.read(file_name) == expected_zip.read(file_name)